@@ -48,8 +48,30 @@ if "bpy" in locals():
         importlib.reload(sur_utils)
     if "blender_utils" in locals():
         importlib.reload(blender_utils)
+    if "mesh_utils" in locals():
+        importlib.reload(mesh_utils)
+    if "decimate_utils" in locals():
+        importlib.reload(decimate_utils)
+    if "kdtree_utils" in locals():
+        importlib.reload(kdtree_utils)
+    if "compare_utils" in locals():
+        importlib.reload(compare_utils)
+    if "sequence_utils" in locals():
+        importlib.reload(sequence_utils)
+    if "container_utils" in locals():
+        importlib.reload(container_utils)
+    if "loader_utils" in locals():
+        importlib.reload(loader_utils)
+    if "bvh_utils" in locals():
+        importlib.reload(bvh_utils)
+    if "plan_utils" in locals():
+        importlib.reload(plan_utils)
+    if "thumbnail_utils" in locals():
+        importlib.reload(thumbnail_utils)
 
 import os
+import math
+import functools
 
 import bpy
 from bpy.props import (
@@ -58,6 +80,7 @@ from bpy.props import (
         CollectionProperty,
         EnumProperty,
         FloatProperty,
+        IntProperty,
         )
 from bpy_extras.io_utils import (
         ImportHelper,
@@ -68,6 +91,7 @@ from bpy_extras.io_utils import (
 from bpy.types import (
         Operator,
         OperatorFileListElement,
+        Panel,
         )
 
 
@@ -82,7 +106,7 @@ class ImportSUR(Operator, ImportHelper):
     filename_ext = ".sur"
 
     filter_glob: StringProperty(
-            default="*.sur",
+            default="*.sur;*.surs",
             options={'HIDDEN'},
             )
 
@@ -114,9 +138,113 @@ class ImportSUR(Operator, ImportHelper):
             default=False,
             )
 
+    use_smooth_normals: BoolProperty(
+            name="Smooth Normals",
+            description="Compute area weighted vertex normals, split at the edges sharper "
+                        "than the feature angle, as custom normals",
+            default=False,
+            )
+
+    feature_angle: FloatProperty(
+            name="Feature Angle",
+            description="Edges with a larger angle between their faces stay sharp",
+            subtype='ANGLE',
+            min=0.0, max=math.pi,
+            default=math.radians(30.0),
+            )
+
+    use_tiles: BoolProperty(
+            name="Split in Tiles",
+            description="Split each mesh into one object per tile of a uniform grid, parented "
+                        "to an empty (editing or hiding a tile only costs its own size)",
+            default=False,
+            )
+
+    tile_divisions: IntProperty(
+            name="Tiles",
+            description="Number of tiles along the largest dimension",
+            min=1, max=256,
+            default=8,
+            )
+
+    tile_mode: EnumProperty(
+            name="Tiling",
+            items=(('XY', "Columns", "Square tiles over the X and Y axes"),
+                   ('XYZ', "Cubes", "Cubic tiles"),
+                   ))
+
+    use_shared_mesh: BoolProperty(
+            name="Share Duplicate Meshes",
+            description="Reuse one mesh datablock for files with identical geometry "
+                        "(duplicates become linked objects)",
+            default=True,
+            )
+
+    use_morton_order: BoolProperty(
+            name="Spatial Vertex Order",
+            description="Reorder vertices along a Z-order (Morton) curve to improve "
+                        "cache locality of per-vertex operations",
+            default=False,
+            )
+
+    use_sequence: BoolProperty(
+            name="Sequence",
+            description="Import the numbered files (name_0001.sur, ...) of each selected "
+                        "sequence as one object whose geometry follows the current frame",
+            default=False,
+            )
+
+    compare_path: StringProperty(
+            name="Compare With",
+            description="Reference SUR file: the distance of each imported vertex to the "
+                        "nearest reference vertex is stored in the \"sur_error\" attribute",
+            subtype='FILE_PATH',
+            default="",
+            )
+
+    use_bvh: BoolProperty(
+            name="BVH Sidecar",
+            description="Save a BVH of each file next to it (file.sur.bvh) for ray and nearest "
+                        "point queries, an up to date one is reused",
+            default=False,
+            )
+
+    use_recenter: BoolProperty(
+            name="Recenter",
+            description="Read the coordinates in double precision and move the center of the "
+                        "first file to the origin, keeping the precision of coordinates far "
+                        "from the origin. The offset is stored in the \"sur_offset\" "
+                        "property of the objects and added back on export",
+            default=False,
+            )
+
+    use_memory_plan: BoolProperty(
+            name="Memory Planning",
+            description="Estimate the memory needed by each file before reading it, and read "
+                        "it in chunks or as a simplified proxy when it would not fit (the "
+                        "import is refused when nothing fits)",
+            default=True,
+            )
+
+    memory_budget: IntProperty(
+            name="Memory Budget (MB)",
+            description="Memory the import may use, 0 for the memory currently available",
+            min=0,
+            default=0,
+            )
+
+    use_background: BoolProperty(
+            name="Background",
+            description="Read the files on a worker thread, showing the progress in the "
+                        "status bar (Esc cancels), only the meshes are created at the end",
+            default=False,
+            )
+
     def execute(self, context):
-        from . import sur_utils
         from . import blender_utils
+        from . import loader_utils
+        from . import plan_utils
+        from . import sequence_utils
         from mathutils import Matrix
 
         paths = [os.path.join(self.directory, name.name) for name in self.files]
@@ -141,14 +269,200 @@ class ImportSUR(Operator, ImportHelper):
         if bpy.ops.object.select_all.poll():
             bpy.ops.object.select_all(action='DESELECT')
 
-        for path in paths:
-            objName = bpy.path.display_name(os.path.basename(path))
-            verts, faces, norms = sur_utils.read_sur(path)
-            norms = norms if self.use_facet_normal else None
-            blender_utils.create_and_link_mesh(objName, faces, norms, verts, global_matrix)
+        # animated containers always give a sequence object
+        sequences = [path for path in paths if path.lower().endswith(".surs")]
+        paths = [path for path in paths if path not in sequences]
+        if self.use_sequence and paths:
+            # one object per sequence the selected files belong to
+            found = set()
+            for path in paths:
+                if os.path.normpath(path) not in found:
+                    found.update(os.path.normpath(frame_path)
+                                 for frame, frame_path in sequence_utils.find_sequence(path))
+                    sequences.append(path)
+            paths = []
+
+        try:
+            for path in sequences:
+                blender_utils.create_sequence_object(path, global_matrix)
+        except (OSError, ValueError) as error:
+            self.report({'ERROR'}, "SUR import failed: %s" % error)
+            return {'CANCELLED'}
+
+        if not paths:
+            return {'FINISHED'}
+
+        plans = None
+        if self.use_memory_plan and paths:
+            budget = self.memory_budget * 1024 * 1024 or None
+            try:
+                plans = plan_utils.plan_import(
+                        paths, budget,
+                        use_morton_order=self.use_morton_order,
+                        use_smooth_normals=self.use_smooth_normals,
+                        use_tiles=self.use_tiles,
+                        use_compare=bool(self.compare_path),
+                        use_double=self.use_recenter)
+            except (OSError, ValueError) as error:
+                self.report({'ERROR'}, "SUR import failed: %s" % error)
+                return {'CANCELLED'}
+
+            text = plan_utils.report(plans, budget or plan_utils.available_memory())
+            if any(plan.strategy is None for plan in plans):
+                self.report({'ERROR'}, "SUR import does not fit in memory:\n" + text)
+                return {'CANCELLED'}
+            if any(plan.strategy == 'PROXY' for plan in plans):
+                self.report({'WARNING'}, "SUR import reduced to fit in memory:\n" + text)
+            else:
+                self.report({'INFO'}, "SUR import plan:\n" + text)
+
+        loader = loader_utils.SurLoader(
+                paths,
+                matrix=[list(row) for row in global_matrix],
+                use_facet_normal=self.use_facet_normal,
+                use_shared_mesh=self.use_shared_mesh,
+                use_morton_order=self.use_morton_order,
+                compare_path=bpy.path.abspath(self.compare_path) if self.compare_path else "",
+                feature_angle=self.feature_angle if self.use_smooth_normals else None,
+                tile_divisions=self.tile_divisions if self.use_tiles else 0,
+                tile_axes=2 if self.tile_mode == 'XY' else 3,
+                use_bvh=self.use_bvh,
+                plans=plans,
+                use_recenter=self.use_recenter,
+                )
+
+        if self.use_background and context.window is not None:
+            self._loader = loader
+            wm = context.window_manager
+            wm.progress_begin(0, 100)
+            self._timer = wm.event_timer_add(0.1, window=context.window)
+            wm.modal_handler_add(self)
+            loader.start()
+            return {'RUNNING_MODAL'}
+
+        try:
+            records = loader.run()
+        except (OSError, ValueError) as error:
+            self.report({'ERROR'}, "SUR import failed: %s" % error)
+            return {'CANCELLED'}
+
+        self.create_objects(records)
+
+        return {'FINISHED'}
+
+    def modal(self, context, event):
+        loader = self._loader
+
+        if event.type == 'ESC':
+            loader.cancel()
+            self.end_background(context)
+            self.report({'WARNING'}, "SUR import cancelled")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        if not loader.done:
+            context.window_manager.progress_update(int(100 * loader.progress))
+            context.workspace.status_text_set("Importing %s: %d%% (Esc to cancel)" % (
+                    os.path.basename(loader.current or ""), 100 * loader.progress))
+            return {'PASS_THROUGH'}
+
+        self.end_background(context)
+        try:
+            records = loader.result()
+        except Exception as error:
+            self.report({'ERROR'}, "SUR import failed: %s" % error)
+            return {'CANCELLED'}
+
+        self.create_objects(records)
 
         return {'FINISHED'}
 
+    def create_tiles(self, name, record, shared=None):
+        """
+        Create an empty called name with one child object per tile of the
+        record, or per mesh of the *shared* [(cell, mesh), ...] tiles.
+
+        Returns the [(cell, mesh), ...] of the tiles.
+        """
+        from . import blender_utils
+        import numpy as np
+
+        parent = blender_utils.link_empty_object(name)
+        self.set_offset(parent, record)
+        tiles = []
+
+        def tile_name(cell):
+            return "%s_%s" % (name, "_".join(map(str, cell)))
+
+        def link(cell, obj):
+            obj.parent = parent
+            self.set_offset(obj, record)
+            tiles.append((cell, obj.data))
+
+        if shared is not None:
+            for cell, mesh in shared:
+                link(cell, blender_utils.link_mesh_object(tile_name(cell), mesh))
+            return tiles
+
+        loop_normals = record.loop_normals
+        if loop_normals is not None:
+            loop_normals = loop_normals.reshape(-1, 3, 3)
+        norms = record.norms if record.norms is not None and len(record.norms) else None
+
+        for cell, vertex_indices, faces, face_indices in record.tiles:
+            obj = blender_utils.create_and_link_mesh(
+                    tile_name(cell), faces,
+                    None if norms is None else np.asarray(norms)[face_indices],
+                    record.verts[vertex_indices], None, None,
+                    None if loop_normals is None else loop_normals[face_indices].reshape(-1, 3))
+            if record.error is not None:
+                blender_utils.set_vertex_attribute(obj, "sur_error", record.error[vertex_indices])
+            link(cell, obj)
+
+        return tiles
+
+    @staticmethod
+    def set_offset(obj, record):
+        # the recentering offset, added back by the export
+        if record.offset is not None:
+            obj["sur_offset"] = [float(c) for c in record.offset]
+
+    def end_background(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+    def create_objects(self, records):
+        from . import blender_utils
+
+        # meshes already created during this import, keyed by geometry fingerprint
+        meshes = {}
+
+        for record in records:
+            objName = bpy.path.display_name(os.path.basename(record.path))
+            mesh = meshes.get(record.key) if record.duplicate else None
+
+            # tiled meshes are shared as their list of tile meshes
+            if record.tiles is not None or isinstance(mesh, list):
+                tiles = self.create_tiles(objName, record, mesh)
+                if record.key is not None:
+                    meshes.setdefault(record.key, tiles)
+                continue
+
+            # the loader already transformed the geometry
+            obj = blender_utils.create_and_link_mesh(objName, record.faces, record.norms,
+                                                     record.verts, None, mesh, record.loop_normals)
+
+            if record.error is not None:
+                blender_utils.set_vertex_attribute(obj, "sur_error", record.error)
+            self.set_offset(obj, record)
+
+            if record.key is not None:
+                meshes.setdefault(record.key, obj.data)
+
 
 @orientation_helper(axis_forward='Y', axis_up='Z')
 class ExportSUR(Operator, ExportHelper):
@@ -189,15 +503,88 @@ class ExportSUR(Operator, ExportHelper):
                    ('OBJECT', "Object", "Each object as a file"),
                    ))
 
+    use_compact: BoolProperty(
+            name="Remove Loose Vertices",
+            description="Do not save the vertices which are not used by any triangle",
+            default=False,
+            )
+
+    use_weld: BoolProperty(
+            name="Weld Objects",
+            description="Merge the vertices at exactly the same position, across objects "
+                        "(when saving all data in one file)",
+            default=False,
+            )
+
+    use_decimate: BoolProperty(
+            name="Decimate",
+            description="Reduce the triangle count of each saved file with quadric error "
+                        "edge collapses (without going through the modifier stack)",
+            default=False,
+            )
+
+    decimate_target: IntProperty(
+            name="Target Triangles",
+            description="Maximum number of triangles in each saved file",
+            min=4,
+            default=500000,
+            )
+
+    compression: EnumProperty(
+            name="Compression",
+            description="Encoding of the saved SUR files (compressed files are recognized "
+                        "by the importer whatever their extension)",
+            items=(('NONE', "None", "Text SUR"),
+                   ('ZLIB', "Zlib", "Quantized binary SUR compressed with zlib"),
+                   ('LZMA', "LZMA", "Quantized binary SUR compressed with LZMA "
+                                    "(smaller, slower to write)"),
+                   ))
+
+    quantize_bits: IntProperty(
+            name="Position Bits",
+            description="Bits per axis of the compressed positions, quantized over the "
+                        "bounding box of each file",
+            min=8, max=32,
+            default=16,
+            )
+
+    use_animation: BoolProperty(
+            name="Animation",
+            description="Write one file per frame of the scene frame range "
+                        "(name_0001.sur, name_0002.sur, ...)",
+            default=False,
+            )
+
+    animation_format: EnumProperty(
+            name="Animation Format",
+            items=(('FILES', "SUR Files", "One SUR file per frame"),
+                   ('CONTAINER', "Container", "One binary .surs file storing the triangles once "
+                                              "and the quantized position changes of each frame"),
+                   ))
+
+    precision: FloatProperty(
+            name="Precision",
+            description="Quantization step of the positions stored in a container",
+            min=1e-9, soft_min=1e-6, soft_max=0.1,
+            default=1e-4,
+            precision=6,
+            )
+
+    use_constant_topology: BoolProperty(
+            name="Constant Topology",
+            description="Only extract the triangles again when the vertex, face or loop "
+                        "count changes (disable for modifiers reconnecting the same vertices)",
+            default=True,
+            )
+
     @property
     def check_extension(self):
         return self.batch_mode == 'OFF'
 
     def execute(self, context):
-        from . import sur_utils
         from . import blender_utils
-        import itertools
         from mathutils import Matrix
+        import numpy as np
 
         scene = context.scene
         if self.use_selection:
@@ -214,24 +601,151 @@ class ExportSUR(Operator, ExportHelper):
                                         to_up=self.axis_up,
                                         ).to_4x4() @ Matrix.Scale(global_scale, 4)
 
-        if self.batch_mode == 'OFF':
-            print("self.filepath=", self.filepath)
-            filepath=self.filepath
-            verts, faces = itertools.chain.from_iterable(
-                    blender_utils.faces_from_mesh(ob, global_matrix, self.use_mesh_modifiers)
-                    for ob in objects)
+        if self.use_animation:
+            return self.execute_animation(context, objects, global_matrix)
 
-            sur_utils.write_sur(filepath=filepath, faces=faces, verts=verts)
+        if self.batch_mode == 'OFF':
+            def acquire(size):
+                return np.empty(size, dtype=np.float32)
+
+            offsets = []
+            coords, faces, topology = blender_utils.frame_arrays(
+                    objects, global_matrix, self.use_mesh_modifiers, acquire, offsets=offsets)
+            coords = blender_utils.apply_offsets(coords.reshape(-1, 3), topology, offsets,
+                                                 global_matrix)
+            self.write(self.filepath, coords, faces)
         elif self.batch_mode == 'OBJECT':
             prefix = os.path.splitext(self.filepath)[0]
-            print("prefix=", prefix)
 
             for ob in objects:
-                faces = blender_utils.faces_from_mesh(ob, global_matrix, self.use_mesh_modifiers)
-                sur_utils.write_sur(faces=faces, verts=verts)
+                data = blender_utils.faces_from_mesh(ob, global_matrix, self.use_mesh_modifiers)
+                if data:
+                    filepath = prefix + bpy.path.clean_name(ob.name) + ".sur"
+                    self.write(filepath, *data)
+
+        return {'FINISHED'}
+
+    def execute_animation(self, context, objects, global_matrix):
+        from . import blender_utils
+        from . import sequence_utils
+
+        if self.use_decimate or self.use_compact or self.use_weld:
+            self.report({'WARNING'}, "Decimation and vertex clean up are not applied to animations")
+
+        prefix = os.path.splitext(self.filepath)[0]
+        if self.batch_mode == 'OBJECT':
+            outputs = [(prefix + bpy.path.clean_name(ob.name), [ob]) for ob in objects]
+        else:
+            outputs = [(prefix, list(objects))]
+
+        # (faces, topology) of each output, kept while the topology does not change
+        topologies = [(None, None)] * len(outputs)
+
+        scene = context.scene
+        frame_current = scene.frame_current
+
+        # containers are written one per output, files through a shared pool
+        use_container = self.animation_format == 'CONTAINER'
+        sinks = []
+        failure = None
+        try:
+            if use_container:
+                from . import container_utils
+                for output, obs in outputs:
+                    sinks.append(container_utils.ContainerWriter(output + ".surs", self.precision,
+                                                                 scene.frame_start))
+            else:
+                sinks.append(sequence_utils.SequenceWriter(write=self.file_writer()))
+
+            for frame in range(scene.frame_start, scene.frame_end + 1):
+                scene.frame_set(frame)
+                for index, (output, obs) in enumerate(outputs):
+                    sink = sinks[index if use_container else 0]
+                    faces, topology = topologies[index]
+                    if not self.use_constant_topology:
+                        faces = None
+                    offsets = []
+                    coords, faces, topology = blender_utils.frame_arrays(
+                        obs, global_matrix, self.use_mesh_modifiers, sink.acquire, faces, topology,
+                        offsets)
+                    topologies[index] = (faces, topology)
+                    # float64 when recentered objects have their offset added back
+                    coords = blender_utils.apply_offsets(coords.reshape(-1, 3), topology, offsets,
+                                                         global_matrix)
+                    if use_container:
+                        sink.add_frame(coords, faces)
+                    else:
+                        sink.submit(sequence_utils.frame_path(output, frame), coords, faces)
+        except (OSError, ValueError) as error:
+            failure = error
+        finally:
+            # a failing close must not hide the first error
+            for sink in sinks:
+                try:
+                    sink.close()
+                except (OSError, ValueError) as error:
+                    if failure is None:
+                        failure = error
+            scene.frame_set(frame_current)
+
+        if failure is not None:
+            self.report({'ERROR'}, "SUR export failed: %s" % failure)
+            return {'CANCELLED'}
 
         return {'FINISHED'}
 
+    def write(self, filepath, verts, faces):
+        if self.use_weld or self.use_compact:
+            from . import mesh_utils
+            if self.use_weld and self.batch_mode == 'OFF':
+                verts, faces = mesh_utils.weld_vertices(verts, faces)
+            if self.use_compact:
+                verts, faces = mesh_utils.compact_vertices(verts, faces)
+
+        if self.use_decimate:
+            from . import decimate_utils
+            verts, faces = decimate_utils.decimate(verts, faces, self.decimate_target)
+
+        self.file_writer()(filepath, verts, faces)
+
+    def file_writer(self):
+        """
+        Return the write(filepath, verts, faces) function of the chosen
+        encoding, safe to call from other threads.
+        """
+        from . import sur_utils
+
+        if self.compression == 'NONE':
+            return sur_utils.write_sur
+        return functools.partial(sur_utils.write_surz, bits=self.quantize_bits,
+                                 codec=self.compression)
+
+
+class SUR_PT_import_preview(Panel):
+    """Thumbnail of the selected SUR file"""
+    bl_space_type = 'FILE_BROWSER'
+    bl_region_type = 'TOOL_PROPS'
+    bl_label = "Preview"
+    bl_parent_id = "FILE_PT_operator"
+
+    @classmethod
+    def poll(cls, context):
+        operator = context.space_data.active_operator
+        return operator is not None and operator.bl_idname == "IMPORT_MESH_OT_sur"
+
+    def draw(self, context):
+        from . import blender_utils
+
+        filepath = context.space_data.active_operator.filepath
+        if not filepath.lower().endswith(".sur") or not os.path.isfile(filepath):
+            return
+
+        icon = blender_utils.sur_preview(filepath)
+        if icon:
+            self.layout.template_icon(icon_value=icon, scale=6.0)
+        else:
+            self.layout.label(text="Rendering preview...")
+
 
 def menu_import(self, context):
     self.layout.operator(ImportSUR.bl_idname, text="Sur (.sur)")
@@ -243,24 +757,35 @@ def menu_export(self, context):
 
 classes = (
     ImportSUR,
-    ExportSUR
+    ExportSUR,
+    SUR_PT_import_preview,
 )
 
 def register():
+    from . import blender_utils
+
     for cls in classes:
         bpy.utils.register_class(cls)
 
     bpy.types.TOPBAR_MT_file_import.append(menu_import)
     bpy.types.TOPBAR_MT_file_export.append(menu_export)
 
+    bpy.app.handlers.frame_change_pre.append(blender_utils.update_sequences)
+
 
 def unregister():
+    from . import blender_utils
+
     for cls in classes:
         bpy.utils.unregister_class(cls)
 
     bpy.types.TOPBAR_MT_file_import.remove(menu_import)
     bpy.types.TOPBAR_MT_file_export.remove(menu_export)
 
+    bpy.app.handlers.frame_change_pre.remove(blender_utils.update_sequences)
+    blender_utils.clear_sequences()
+    blender_utils.clear_previews()
+
 
 if __name__ == "__main__":
     register()
@@ -18,88 +18,458 @@
 
 # <pep8 compliant>
 
+import os
 import bpy
-import array
-from itertools import chain
+from bpy.app.handlers import persistent
 
-def create_and_link_mesh(name, faces, face_normals, points, global_matrix):
+def create_and_link_mesh(name, faces, face_normals=None, points=None, global_matrix=None,
+                         mesh=None, loop_normals=None):
     """
     Create a blender mesh and object called name from a list of
-    *points* and *faces* and link it in the current scene.
+    *points* and *faces* (or from the sur_utils.SurMesh *faces*) and link
+    it in the current scene.
+
+    If an existing *mesh* is given it is used as the object data instead
+    of building a new one (e.g. for geometry-identical duplicates).
+
+    Returns the newly created object.
+    """
+
+    if mesh is None:
+        mesh = create_mesh(name, faces, face_normals, points, global_matrix, loop_normals)
+
+    return link_mesh_object(name, mesh)
+
+
+def create_mesh(name, faces, face_normals=None, points=None, global_matrix=None,
+                loop_normals=None):
     """
+    Create a blender mesh called name from a list of *points* and *faces*,
+    or from the sur_utils.SurMesh *faces*. The vertex coordinates and the
+    indices are uploaded with foreach_set from typed buffers.
+
+    The geometry is transformed by global_matrix, pass None when it already
+    is (see mesh_utils.transform_mesh).
+
+    Custom normals are set from the *face_normals*, or from the *loop_normals*
+    given for each face corner (see mesh_utils.split_normals).
+    """
+    import numpy as np
+    from .sur_utils import SurMesh
+
+    if isinstance(faces, SurMesh):
+        sur = faces
+        faces, points = sur.indices, sur.coords
+        if face_normals is None:
+            face_normals = sur.norms
 
     mesh = bpy.data.meshes.new(name)
-    mesh.from_pydata(points, [], faces)
+    set_mesh_geometry(mesh, points, faces)
 
-    if face_normals:
+    if face_normals is not None and len(face_normals):
+        loop_normals = np.repeat(np.asarray(face_normals, dtype=np.float32).reshape(-1, 3), 3, axis=0)
+    use_normals = loop_normals is not None and len(loop_normals) > 0
+
+    if use_normals:
         # Note: we store 'temp' normals in loops, since validate() may alter final mesh,
         #       we can only set custom loop_normals *after* calling it.
         mesh.create_normals_split()
-        loop_normals = tuple(chain(*chain(*zip(face_normals, face_normals, face_normals))))
-        mesh.loops.foreach_set("normal", loop_normals)
+        mesh.loops.foreach_set("normal", np.asarray(loop_normals, dtype=np.float32).ravel())
 
-    mesh.transform(global_matrix)
+    if global_matrix is not None:
+        mesh.transform(global_matrix)
 
     # update mesh to allow proper display
     mesh.validate(clean_customdata=False)  # *Very* important to not remove loop_normals here!
 
-    if face_normals:
-        clnors = array.array('f', [0.0] * (len(mesh.loops) * 3))
+    if use_normals:
+        clnors = np.empty(len(mesh.loops) * 3, dtype=np.float32)
         mesh.loops.foreach_get("normal", clnors)
 
         mesh.polygons.foreach_set("use_smooth", [True] * len(mesh.polygons))
 
-        mesh.normals_split_custom_set(tuple(zip(*(iter(clnors),) * 3)))
+        # all the custom normals in one call
+        mesh.normals_split_custom_set(clnors.reshape(-1, 3))
         mesh.use_auto_smooth = True
         mesh.show_edge_sharp = True
         mesh.free_normals_split()
 
     mesh.update()
 
+    return mesh
+
+
+def set_mesh_geometry(mesh, points, faces):
+    """
+    Fill the empty *mesh* with the triangles *faces* over the vertex
+    coordinates *points*, uploaded with foreach_set from typed buffers.
+    """
+    import numpy as np
+
+    coords = np.asarray(points, dtype=np.float32).reshape(-1)
+    indices = np.asarray(faces, dtype=np.int32).reshape(-1)
+    count = len(indices) // 3
+
+    mesh.vertices.add(len(coords) // 3)
+    mesh.vertices.foreach_set("co", coords)
+    mesh.loops.add(len(indices))
+    mesh.loops.foreach_set("vertex_index", indices)
+    mesh.polygons.add(count)
+    mesh.polygons.foreach_set("loop_start", np.arange(0, len(indices), 3, dtype=np.int32))
+    mesh.polygons.foreach_set("loop_total", np.full(count, 3, dtype=np.int32))
+    mesh.update(calc_edges=True)
+
+
+def link_mesh_object(name, mesh):
+    """
+    Create an object called name using *mesh* and link it in the current scene.
+    """
+
     obj = bpy.data.objects.new(name, mesh)
     bpy.context.collection.objects.link(obj)
     bpy.context.view_layer.objects.active = obj
     obj.select_set(True)
 
+    return obj
+
+
+def link_empty_object(name):
+    """
+    Create an empty called name and link it in the current scene.
+    """
+
+    obj = bpy.data.objects.new(name, None)
+    bpy.context.collection.objects.link(obj)
+
+    return obj
+
+
+def set_vertex_attribute(obj, name, values):
+    """
+    Store one float per vertex of *obj* in the mesh attribute called name.
+
+    Blender versions without generic mesh attributes get a vertex group
+    instead, with the values normalized to [0, 1] and the scale stored in
+    the object property name + "_max".
+    """
+    mesh = obj.data
+
+    if hasattr(mesh, "attributes"):
+        attribute = mesh.attributes.get(name)
+        if attribute is None:
+            attribute = mesh.attributes.new(name, 'FLOAT', 'POINT')
+        attribute.data.foreach_set("value", values)
+        return
+
+    scale = max(values, default=0.0) or 1.0
+    group = obj.vertex_groups.get(name) or obj.vertex_groups.new(name=name)
+    for index, value in enumerate(values):
+        group.add([index], value / scale, 'REPLACE')
+    obj[name + "_max"] = float(scale)
+
 
 def faces_from_mesh(ob, global_matrix, use_mesh_modifiers=False):
     """
-    From an object, return a generator over a list of faces.
+    Return the triangulated geometry of an object as (N, 3) float32 vertex
+    coordinates and (M, 3) int32 vertex indices, or None if it has no mesh.
 
-    Each faces is a list of his vertexes. Each vertex is a tuple of
-    his coordinate.
+    The coordinates are transformed by global_matrix and the object matrix.
 
     use_mesh_modifiers
-        Apply the preview modifier to the returned liste
+        Apply the preview modifier to the returned geometry
+    """
+    import numpy as np
+
+    def acquire(size):
+        return np.empty(size, dtype=np.float32)
+
+    offsets = []
+    coords, faces, topology = frame_arrays([ob], global_matrix, use_mesh_modifiers, acquire,
+                                           offsets=offsets)
+    if not topology:
+        return None
 
-    triangulate
-        Split the quad into two triangles
+    return apply_offsets(coords.reshape(-1, 3), topology, offsets, global_matrix), faces
+
+
+def apply_offsets(coords, topology, offsets, global_matrix):
     """
+    Add back the recentering offsets (the "sur_offset" property set by the
+    import) to the (N, 3) coordinates extracted by frame_arrays, *offsets*
+    holding the (offset, world matrix), or None, of each object of
+    *topology*. The offsets are in the local frame of their object, so they
+    follow its rotation and scale.
 
-    # get the editmode data
-    ob.update_from_editmode()
+    Returns float64 coordinates when an object has an offset, *coords*
+    otherwise.
+    """
+    import numpy as np
 
-    # get the modifiers
-    if use_mesh_modifiers:
-        depsgraph = bpy.context.evaluated_depsgraph_get()
-        mesh_owner = ob.evaluated_get(depsgraph)
-    else:
-        mesh_owner = ob
+    if not any(offset is not None for offset in offsets):
+        return coords
 
+    rotation = np.array(global_matrix.to_3x3(), dtype=np.float64)
+    coords = coords.astype(np.float64)
+    start = 0
+    for count, entry in zip(topology, offsets):
+        end = start + count[0]
+        if entry is not None:
+            offset, world = entry
+            coords[start:end] += rotation @ (np.array(world, dtype=np.float64) @
+                                             np.asarray(offset, dtype=np.float64))
+        start = end
+    return coords
+
+
+def frame_arrays(objects, global_matrix, use_mesh_modifiers, acquire, faces=None, topology=None,
+                 offsets=None):
+    """
+    Extract the merged geometry of *objects* at the current frame.
+
+    The vertex coordinates are copied into the float32 buffer returned by
+    acquire(size) and transformed there by global_matrix and the object
+    matrices. The triangles are only extracted again when *faces* is not
+    given or *topology* (the vertex, polygon and loop counts of each object,
+    and whether its matrix mirrors it, when *faces* was extracted) changed.
+
+    The "sur_offset" property and the 3x3 world matrix (or None) of each
+    object of topology are appended to the *offsets* list when given (see
+    apply_offsets).
+
+    Returns (coords, faces, topology).
+    """
+    import numpy as np
+    from . import mesh_utils
+
+    evaluated = []
+    depsgraph = bpy.context.evaluated_depsgraph_get() if use_mesh_modifiers else None
     try:
-        mesh = mesh_owner.to_mesh()
-    except RuntimeError:
-        return
+        for ob in objects:
+            ob.update_from_editmode()
+            owner = ob.evaluated_get(depsgraph) if depsgraph else ob
+            try:
+                mesh = owner.to_mesh()
+            except RuntimeError:
+                continue
+            if mesh is not None:
+                evaluated.append((owner, mesh, global_matrix @ ob.matrix_world))
+                if offsets is not None:
+                    offset = ob.get("sur_offset")
+                    offsets.append(None if offset is None else
+                                   (tuple(offset), [tuple(row) for row in ob.matrix_world.to_3x3()]))
 
-    mat = global_matrix @ ob.matrix_world
-    mesh.transform(mat)
-    if mat.is_negative:
-        mesh.flip_normals()
-    mesh.calc_loop_triangles()
+        counts = tuple((len(mesh.vertices), len(mesh.polygons), len(mesh.loops), mat.is_negative)
+                       for owner, mesh, mat in evaluated)
+        coords = acquire(3 * sum(count[0] for count in counts))
 
-    vertices = mesh.vertices
-    triangles = mesh.loop_triangles
+        offset = 0
+        for owner, mesh, mat in evaluated:
+            size = 3 * len(mesh.vertices)
+            block = coords[offset:offset + size]
+            mesh.vertices.foreach_get("co", block)
+            block[:] = mesh_utils.transform_points(block, mat).ravel()
+            offset += size
 
-    tris = [list(tri.vertices) for tri in triangles]
+        if faces is None or counts != topology:
+            parts = []
+            offset = 0
+            for owner, mesh, mat in evaluated:
+                mesh.calc_loop_triangles()
+                tris = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+                mesh.loop_triangles.foreach_get("vertices", tris)
+                tris = tris.reshape(-1, 3)
+                if mat.is_negative:
+                    # mirrored: reverse the winding to keep the faces outwards
+                    tris = tris[:, ::-1]
+                parts.append(tris + offset)
+                offset += len(mesh.vertices)
+            faces = np.concatenate(parts) if parts else np.zeros((0, 3), dtype=np.int32)
+    finally:
+        for owner, mesh, mat in evaluated:
+            owner.to_mesh_clear()
+
+    return coords, faces, counts
+
+
+# frame caches of the SUR sequence objects, by object pointer (stable over
+# renames; states of deleted objects are pruned by update_sequences)
+_sequences = {}
+
+
+class _SequenceState:
+    __slots__ = ("filepath", "cache", "faces")
+
+    def __init__(self, filepath, cache):
+        self.filepath = filepath
+        self.cache = cache
+        self.faces = None
+
+
+def _sequence_state(obj):
+    from . import sequence_utils
+
+    filepath = obj["sur_sequence"]
+    key = obj.as_pointer()
+    state = _sequences.get(key)
+    if state is None or state.filepath != filepath:
+        if state is not None:
+            state.cache.close()
+        values = list(obj.get("sur_sequence_matrix", ()))
+        matrix = [values[i:i + 4] for i in range(0, 16, 4)] if len(values) == 16 else None
+        cache = sequence_utils.open_sequence(filepath, matrix)
+        state = _sequences[key] = _SequenceState(filepath, cache)
+
+    return state
+
+
+def create_sequence_object(filepath, global_matrix):
+    """
+    Create an object showing the SUR sequence *filepath* belongs to,
+    its geometry following the current frame (see update_sequences).
+
+    The object is removed again if the current frame cannot be loaded.
+    """
+    name = bpy.path.display_name(os.path.basename(filepath))
+    mesh = bpy.data.meshes.new(name)
+    obj = link_mesh_object(name, mesh)
+    obj["sur_sequence"] = filepath
+    obj["sur_sequence_matrix"] = [v for row in global_matrix for v in row]
+
+    try:
+        update_sequence_object(obj, bpy.context.scene.frame_current)
+    except Exception:
+        state = _sequences.pop(obj.as_pointer(), None)
+        if state is not None:
+            state.cache.close()
+        bpy.data.objects.remove(obj)
+        bpy.data.meshes.remove(mesh)
+        raise
+
+    return obj
+
+
+def update_sequence_object(obj, frame):
+    """
+    Show the SUR sequence frame *frame* on obj. When the topology does not
+    change only the vertex coordinates are uploaded.
+    """
+    import numpy as np
+
+    state = _sequence_state(obj)
+    coords, faces = state.cache.get(frame)
+    mesh = obj.data
+
+    same_topology = state.faces is not None and len(coords) == 3 * len(mesh.vertices) and \
+        (faces is state.faces or np.array_equal(faces, state.faces))
+
+    if same_topology:
+        mesh.vertices.foreach_set("co", coords)
+    else:
+        mesh.clear_geometry()
+        set_mesh_geometry(mesh, coords, faces)
+        mesh.validate(clean_customdata=False)
+
+    state.faces = faces
+    mesh.update()
+
+
+@persistent
+def update_sequences(scene, *args):
+    """
+    frame_change_pre handler updating the SUR sequence objects of the scene.
+
+    A sequence which fails to load is not retried on the next frames: its
+    object gets a "sur_sequence_error" property with the error, to be
+    removed to try again.
+    """
+    shown = set()
+    for obj in scene.objects:
+        if obj.type == 'MESH' and "sur_sequence" in obj:
+            shown.add(obj.as_pointer())
+            if "sur_sequence_error" in obj:
+                continue
+            try:
+                update_sequence_object(obj, scene.frame_current)
+            except (OSError, ValueError) as error:
+                obj["sur_sequence_error"] = str(error)
+                print("SUR sequence %s failed: %s" % (obj["sur_sequence"], error))
+
+    # close the caches of the sequence objects deleted since
+    if not shown.issuperset(_sequences):
+        alive = {obj.as_pointer() for obj in bpy.data.objects if "sur_sequence" in obj}
+        for key in [key for key in _sequences if key not in alive]:
+            _sequences.pop(key).cache.close()
+
+
+def clear_sequences():
+    """
+    Stop the prefetching threads and free the cached frames of all sequences.
+    """
+    for state in _sequences.values():
+        state.cache.close()
+    _sequences.clear()
+
+
+# thumbnails of the import file browser (see thumbnail_utils) and their icons
+_thumbnails = None
+_previews = None
+
+
+def _redraw_file_browsers():
+    # bpy.app.timers callback, until the pending thumbnails are rendered
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'FILE_BROWSER':
+                area.tag_redraw()
+    return 0.25 if _thumbnails is not None and _thumbnails.pending else None
+
+
+def sur_preview(filepath):
+    """
+    Return the icon_id of the thumbnail of the SUR file *filepath*, or 0
+    while it is rendered in the background (the file browsers are redrawn
+    once it is ready) or when it cannot be rendered.
+    """
+    global _thumbnails, _previews
+    import sys
+    import numpy as np
+    import bpy.utils.previews
+    from . import thumbnail_utils
+
+    if _thumbnails is None:
+        # the interpreter bundled with blender runs the workers
+        python = getattr(bpy.app, "binary_path_python", "") or sys.executable
+        _thumbnails = thumbnail_utils.ThumbnailCache(python=python)
+        _previews = bpy.utils.previews.new()
+
+    image = _thumbnails.get(filepath)
+    if image is None:
+        if _thumbnails.pending and not bpy.app.timers.is_registered(_redraw_file_browsers):
+            bpy.app.timers.register(_redraw_file_browsers, first_interval=0.25)
+        return 0
+
+    key = "%s:%d" % (os.path.abspath(filepath), os.stat(filepath).st_mtime_ns)
+    preview = _previews.get(key)
+    if preview is None:
+        while len(_previews) >= _thumbnails.capacity:
+            del _previews[next(iter(_previews))]
+        preview = _previews.new(key)
+        preview.image_size = image.shape[1], image.shape[0]
+        preview.image_pixels_float = (image.ravel() / np.float32(255.0)).tolist()
+
+    return preview.icon_id
+
+
+def clear_previews():
+    """
+    Stop the thumbnail workers and free the preview icons.
+    """
+    global _thumbnails, _previews
 
-    return vertices, triangles
+    if bpy.app.timers.is_registered(_redraw_file_browsers):
+        bpy.app.timers.unregister(_redraw_file_browsers)
+    if _thumbnails is not None:
+        import bpy.utils.previews
+        _thumbnails.close()
+        bpy.utils.previews.remove(_previews)
+    _thumbnails = _previews = None
@@ -0,0 +1,473 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Flat BVH over the triangles of a SUR mesh, saved next to the SUR file
+(no blender needed)
+
+The tree is balanced and implicit like kdtree_utils.KDTree: node i has the
+children 2i+1 and 2i+2 and every leaf holds LEAF_SIZE triangles, split at
+the median centroid along the longest axis. It is stored as flat arrays
+(node bounds, leaf triangle order and the triangle corners in leaf order),
+so a sidecar file (filepath + ".bvh") is memory-mapped back without parsing
+the SUR file or building anything. The sidecar is rebuilt when the size or
+modification time of the SUR file changed.
+
+Queries run on batches of rays / points, walking the tree one level at a
+time for all the pending (query, node) pairs:
+
+bvh = bvh_utils.load_or_build("terrain.sur")
+distances, triangles, points = bvh.ray_cast(origins, directions)
+distances, triangles, points = bvh.nearest(points)
+triangles = bvh.box(lo, hi)
+"""
+
+import os
+import mmap
+import struct
+
+import numpy as np
+
+if __package__:
+    from . import sur_utils
+else:
+    import sur_utils
+
+# triangles per leaf
+LEAF_SIZE = 8
+
+# rays / points processed at once (bounds the temporary memory)
+_QUERY_CHUNK = 1 << 14
+
+SIDECAR_EXTENSION = ".bvh"
+
+_MAGIC = b"SBVH"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIIIQQq")
+
+
+class SurBVH:
+    """
+    Bounding volume hierarchy over a triangle mesh.
+    """
+
+    __slots__ = ("depth", "leaf_size", "count", "order", "triangles",
+                 "box_min", "box_max", "_map")
+
+    def __init__(self, depth, leaf_size, count, order, triangles, box_min, box_max, _map=None):
+        self.depth = depth
+        self.leaf_size = leaf_size
+        self.count = count              # number of triangles of the mesh
+        self.order = order              # mesh triangle index of each leaf slot
+        self.triangles = triangles      # (slots, 3, 3) float32 corners in leaf order
+        self.box_min = box_min          # (nodes, 3) float32 node bounds
+        self.box_max = box_max
+        self._map = _map
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def build(cls, verts, faces, leaf_size=LEAF_SIZE):
+        verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        if not len(faces):
+            raise ValueError("cannot build a BVH without triangles")
+
+        leaf_size = max(int(leaf_size), 1)
+        count = len(faces)
+        depth = 0
+        while (leaf_size << depth) < count:
+            depth += 1
+
+        # pad with copies of the first triangle so that all the leaves are
+        # full, the copies end up in the leaf of the first triangle
+        order = np.zeros(leaf_size << depth, dtype=np.int64)
+        order[:count] = np.arange(count)
+
+        # centroids per axis, so the extents are reduced over contiguous rows
+        axes = np.stack([(verts[faces[:, 0], axis] + verts[faces[:, 1], axis] +
+                          verts[faces[:, 2], axis]) for axis in range(3)])
+
+        for level in range(depth):
+            rows = order.reshape(1 << level, -1)
+            coords = np.stack([axis_coords[rows] for axis_coords in axes])
+            axis = (coords.max(axis=2) - coords.min(axis=2)).argmax(axis=0)
+            values = coords[axis[:, None], np.arange(len(rows))[:, None], np.arange(rows.shape[1])]
+            del coords
+
+            half = rows.shape[1] // 2
+            part = np.argpartition(values, half, axis=1)
+            rows[:] = np.take_along_axis(rows, part, axis=1)
+
+        triangles = verts[faces[order]]
+
+        # bounds of all the nodes, leaves first then up the tree
+        inner = (1 << depth) - 1
+        box_min = np.empty(((2 << depth) - 1, 3), dtype=np.float32)
+        box_max = np.empty(((2 << depth) - 1, 3), dtype=np.float32)
+        leaves = triangles.reshape(1 << depth, leaf_size * 3, 3)
+        box_min[inner:] = leaves.min(axis=1)
+        box_max[inner:] = leaves.max(axis=1)
+        for level in range(depth - 1, -1, -1):
+            nodes = np.arange((1 << level) - 1, (2 << level) - 1)
+            box_min[nodes] = np.minimum(box_min[2 * nodes + 1], box_min[2 * nodes + 2])
+            box_max[nodes] = np.maximum(box_max[2 * nodes + 1], box_max[2 * nodes + 2])
+
+        return cls(depth, leaf_size, count, order.astype(np.int32), triangles, box_min, box_max)
+
+    # persistence
+
+    def save(self, filepath, stamp=(0, 0)):
+        """
+        Write the BVH to *filepath*, *stamp* being the (size, mtime_ns) of
+        the SUR file it was built from.
+        """
+        temp = filepath + ".tmp"
+        with open(temp, 'wb') as data:
+            data.write(_HEADER.pack(_MAGIC, _VERSION, self.leaf_size, self.depth,
+                                    self.count, stamp[0], stamp[1]))
+            for array in (self.order, self.triangles, self.box_min, self.box_max):
+                data.write(np.ascontiguousarray(array).tobytes())
+        os.replace(temp, filepath)
+
+    @classmethod
+    def load(cls, filepath, stamp=None):
+        """
+        Memory-map a BVH saved by save(). Returns None if the file is not a
+        BVH or if *stamp* is given and differs from the saved one.
+        """
+        with open(filepath, 'rb') as data:
+            view = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(view) < _HEADER.size:
+            view.close()
+            return None
+        magic, version, leaf_size, depth, count, size, mtime = _HEADER.unpack_from(view, 0)
+        if magic != _MAGIC or version != _VERSION or \
+                (stamp is not None and tuple(stamp) != (size, mtime)):
+            view.close()
+            return None
+
+        slots = leaf_size << depth
+        nodes = (2 << depth) - 1
+        offset = _HEADER.size
+
+        def take(dtype, shape):
+            nonlocal offset
+            array = np.frombuffer(view, dtype=dtype, count=int(np.prod(shape)), offset=offset)
+            offset += array.nbytes
+            return array.reshape(shape)
+
+        order = take(np.int32, (slots,))
+        triangles = take(np.float32, (slots, 3, 3))
+        box_min = take(np.float32, (nodes, 3))
+        box_max = take(np.float32, (nodes, 3))
+
+        return cls(depth, leaf_size, count, order, triangles, box_min, box_max, view)
+
+    # traversal
+
+    def _children(self, pairs_q, pairs_node):
+        return (np.repeat(pairs_q, 2),
+                2 * np.repeat(pairs_node, 2) + np.tile((1, 2), len(pairs_node)))
+
+    def _leaf_slots(self, leaves):
+        # (pairs, leaf_size) leaf slot indices of the given leaves
+        return leaves[:, None] * self.leaf_size + np.arange(self.leaf_size)
+
+    def _box_distances2(self, points, nodes):
+        # squared distances of the points to the nearest / farthest point
+        # of their node box
+        below = self.box_min[nodes] - points
+        above = points - self.box_max[nodes]
+        gap = np.maximum(below, 0.0) + np.maximum(above, 0.0)
+        far = np.maximum(np.abs(below), np.abs(above))
+        return np.einsum('ij,ij->i', gap, gap), np.einsum('ij,ij->i', far, far)
+
+    def ray_cast(self, origins, directions, max_distance=np.inf):
+        """
+        Return the (distances, triangles, points) of the first hit of each
+        ray, distance being inf and triangle -1 for the rays hitting nothing
+        closer than max_distance. Distances are in units of the direction
+        length.
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.broadcast_to(np.asarray(directions, dtype=np.float64).reshape(-1, 3),
+                                     origins.shape)
+        distances = np.full(len(origins), np.inf)
+        triangles = np.full(len(origins), -1, dtype=np.int64)
+
+        for start in range(0, len(origins), _QUERY_CHUNK):
+            chunk = slice(start, start + _QUERY_CHUNK)
+            distances[chunk], triangles[chunk] = self._ray_chunk(
+                    origins[chunk], directions[chunk], max_distance)
+
+        return distances, triangles, origins + directions * np.where(
+                np.isfinite(distances), distances, 0.0)[:, None]
+
+    def _ray_chunk(self, origins, directions, max_distance):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse = 1.0 / directions
+
+        inner = (1 << self.depth) - 1
+        pairs_q = np.arange(len(origins))
+        pairs_node = np.zeros(len(origins), dtype=np.int64)
+        for level in range(self.depth + 1):
+            if level:
+                pairs_q, pairs_node = self._children(pairs_q, pairs_node)
+            with np.errstate(invalid='ignore'):
+                t1 = (self.box_min[pairs_node] - origins[pairs_q]) * inverse[pairs_q]
+                t2 = (self.box_max[pairs_node] - origins[pairs_q]) * inverse[pairs_q]
+            # fmin / fmax ignore the NaN of a ray lying in a slab plane
+            near = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+            far = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+            hit = (far >= np.maximum(near, 0.0)) & (near <= max_distance)
+            pairs_q, pairs_node = pairs_q[hit], pairs_node[hit]
+
+        distances = np.full(len(origins), np.inf)
+        triangles = np.full(len(origins), -1, dtype=np.int64)
+        if not len(pairs_q):
+            return distances, triangles
+
+        slots = self._leaf_slots(pairs_node - inner).ravel()
+        rays = np.repeat(pairs_q, self.leaf_size)
+        t = _intersect(origins[rays], directions[rays], self.triangles[slots])
+        t[t > max_distance] = np.inf
+
+        np.minimum.at(distances, rays, t)
+        won = np.isfinite(t) & (t == distances[rays])
+        triangles[rays[won]] = self.order[slots[won]]
+        return distances, triangles
+
+    def nearest(self, points):
+        """
+        Return the (distances, triangles, points) of the closest point on
+        the mesh surface of each point.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        distances = np.empty(len(points))
+        triangles = np.empty(len(points), dtype=np.int64)
+        closest = np.empty((len(points), 3))
+
+        for start in range(0, len(points), _QUERY_CHUNK):
+            chunk = slice(start, start + _QUERY_CHUNK)
+            distances[chunk], triangles[chunk], closest[chunk] = self._nearest_chunk(points[chunk])
+
+        return distances, triangles, closest
+
+    def _leaf_nearest(self, queries, leaves):
+        # (squared distance, slot, closest point) of each query in its leaf
+        slots = self._leaf_slots(leaves)
+        corners = self.triangles[slots.ravel()].astype(np.float64)
+        p = np.repeat(queries, self.leaf_size, axis=0)
+        closest = _closest_on_triangles(p, corners[:, 0], corners[:, 1], corners[:, 2])
+        delta = closest - p
+        d2 = np.einsum('ij,ij->i', delta, delta).reshape(-1, self.leaf_size)
+        best = d2.argmin(axis=1)
+        rows = np.arange(len(queries))
+        return (d2[rows, best], slots[rows, best],
+                closest.reshape(-1, self.leaf_size, 3)[rows, best])
+
+    def _nearest_chunk(self, points):
+        inner = (1 << self.depth) - 1
+
+        # every box holds a triangle, so the distance to its farthest corner
+        # bounds the distance to the mesh: keep the (point, node) pairs whose
+        # box is closer than the smallest of these bounds
+        bound = np.full(len(points), np.inf)
+        pairs_q = np.arange(len(points))
+        pairs_node = np.zeros(len(points), dtype=np.int64)
+        for level in range(self.depth + 1):
+            if level:
+                pairs_q, pairs_node = self._children(pairs_q, pairs_node)
+            near2, far2 = self._box_distances2(points[pairs_q], pairs_node)
+            np.minimum.at(bound, pairs_q, far2)
+            near = near2 <= bound[pairs_q]
+            pairs_q, pairs_node, far2 = pairs_q[near], pairs_node[near], far2[near]
+
+        # search the leaf giving the bound first (every point has one, in
+        # point order after the sort), its exact distance then prunes the
+        # other leaves
+        first = np.lexsort((far2, pairs_q))
+        first = first[np.r_[True, pairs_q[first][1:] != pairs_q[first][:-1]]]
+        best_d2, best_slot, best_point = self._leaf_nearest(points, pairs_node[first] - inner)
+
+        rest = np.ones(len(pairs_q), dtype=bool)
+        rest[first] = False
+        pairs_q, pairs_node = pairs_q[rest], pairs_node[rest]
+        near = self._box_distances2(points[pairs_q], pairs_node)[0] < best_d2[pairs_q]
+        pairs_q, pairs_node = pairs_q[near], pairs_node[near]
+
+        for start in range(0, len(pairs_q), _QUERY_CHUNK):
+            chunk = slice(start, start + _QUERY_CHUNK)
+            queries = pairs_q[chunk]
+            d2, slot, point = self._leaf_nearest(points[queries], pairs_node[chunk] - inner)
+            np.minimum.at(best_d2, queries, d2)
+            won = d2 == best_d2[queries]
+            best_slot[queries[won]] = slot[won]
+            best_point[queries[won]] = point[won]
+
+        return np.sqrt(best_d2), self.order[best_slot], best_point
+
+    def box(self, lo, hi):
+        """
+        Return the sorted indices of the triangles whose bounds overlap the
+        box from *lo* to *hi*.
+        """
+        lo = np.asarray(lo, dtype=np.float32).reshape(3)
+        hi = np.asarray(hi, dtype=np.float32).reshape(3)
+
+        nodes = np.zeros(1, dtype=np.int64)
+        for level in range(self.depth + 1):
+            if level:
+                nodes = 2 * np.repeat(nodes, 2) + np.tile((1, 2), len(nodes))
+            overlap = np.all((self.box_min[nodes] <= hi) & (self.box_max[nodes] >= lo), axis=1)
+            nodes = nodes[overlap]
+
+        slots = self._leaf_slots(nodes - ((1 << self.depth) - 1)).ravel()
+        corners = self.triangles[slots]
+        overlap = np.all((corners.min(axis=1) <= hi) & (corners.max(axis=1) >= lo), axis=1)
+        return np.unique(self.order[slots[overlap]]).astype(np.int64)
+
+    def close(self):
+        """
+        Release the memory map of a loaded BVH.
+        """
+        self.order = self.triangles = self.box_min = self.box_max = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # arrays still refer to the map, it is freed with them
+                pass
+            self._map = None
+
+
+def _intersect(origins, directions, corners, epsilon=1e-12):
+    # Moller-Trumbore distance of each ray to its triangle, inf if missed
+    a = corners[:, 0].astype(np.float64)
+    edge1 = corners[:, 1] - a
+    edge2 = corners[:, 2] - a
+    p = np.cross(directions, edge2)
+    det = np.einsum('ij,ij->i', edge1, p)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inverse = 1.0 / det
+        s = origins - a
+        u = np.einsum('ij,ij->i', s, p) * inverse
+        q = np.cross(s, edge1)
+        v = np.einsum('ij,ij->i', directions, q) * inverse
+        t = np.einsum('ij,ij->i', edge2, q) * inverse
+        hit = (np.abs(det) > epsilon) & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (t >= 0.0)
+    return np.where(hit, t, np.inf)
+
+
+def _closest_on_triangles(p, a, b, c):
+    # closest point of each triangle to its point (Ericson, Real-Time
+    # Collision Detection 5.1.5), the Voronoi regions being tested in
+    # reverse order of precedence so that the first match wins
+    def dot(x, y):
+        return np.einsum('ij,ij->i', x, y)
+
+    ab, ac, ap = b - a, c - a, p - a
+    bp, cp = p - b, p - c
+    d1, d2 = dot(ab, ap), dot(ac, ap)
+    d3, d4 = dot(ab, bp), dot(ac, bp)
+    d5, d6 = dot(ab, cp), dot(ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = va + vb + vc
+        v = np.where(denom != 0.0, vb / denom, 0.0)
+        w = np.where(denom != 0.0, vc / denom, 0.0)
+        result = a + ab * v[:, None] + ac * w[:, None]
+
+        # edge BC
+        e1, e2 = d4 - d3, d5 - d6
+        mask = (va <= 0.0) & (e1 >= 0.0) & (e2 >= 0.0)
+        t = np.where(mask, e1 / (e1 + e2), 0.0)
+        result = np.where(mask[:, None], b + (c - b) * t[:, None], result)
+
+        # edge AC
+        mask = (vb <= 0.0) & (d2 >= 0.0) & (d6 <= 0.0)
+        t = np.where(mask, d2 / (d2 - d6), 0.0)
+        result = np.where(mask[:, None], a + ac * t[:, None], result)
+
+        # vertex C
+        result = np.where(((d6 >= 0.0) & (d5 <= d6))[:, None], c, result)
+
+        # edge AB
+        mask = (vc <= 0.0) & (d1 >= 0.0) & (d3 <= 0.0)
+        t = np.where(mask, d1 / (d1 - d3), 0.0)
+        result = np.where(mask[:, None], a + ab * t[:, None], result)
+
+        # vertices B and A
+        result = np.where(((d3 >= 0.0) & (d4 <= d3))[:, None], b, result)
+        result = np.where(((d1 <= 0.0) & (d2 <= 0.0))[:, None], a, result)
+
+    return np.nan_to_num(result)
+
+
+def sidecar_path(filepath):
+    return filepath + SIDECAR_EXTENSION
+
+
+def _stamp(filepath):
+    info = os.stat(filepath)
+    return info.st_size, info.st_mtime_ns
+
+
+def load_sidecar(filepath):
+    """
+    Return the BVH saved next to the SUR file *filepath*, or None if there
+    is none or it is out of date.
+    """
+    path = sidecar_path(filepath)
+    if not os.path.exists(path):
+        return None
+    try:
+        return SurBVH.load(path, _stamp(filepath))
+    except (OSError, ValueError):
+        return None
+
+
+def build_sidecar(filepath, verts=None, faces=None, leaf_size=LEAF_SIZE):
+    """
+    Build the BVH of the SUR file *filepath* (from its already parsed
+    *verts* and *faces* if given) and save it next to it.
+    """
+    stamp = _stamp(filepath)
+    if verts is None or faces is None:
+        mesh = sur_utils.read_sur(filepath)
+        verts, faces = mesh.verts, mesh.faces
+
+    bvh = SurBVH.build(verts, faces, leaf_size)
+    bvh.save(sidecar_path(filepath), stamp)
+    return bvh
+
+
+def load_or_build(filepath, verts=None, faces=None):
+    """
+    Return the BVH of the SUR file *filepath*, loading its sidecar when it
+    is up to date and building (and saving) it otherwise.
+    """
+    return load_sidecar(filepath) or build_sidecar(filepath, verts, faces)
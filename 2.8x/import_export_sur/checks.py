@@ -0,0 +1,136 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Sanity checks of the bpy-free modules of the SUR pipeline.
+
+Each check_* function asserts a property of the array based mesh code on a
+small mesh built in place. Run them all with:
+
+python checks.py
+"""
+
+import numpy as np
+
+if __package__:
+    from . import decimate_utils
+    from . import mesh_utils
+    from . import sur_utils
+else:
+    import decimate_utils
+    import mesh_utils
+    import sur_utils
+
+
+def tetrahedron():
+    """
+    Return the (verts, faces) of a closed, outwards facing tetrahedron.
+    """
+    verts = np.array(((0.0, 0.0, 0.0), (1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0)))
+    faces = np.array(((0, 2, 1), (0, 1, 3), (0, 3, 2), (1, 2, 3)))
+    return verts, faces
+
+
+def wavy_grid(size):
+    """
+    Return the (verts, faces) of a *size* x *size* height-field grid with
+    upwards facing triangles and a few waves across it.
+    """
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, size), np.linspace(0.0, 1.0, size), indexing='ij')
+    height = 0.05 * np.sin(12.0 * u) * np.cos(9.0 * v) + 0.02 * np.sin(31.0 * (u + v))
+    verts = np.column_stack((u.ravel(), v.ravel(), height.ravel()))
+    corner = (np.arange(size - 1)[:, None] * size + np.arange(size - 1)).ravel()
+    faces = np.concatenate((np.column_stack((corner, corner + size, corner + size + 1)),
+                            np.column_stack((corner, corner + size + 1, corner + 1))))
+    return verts, faces
+
+
+def face_normals(verts, faces):
+    """
+    Return the (unnormalized) normals of *faces*.
+    """
+    corners = verts[faces]
+    return np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+
+
+def edge_face_counts(faces):
+    """
+    Return the number of faces around each (undirected) edge of *faces*.
+    """
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    edges = np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]))
+    edges.sort(axis=1)
+    return np.unique(edges, axis=0, return_counts=True)[1]
+
+
+def check_decimate_tetrahedron():
+    # a closed component cannot go below the 4 faces of a tetrahedron
+    verts, faces = tetrahedron()
+    new_verts, new_faces = decimate_utils.decimate(verts, faces, 0)
+    assert len(new_faces) == 4, new_faces
+    assert np.array_equal(np.sort(new_faces, axis=None), np.sort(faces, axis=None))
+    assert (edge_face_counts(new_faces) == 2).all()
+
+
+def check_decimate_height_field():
+    # a height field stays one: no collapse may fold a face over or downwards
+    verts, faces = wavy_grid(150)
+    assert (face_normals(verts, faces)[:, 2] > 0.0).all()
+    for ratio in (0.5, 0.3):
+        new_verts, new_faces = decimate_utils.decimate(verts, faces, int(len(faces) * ratio))
+        assert len(new_faces) <= int(len(faces) * ratio) + 2, len(new_faces)
+        normals = face_normals(new_verts, new_faces)
+        assert (normals[:, 2] > 0.0).all(), (ratio, np.count_nonzero(normals[:, 2] <= 0.0))
+
+
+def check_surmesh_rows():
+    # verts and faces are rows viewing the buffers, with and without NumPy
+    verts, faces = tetrahedron()
+    numpy = sur_utils.np
+    try:
+        for module in (numpy, None):
+            sur_utils.np = module
+            mesh = sur_utils.SurMesh(verts.tolist(), faces.tolist())
+            assert len(mesh.verts) == 4 and len(mesh.faces) == 4
+            assert [tuple(row) for row in mesh.faces] == [tuple(row) for row in faces.tolist()]
+            assert tuple(mesh.verts[-1]) == (0.0, 0.0, 1.0)
+            assert [tuple(row) for row in mesh.faces[1:3]] == [(0, 1, 3), (0, 3, 2)]
+            mesh.verts[1][0] = 2.0
+            assert mesh.coords[3] == 2.0
+    finally:
+        sur_utils.np = numpy
+
+
+def check_weld_duplicate_faces():
+    # two copies of a tetrahedron weld into one, faces keeping their winding
+    verts, faces = tetrahedron()
+    flipped = faces[:, ::-1]
+    new_verts, new_faces = mesh_utils.weld_vertices(np.concatenate((verts, verts)),
+                                                    np.concatenate((faces, flipped + 4)))
+    assert len(new_verts) == 4
+    assert np.array_equal(new_faces, faces), new_faces
+    assert (edge_face_counts(new_faces) == 2).all()
+
+
+if __name__ == '__main__':
+    checks = sorted(name for name in dir() if name.startswith("check_"))
+    for name in checks:
+        globals()[name]()
+        print("%s: ok" % name)
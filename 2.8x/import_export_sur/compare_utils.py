@@ -0,0 +1,123 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Geometric comparison of SUR meshes (no blender needed)
+
+Every vertex of each mesh is matched with the nearest vertex of the other
+one through a KD-tree, which gives the per-vertex distances, the symmetric
+Hausdorff distance and the RMS error of the round trip.
+
+Used as a command line tool:
+
+python compare_utils.py reference.sur result.sur [--tolerance 1e-5]
+
+The exit status is 1 when the Hausdorff distance exceeds the tolerance.
+"""
+
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+if __package__:
+    from . import sur_utils
+    from .kdtree_utils import KDTree
+else:
+    import sur_utils
+    from kdtree_utils import KDTree
+
+
+SurDiff = namedtuple("SurDiff", (
+    "a_to_b",       # distance of each vertex of A to the nearest vertex of B
+    "b_to_a",       # distance of each vertex of B to the nearest vertex of A
+    "hausdorff",    # symmetric Hausdorff distance
+    "rms",          # RMS of all the distances, both ways
+    ))
+
+
+def nearest_distances(verts, reference):
+    """
+    Return the distance of each vertex of *verts* to the nearest vertex of
+    *reference* (a point array or a KDTree built on it).
+    """
+    if not isinstance(reference, KDTree):
+        reference = KDTree(reference)
+    return reference.query(verts)[0]
+
+
+def compare_points(verts_a, verts_b):
+    """
+    Compare two vertex sets and return a SurDiff.
+    """
+    verts_a = np.asarray(verts_a, dtype=np.float64).reshape(-1, 3)
+    verts_b = np.asarray(verts_b, dtype=np.float64).reshape(-1, 3)
+
+    a_to_b = nearest_distances(verts_a, verts_b)
+    b_to_a = nearest_distances(verts_b, verts_a)
+
+    hausdorff = max(a_to_b.max(initial=0.0), b_to_a.max(initial=0.0))
+    count = len(a_to_b) + len(b_to_a)
+    rms = np.sqrt((np.dot(a_to_b, a_to_b) + np.dot(b_to_a, b_to_a)) / count) if count else 0.0
+
+    return SurDiff(a_to_b, b_to_a, float(hausdorff), float(rms))
+
+
+def compare_sur(filepath_a, filepath_b):
+    """
+    Compare the vertices of two SUR files and return a SurDiff.
+    """
+    verts_a = sur_utils.read_sur(filepath_a).verts
+    verts_b = sur_utils.read_sur(filepath_b).verts
+    return compare_points(verts_a, verts_b)
+
+
+def format_report(diff):
+    lines = []
+    for label, distances in (("A -> B", diff.a_to_b), ("B -> A", diff.b_to_a)):
+        if len(distances):
+            lines.append("%s: %d verts, max %g, mean %g, rms %g" % (
+                label, len(distances), distances.max(), distances.mean(),
+                np.sqrt(np.mean(distances * distances))))
+    lines.append("Hausdorff distance: %g" % diff.hausdorff)
+    lines.append("RMS error: %g" % diff.rms)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare the geometry of two SUR files")
+    parser.add_argument("file_a", help="reference SUR file")
+    parser.add_argument("file_b", help="SUR file to compare with the reference")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="fail when the Hausdorff distance is above this value")
+    args = parser.parse_args(argv)
+
+    diff = compare_sur(args.file_a, args.file_b)
+    print(format_report(diff))
+
+    if args.tolerance is not None and diff.hausdorff > args.tolerance:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
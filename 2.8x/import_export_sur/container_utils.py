@@ -0,0 +1,276 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Binary container for animated SUR meshes (.surs)
+
+The triangles are stored once, then the vertex positions of each frame,
+quantized on a grid of the given precision. A frame is stored either as a
+keyframe (absolute int32 grid coordinates) or as the difference with the
+previous frame, in the smallest of int8 / int16 / int32 which holds it.
+A keyframe is written every KEYFRAME_INTERVAL frames.
+
+Layout (little endian, every block starts on 8 bytes):
+
+    header      magic "SURS", version, vertex count, triangle count,
+                frame count, first frame, keyframe interval, precision,
+                offset of the frame table
+    triangles   int32 (M, 3)
+    frames      per frame: kind (0 key, 1 delta), item size, 6 pad bytes,
+                then the (N, 3) grid coordinates or differences
+    frame table uint64 offset of each frame
+
+Frames are located through the table and decoded from a memory map, one
+vectorized add per frame: sequential playback decodes a single delta, a
+random seek at most KEYFRAME_INTERVAL of them.
+"""
+
+import mmap
+import struct
+
+import numpy as np
+
+MAGIC = b"SURS"
+VERSION = 1
+
+# default grid step of the positions (in file units)
+PRECISION = 1e-4
+
+# frames between two absolute frames (bounds the cost of a seek)
+KEYFRAME_INTERVAL = 30
+
+_HEADER = struct.Struct("<4sIIIIiIdQ4x")
+_RECORD = struct.Struct("<BB6x")
+
+_KEY = 0
+_DELTA = 1
+
+_INT_LIMIT = 1 << 31
+
+
+def _pad(size):
+    return -size % 8
+
+
+class ContainerWriter:
+    """
+    Write the frames of an animated mesh to a SUR container, one frame at
+    a time. All the frames must share the topology of the first one.
+    """
+
+    def __init__(self, filepath, precision=PRECISION, first_frame=0,
+                 keyframe_interval=KEYFRAME_INTERVAL):
+        if precision <= 0.0:
+            raise ValueError("the precision must be positive")
+
+        self.filepath = filepath
+        self.precision = float(precision)
+        self.first_frame = int(first_frame)
+        self.keyframe_interval = max(int(keyframe_interval), 1)
+
+        self.faces = None
+        self._count = 0
+        self._offsets = []
+        self._previous = None
+        self._buffer = None
+        self._file = open(filepath, 'wb')
+
+    def acquire(self, size):
+        """
+        Return a float32 buffer of *size* values for the next frame.
+        """
+        if self._buffer is None or len(self._buffer) != size:
+            self._buffer = np.empty(size, dtype=np.float32)
+        return self._buffer
+
+    def _header(self, table_offset=0):
+        return _HEADER.pack(MAGIC, VERSION, self._count, len(self.faces), len(self._offsets),
+                            self.first_frame, self.keyframe_interval, self.precision,
+                            table_offset)
+
+    def add_frame(self, coords, faces):
+        """
+        Append a frame: *coords* holds the N x 3 vertex coordinates, *faces*
+        the (M, 3) triangles (only stored with the first frame).
+        """
+        coords = np.asarray(coords).reshape(-1)
+        out = self._file
+
+        if self.faces is None:
+            self.faces = np.ascontiguousarray(faces, dtype=np.int32).reshape(-1, 3)
+            self._count = len(coords) // 3
+            out.write(self._header())
+            data = self.faces.tobytes()
+            out.write(data)
+            out.write(bytes(_pad(len(data))))
+        elif len(coords) != 3 * self._count or \
+                (faces is not self.faces and not np.array_equal(faces, self.faces)):
+            raise ValueError("the topology of a SUR container cannot change between frames")
+
+        grid = np.rint(coords / self.precision).astype(np.int64)
+        if len(grid) and np.abs(grid).max() >= _INT_LIMIT:
+            raise ValueError("positions out of range for a precision of %g" % self.precision)
+
+        kind, data = _KEY, grid.astype(np.int32)
+        if self._previous is not None and len(self._offsets) % self.keyframe_interval:
+            delta = grid - self._previous
+            extent = np.abs(delta).max() if len(delta) else 0
+            for dtype in (np.int8, np.int16, np.int32):
+                if extent <= np.iinfo(dtype).max:
+                    kind, data = _DELTA, delta.astype(dtype)
+                    break
+
+        self._offsets.append(out.tell())
+        out.write(_RECORD.pack(kind, data.itemsize))
+        data = data.tobytes()
+        out.write(data)
+        out.write(bytes(_pad(len(data))))
+        self._previous = grid
+
+    def close(self):
+        """
+        Write the frame table and finish the header.
+        """
+        out = self._file
+        if out.closed:
+            return
+        try:
+            if self.faces is None:
+                self.faces = np.zeros((0, 3), dtype=np.int32)
+                out.write(self._header())
+            table_offset = out.tell()
+            out.write(np.asarray(self._offsets, dtype='<u8').tobytes())
+            out.seek(0)
+            out.write(self._header(table_offset))
+        finally:
+            out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ContainerReader:
+    """
+    Decode the frames of a SUR container from a memory map.
+
+    Exposes the same get() / clamp() / close() interface as
+    sequence_utils.FrameCache, frames being numbered from the first frame
+    stored in the file.
+    """
+
+    def __init__(self, filepath, matrix=None):
+        self.filepath = filepath
+        self.matrix = None if matrix is None else np.asarray(matrix, dtype=np.float64)
+
+        with open(filepath, 'rb') as data:
+            self._map = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, count, tri_count, frame_count, first_frame,
+         interval, precision, table_offset) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("%s is not a SUR container" % filepath)
+        if version > VERSION:
+            self.close()
+            raise ValueError("unsupported SUR container version %d" % version)
+
+        self.count = count
+        self.first_frame = first_frame
+        self.precision = precision
+        self.faces = np.frombuffer(self._map, dtype='<i4', count=3 * tri_count,
+                                   offset=_HEADER.size).reshape(-1, 3)
+        if self.matrix is not None and np.linalg.det(self.matrix[:3, :3]) < 0.0:
+            # mirrored: reverse the winding to keep the faces outwards
+            self.faces = np.ascontiguousarray(self.faces[:, ::-1])
+        self.offsets = np.frombuffer(self._map, dtype='<u8', count=frame_count,
+                                     offset=table_offset)
+        # kind of each frame record
+        self.kinds = np.array([self._map[offset] for offset in self.offsets], dtype=np.uint8)
+
+        self._last = None   # (index, grid coordinates) of the last decoded frame
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def clamp(self, frame):
+        """
+        Return the stored frame shown at *frame* (the first / last one
+        outside of the stored range).
+        """
+        return min(max(frame, self.first_frame), self.first_frame + len(self) - 1)
+
+    def _record(self, index):
+        offset = int(self.offsets[index])
+        kind, itemsize = _RECORD.unpack_from(self._map, offset)
+        data = np.frombuffer(self._map, dtype='<i%d' % itemsize, count=3 * self.count,
+                             offset=offset + _RECORD.size)
+        return kind, data
+
+    def grid(self, index):
+        """
+        Return the int64 grid coordinates of the frame at *index*.
+        """
+        if self._last is not None and self._last[0] == index:
+            return self._last[1]
+
+        # start from the last keyframe, or from the last decoded frame when
+        # it lies between that keyframe and the requested one
+        key = int(np.flatnonzero(self.kinds[:index + 1] == _KEY)[-1])
+        if self._last is not None and key <= self._last[0] < index:
+            start, grid = self._last[0] + 1, self._last[1].copy()
+        else:
+            start, grid = key + 1, self._record(key)[1].astype(np.int64)
+
+        for i in range(start, index + 1):
+            grid += self._record(i)[1]
+
+        self._last = (index, grid)
+        return grid
+
+    def frame(self, index):
+        """
+        Return the flat float32 coordinates of the frame at *index*.
+        """
+        verts = self.grid(index) * self.precision
+        if self.matrix is not None:
+            verts = verts.reshape(-1, 3) @ self.matrix[:3, :3].T + self.matrix[:3, 3]
+        return verts.astype(np.float32).ravel()
+
+    def get(self, frame):
+        """
+        Return the (coords, faces) of the stored frame shown at *frame*.
+        """
+        if not len(self):
+            raise ValueError("%s holds no frame" % self.filepath)
+        return self.frame(self.clamp(frame) - self.first_frame), self.faces
+
+    def close(self):
+        self.faces = self.offsets = None
+        self._last = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # decoded arrays still refer to the map, it is freed with them
+                pass
+            self._map = None
@@ -0,0 +1,601 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Quadric error metric (QEM) edge collapse decimation of triangle meshes.
+
+Works directly on vertex/triangle arrays (no bpy), following Garland and
+Heckbert, "Surface Simplification Using Quadric Error Metrics" (1997):
+
+- every vertex accumulates the (area weighted) plane quadrics of its faces,
+  boundary edges get extra perpendicular planes so the outline is kept
+- every edge is scored with the error of collapsing it to the point which
+  minimizes the sum of its end quadrics
+- the cheapest edges are collapsed first, using a heap with lazy removal
+  of the entries made stale by earlier collapses
+
+The setup (quadrics, edges and initial costs) is vectorized with NumPy. The
+greedy collapse loop is scalar, but only touches flat arrays: the triangle
+array itself, a vertex -> face table in CSR form and a "merged into" chain
+per vertex, so no per vertex Python containers are ever built.
+
+Since a scalar loop costs tens of microseconds per collapse, big reductions
+first run vectorized rounds collapsing many independent edges at once and
+only leave the last part of the reduction to the greedy queue.
+"""
+
+import array
+import heapq
+import math
+
+import numpy as np
+
+# quadric coefficient layout for the plane (a, b, c, d):
+# [aa, ab, ac, ad, bb, bc, bd, cc, cd, dd]
+_QUADRIC_INDICES = ((0, 0), (0, 1), (0, 2), (0, 3), (1, 1),
+                    (1, 2), (1, 3), (2, 2), (2, 3), (3, 3))
+
+# weight of the boundary constraint planes relative to the face planes
+BOUNDARY_WEIGHT = 1000.0
+
+# relative determinant under which the optimal collapse position is not solved
+_SINGULAR = 1e-10
+
+# a collapse may turn a face normal by at most acos(_MIN_NORMAL_COS) (about
+# 78 degrees): faces merely not flipping over can still fold steeply into
+# their neighbours
+_MIN_NORMAL_COS = 0.2
+
+# nor may it leave a face less compact than _MIN_COMPACTNESS and than it was
+# (4 * sqrt(3) * area / sum of the squared edges, 1 for an equilateral
+# triangle): needles pushed against a boundary otherwise end up standing in
+# the boundary plane, their normal pointing anywhere
+_MIN_COMPACTNESS = 0.15
+_COMPACTNESS_SCALE = 2.0 * math.sqrt(3.0)
+
+# number of edges scored at once by the vectorized initial pass
+_CHUNK = 1 << 20
+
+# a vectorized collapse round considers the cheapest 1 / _BATCH_FRACTION edges
+# and picks independent edges among them in up to _BATCH_PASSES passes
+_BATCH_FRACTION = 2
+_BATCH_PASSES = 4
+
+# face count (relative to the target) under which the greedy queue takes over
+GREEDY_RATIO = 1.25
+_GREEDY_MIN_FACES = 10000
+
+
+def _plane_quadrics(planes, weights):
+    # (k, 4) planes -> (k, 10) weighted quadric coefficients
+    q = np.empty((len(planes), 10))
+    for k, (i, j) in enumerate(_QUADRIC_INDICES):
+        q[:, k] = planes[:, i] * planes[:, j] * weights
+    return q
+
+
+def _accumulate(quadrics, indices, count):
+    # sum the rows of quadrics into the vertices given by indices
+    out = np.empty((count, 10))
+    for k in range(10):
+        out[:, k] = np.bincount(indices, weights=quadrics[:, k], minlength=count)
+    return out
+
+
+def _vertex_quadrics(verts, faces, preserve_boundary):
+    p0, p1, p2 = verts[faces[:, 0]], verts[faces[:, 1]], verts[faces[:, 2]]
+    normals = np.cross(p1 - p0, p2 - p0)
+    double_area = np.linalg.norm(normals, axis=1)
+    valid = double_area > 0.0
+    normals[valid] /= double_area[valid, None]
+
+    planes = np.empty((len(faces), 4))
+    planes[:, :3] = normals
+    planes[:, 3] = -np.einsum('ij,ij->i', normals, p0)
+
+    face_q = _plane_quadrics(planes, 0.5 * double_area)
+    quadrics = _accumulate(np.repeat(face_q, 3, axis=0), faces.ravel(), len(verts))
+
+    if preserve_boundary:
+        # half edges (i -> j) of face f, in the order f0, f1, ... for each corner
+        heads = faces.ravel()
+        tails = faces[:, [1, 2, 0]].ravel()
+        lo, hi = np.minimum(heads, tails), np.maximum(heads, tails)
+        keys = lo * len(verts) + hi
+        _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+        border = first[counts == 1]
+
+        if len(border):
+            a, b = heads[border], tails[border]
+            edge = verts[b] - verts[a]
+            normal = np.cross(edge, normals[border // 3])
+            length = np.linalg.norm(normal, axis=1)
+            keep = length > 0.0
+            a, b = a[keep], b[keep]
+            normal = normal[keep] / length[keep, None]
+
+            planes = np.empty((len(a), 4))
+            planes[:, :3] = normal
+            planes[:, 3] = -np.einsum('ij,ij->i', normal, verts[a])
+            weights = BOUNDARY_WEIGHT * np.einsum('ij,ij->i', edge[keep], edge[keep])
+
+            border_q = _plane_quadrics(planes, weights)
+            quadrics += _accumulate(np.concatenate((border_q, border_q)),
+                                    np.concatenate((a, b)), len(verts))
+
+    return quadrics
+
+
+def _unique_edges(faces, count):
+    edges = np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]))
+    edges.sort(axis=1)
+    keys = np.unique(edges[:, 0] * count + edges[:, 1])
+    return keys // count, keys % count
+
+
+def _quadric_error(q, p):
+    # q holds the coefficients as rows (10, k), p the points (k, 3)
+    x, y, z = p[:, 0], p[:, 1], p[:, 2]
+    return (q[0] * x * x + 2.0 * q[1] * x * y + 2.0 * q[2] * x * z +
+            2.0 * q[3] * x + q[4] * y * y + 2.0 * q[5] * y * z +
+            2.0 * q[6] * y + q[7] * z * z + 2.0 * q[8] * z + q[9])
+
+
+def _edge_collapses(q, pa, pb):
+    """
+    Vectorized collapse (cost, position) of edges with summed quadrics q and
+    end points pa, pb. Mirrors _collapse_target.
+    """
+    # coefficient rows are contiguous, unlike the columns of q
+    q = np.ascontiguousarray(q.T)
+    q0, q1, q2, q3, q4, q5, q6, q7, q8 = q[:9]
+    c00 = q4 * q7 - q5 * q5
+    c01 = q2 * q5 - q1 * q7
+    c02 = q1 * q5 - q2 * q4
+    det = q0 * c00 + q1 * c01 + q2 * c02
+    trace = q0 + q4 + q7
+    solvable = np.abs(det) > _SINGULAR * trace * trace * trace
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c11 = q0 * q7 - q2 * q2
+        c12 = q1 * q2 - q0 * q5
+        c22 = q0 * q4 - q1 * q1
+        pos = -np.stack((c00 * q3 + c01 * q6 + c02 * q8,
+                         c01 * q3 + c11 * q6 + c12 * q8,
+                         c02 * q3 + c12 * q6 + c22 * q8), axis=1) / det[:, None]
+
+    # reject optimal points far away from the edge
+    pm = 0.5 * (pa + pb)
+    edge = pb - pa
+    offset = pos - pm
+    solvable &= np.einsum('ij,ij->i', offset, offset) <= np.einsum('ij,ij->i', edge, edge)
+
+    cost = _quadric_error(q, pos)
+
+    # fall back to the best of the end points and the middle
+    fallback = np.flatnonzero(~solvable)
+    if len(fallback):
+        qf = q[:, fallback]
+        candidates = (pa[fallback], pb[fallback], pm[fallback])
+        errors = np.stack([_quadric_error(qf, p) for p in candidates])
+        best = errors.argmin(axis=0)
+        cost[fallback] = errors.min(axis=0)
+        pos[fallback] = np.choose(best[:, None], candidates)
+
+    return cost, pos
+
+
+def _collapse_target(q, ax, ay, az, bx, by, bz):
+    """
+    Return (cost, x, y, z) of the best position to collapse the edge with
+    summed quadric q and end points a, b into.
+    """
+    q0, q1, q2, q3, q4, q5, q6, q7, q8, q9 = q
+    mx, my, mz = 0.5 * (ax + bx), 0.5 * (ay + by), 0.5 * (az + bz)
+
+    c00 = q4 * q7 - q5 * q5
+    c01 = q2 * q5 - q1 * q7
+    c02 = q1 * q5 - q2 * q4
+    det = q0 * c00 + q1 * c01 + q2 * c02
+    trace = q0 + q4 + q7
+    if abs(det) > _SINGULAR * trace * trace * trace:
+        c11 = q0 * q7 - q2 * q2
+        c12 = q1 * q2 - q0 * q5
+        c22 = q0 * q4 - q1 * q1
+        x = -(c00 * q3 + c01 * q6 + c02 * q8) / det
+        y = -(c01 * q3 + c11 * q6 + c12 * q8) / det
+        z = -(c02 * q3 + c12 * q6 + c22 * q8) / det
+        dx, dy, dz = x - mx, y - my, z - mz
+        ex, ey, ez = bx - ax, by - ay, bz - az
+        if dx * dx + dy * dy + dz * dz <= ex * ex + ey * ey + ez * ez:
+            # the quadric minimum, no other candidate can do better
+            return (q0 * x * x + 2.0 * q1 * x * y + 2.0 * q2 * x * z + 2.0 * q3 * x +
+                    q4 * y * y + 2.0 * q5 * y * z + 2.0 * q6 * y +
+                    q7 * z * z + 2.0 * q8 * z + q9), x, y, z
+
+    best = None
+    for x, y, z in ((ax, ay, az), (bx, by, bz), (mx, my, mz)):
+        cost = (q0 * x * x + 2.0 * q1 * x * y + 2.0 * q2 * x * z + 2.0 * q3 * x +
+                q4 * y * y + 2.0 * q5 * y * z + 2.0 * q6 * y +
+                q7 * z * z + 2.0 * q8 * z + q9)
+        if best is None or cost < best[0]:
+            best = (cost, x, y, z)
+    return best
+
+
+def _compactness(corners, normals):
+    """
+    Return the compactness of the (n, 3, 3) triangle *corners* with the
+    (unnormalized) *normals*.
+    """
+    edges = corners - np.roll(corners, 1, axis=1)
+    squared = np.einsum('ijk,ijk->i', edges, edges)
+    length = np.sqrt(np.einsum('ij,ij->i', normals, normals))
+    return _COMPACTNESS_SCALE * length / np.maximum(squared, np.finfo(float).tiny)
+
+
+def _batch_collapse(points, quadrics, faces, target_faces, stop_faces):
+    """
+    Collapse edges in vectorized rounds until there are at most *stop_faces*
+    faces left (or no more edge can be collapsed).
+
+    Each round scores all the edges, then collapses at once the cheapest
+    edges whose neighbourhoods do not overlap: an edge is picked only if it
+    has the lowest rank of all the candidate edges touching the faces around
+    its two end points, so every face is changed by at most one collapse.
+    The link condition and the face flip test are checked the same way as in
+    the greedy queue, on all the picked edges at once.
+
+    Updates points and quadrics in place and returns the new faces array.
+    """
+    nv = len(points)
+    vmap = np.arange(nv, dtype=np.int64)
+    rng = np.random.default_rng(0)
+
+    while len(faces) > stop_faces:
+        edges = np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]))
+        edges.sort(axis=1)
+        keys, face_count = np.unique(edges[:, 0] * nv + edges[:, 1], return_counts=True)
+        ea, eb = keys // nv, keys % nv
+        del edges, keys
+
+        cost, pos = _edge_collapses(quadrics[ea] + quadrics[eb], points[ea], points[eb])
+
+        # only the cheapest part of the edges compete in a round, so the result
+        # stays close to the strict cost ordering of the greedy queue
+        needed = (len(faces) - target_faces + 1) // 2
+        count = min(len(ea), max(needed, len(ea) // _BATCH_FRACTION))
+        candidates = np.argpartition(cost, count - 1)[:count] if count < len(ea) else np.arange(len(ea))
+        candidates = candidates[np.argsort(cost[candidates], kind='stable')]
+
+        none = np.iinfo(np.int64).max
+        rank = np.full(len(ea), none, dtype=np.int64)
+        rank[candidates] = rng.permutation(len(candidates))
+
+        # pick the local minima, lock the faces around them and repeat with
+        # the candidates left untouched (a Luby style maximal independent set)
+        picked = []
+        locked = np.zeros(nv, dtype=bool)
+        for _ in range(_BATCH_PASSES):
+            vertex_rank = np.full(nv, none, dtype=np.int64)
+            np.minimum.at(vertex_rank, ea[candidates], rank[candidates])
+            np.minimum.at(vertex_rank, eb[candidates], rank[candidates])
+            face_rank = vertex_rank[faces].min(axis=1)
+            ring_rank = np.full(nv, none, dtype=np.int64)
+            np.minimum.at(ring_rank, faces.ravel(), np.repeat(face_rank, 3))
+
+            minima = candidates[(ring_rank[ea[candidates]] == rank[candidates]) &
+                                (ring_rank[eb[candidates]] == rank[candidates])]
+            if not len(minima):
+                break
+            picked.append(minima)
+
+            ends = np.zeros(nv, dtype=bool)
+            ends[ea[minima]] = True
+            ends[eb[minima]] = True
+            locked[faces[ends[faces].any(axis=1)]] = True
+            candidates = candidates[~(locked[ea[candidates]] | locked[eb[candidates]])]
+            rank[:] = none
+            rank[candidates] = rng.permutation(len(candidates))
+
+        if not picked:
+            break
+        picked = np.concatenate(picked)
+        picked = picked[np.argsort(cost[picked], kind='stable')]
+
+        a, b = ea[picked], eb[picked]
+        owner = np.full(nv, -1, dtype=np.int64)
+        owner[a] = np.arange(len(picked))
+        owner[b] = np.arange(len(picked))
+        rejected = np.zeros(len(picked), dtype=bool)
+
+        # link condition: a and b share exactly as many neighbours as there
+        # are faces on the edge
+        heads = np.concatenate((ea, eb))
+        tails = np.concatenate((eb, ea))
+        ring = owner[heads] >= 0
+        heads, tails = heads[ring], tails[ring]
+        ring = owner[tails] != owner[heads]
+        pairs = owner[heads[ring]] * nv + tails[ring]
+        pairs, pair_count = np.unique(pairs, return_counts=True)
+        common = np.bincount(pairs[pair_count == 2] // nv, minlength=len(picked))
+        rejected |= common != face_count[picked]
+
+        # face flips and folds: normals (and compactness) of the faces moving
+        # with a or b, before and after
+        corner_owner = owner[faces]
+        moving = corner_owner >= 0
+        touched = moving.any(axis=1)
+        t_faces = faces[touched]
+        t_moving = moving[touched]
+        single = t_moving.sum(axis=1) == 1
+        t_faces, t_moving = t_faces[single], t_moving[single]
+        t_owner = corner_owner[touched][single].max(axis=1)
+
+        # a face around a and one around b with the same opposite edge would
+        # become the same face (a closed tetrahedron folding onto itself)
+        opposite = np.sort(np.where(t_moving, nv, t_faces), axis=1)[:, :2]
+        order = np.lexsort((opposite[:, 1], opposite[:, 0], t_owner))
+        same = (t_owner[order[1:]] == t_owner[order[:-1]]) & \
+            (opposite[order[1:]] == opposite[order[:-1]]).all(axis=1)
+        rejected[t_owner[order[1:]][same]] = True
+
+        before = points[t_faces]
+        after = before.copy()
+        after[t_moving] = pos[picked][t_owner]
+        n0 = np.cross(before[:, 1] - before[:, 0], before[:, 2] - before[:, 0])
+        n1 = np.cross(after[:, 1] - after[:, 0], after[:, 2] - after[:, 0])
+        l0 = np.sqrt(np.einsum('ij,ij->i', n0, n0))
+        l1 = np.sqrt(np.einsum('ij,ij->i', n1, n1))
+        c1 = _compactness(after, n1)
+        flipped = (np.einsum('ij,ij->i', n0, n1) <= _MIN_NORMAL_COS * l0 * l1) | \
+            ((c1 < _MIN_COMPACTNESS) & (c1 < _compactness(before, n0)))
+        rejected[np.unique(t_owner[flipped])] = True
+
+        picked = picked[~rejected]
+        if not len(picked):
+            break
+
+        # do not remove more faces than needed
+        removed = np.cumsum(face_count[picked])
+        picked = picked[:np.searchsorted(removed, len(faces) - target_faces) + 1]
+        a, b = ea[picked], eb[picked]
+
+        points[a] = pos[picked]
+        quadrics[a] += quadrics[b]
+        vmap[b] = a
+        faces = vmap[faces]
+        vmap[b] = b
+        faces = faces[(faces[:, 0] != faces[:, 1]) &
+                      (faces[:, 1] != faces[:, 2]) &
+                      (faces[:, 2] != faces[:, 0])]
+
+    return faces
+
+
+def _greedy_collapse(points, quadrics, faces, target_faces):
+    """
+    Collapse edges in strict cost order, cheapest first, until there are at
+    most *target_faces* faces left (or no more edge can be collapsed).
+
+    Returns the new (points, faces) arrays.
+    """
+    nv = len(points)
+
+    # initial costs, sorted once: they form the static part of the queue
+    ea, eb = _unique_edges(faces, nv)
+    costs = np.empty(len(ea))
+    for s in range(0, len(ea), _CHUNK):
+        a, b = ea[s:s + _CHUNK], eb[s:s + _CHUNK]
+        costs[s:s + _CHUNK] = _edge_collapses(quadrics[a] + quadrics[b], points[a], points[b])[0]
+    order = np.argsort(costs, kind='stable')
+    static_cost = array.array('d', costs[order].tobytes())
+    static_a = array.array('q', ea[order].tobytes())
+    static_b = array.array('q', eb[order].tobytes())
+    del costs, order, ea, eb
+
+    # vertex -> faces table (CSR), indexed through the vertex merge chains
+    corner_order = np.argsort(faces.ravel(), kind='stable')
+    vf = array.array('q', (corner_order // 3).tobytes())
+    offsets = np.zeros(nv + 1, dtype=np.int64)
+    np.cumsum(np.bincount(faces.ravel(), minlength=nv), out=offsets[1:])
+    vf_start = array.array('q', offsets.tobytes())
+    del corner_order, offsets
+
+    # chain_next holds the next merged vertex + 1 (0 ends the chain)
+    chain_next = array.array('q', bytes(8 * nv))
+    chain_tail = array.array('q', np.arange(nv, dtype=np.int64).tobytes())
+
+    tri = array.array('q', np.ascontiguousarray(faces, dtype=np.int64).tobytes())
+    face_alive = bytearray(b'\x01') * len(faces)
+    q = array.array('d', np.ascontiguousarray(quadrics).tobytes())
+    pos = array.array('d', np.ascontiguousarray(points).tobytes())
+
+    # collapse counter per vertex; a queue entry is only valid if the stamps
+    # of both its vertices did not change since it was queued
+    stamp = array.array('q', bytes(8 * nv))
+    heap = []
+    compact_limit = 1 << 20
+
+    def vertex_faces(v):
+        found = []
+        u = v + 1
+        while u:
+            u -= 1
+            for i in range(vf_start[u], vf_start[u + 1]):
+                f = vf[i]
+                if face_alive[f]:
+                    found.append(f)
+            u = chain_next[u]
+        return found
+
+    def flips(f, moved, x, y, z):
+        # does moving vertex *moved* of face f to (x, y, z) flip the face ?
+        i, j, k = tri[3 * f], tri[3 * f + 1], tri[3 * f + 2]
+        if moved == j:
+            i, j, k = j, k, i
+        elif moved == k:
+            i, j, k = k, i, j
+        jx, jy, jz = pos[3 * j], pos[3 * j + 1], pos[3 * j + 2]
+        kx, ky, kz = pos[3 * k] - jx, pos[3 * k + 1] - jy, pos[3 * k + 2] - jz
+        ux, uy, uz = pos[3 * i] - jx, pos[3 * i + 1] - jy, pos[3 * i + 2] - jz
+        vx, vy, vz = x - jx, y - jy, z - jz
+        # normals of (j, k, i) before and after the move
+        ax, ay, az = ky * uz - kz * uy, kz * ux - kx * uz, kx * uy - ky * ux
+        bx, by, bz = ky * vz - kz * vy, kz * vx - kx * vz, kx * vy - ky * vx
+        la = math.sqrt(ax * ax + ay * ay + az * az)
+        lb = math.sqrt(bx * bx + by * by + bz * bz)
+        if ax * bx + ay * by + az * bz <= _MIN_NORMAL_COS * la * lb:
+            return True
+        # compactness before and after, against the sums of squared edges
+        kk = kx * kx + ky * ky + kz * kz
+        su = kk + ux * ux + uy * uy + uz * uz + (ux - kx) ** 2 + (uy - ky) ** 2 + (uz - kz) ** 2
+        sv = kk + vx * vx + vy * vy + vz * vz + (vx - kx) ** 2 + (vy - ky) ** 2 + (vz - kz) ** 2
+        return _COMPACTNESS_SCALE * lb < _MIN_COMPACTNESS * sv and lb * su < la * sv
+
+    alive_faces = len(faces)
+    si, ns = 0, len(static_cost)
+
+    while alive_faces > target_faces:
+        if si < ns and (not heap or static_cost[si] <= heap[0][0]):
+            a, b = static_a[si], static_b[si]
+            si += 1
+            if stamp[a] or stamp[b]:
+                continue
+        elif heap:
+            _, a, b, sa, sb = heapq.heappop(heap)
+            if stamp[a] != sa or stamp[b] != sb:
+                continue
+        else:
+            break
+
+        fa = vertex_faces(a)
+        fb = vertex_faces(b)
+
+        # link condition: the only vertices shared by the two rings are the
+        # opposite corners of the faces being removed, and no edge is opposite
+        # to both a and b (the faces would become duplicates)
+        ring_a = set()
+        shared = []
+        link_a = set()
+        for f in fa:
+            corners = tri[3 * f:3 * f + 3]
+            ring_a.update(corners)
+            if b in corners:
+                shared.append(f)
+            else:
+                link_a.add(frozenset(corners) - {a})
+        ring_b = set()
+        link_b = set()
+        for f in fb:
+            corners = tri[3 * f:3 * f + 3]
+            ring_b.update(corners)
+            if a not in corners:
+                link_b.add(frozenset(corners) - {b})
+        if not shared or len(ring_a & ring_b) != len(shared) + 2 or link_a & link_b:
+            continue
+
+        qab = [q[10 * a + k] + q[10 * b + k] for k in range(10)]
+        _, x, y, z = _collapse_target(qab, *pos[3 * a:3 * a + 3], *pos[3 * b:3 * b + 3])
+
+        shared_set = set(shared)
+        if any(flips(f, a, x, y, z) for f in fa if f not in shared_set) or \
+           any(flips(f, b, x, y, z) for f in fb if f not in shared_set):
+            continue
+
+        # collapse b into a
+        for f in shared:
+            face_alive[f] = 0
+        alive_faces -= len(shared)
+        for f in fb:
+            if f not in shared_set:
+                for c in (3 * f, 3 * f + 1, 3 * f + 2):
+                    if tri[c] == b:
+                        tri[c] = a
+
+        pos[3 * a], pos[3 * a + 1], pos[3 * a + 2] = x, y, z
+        q[10 * a:10 * a + 10] = array.array('d', qab)
+        chain_next[chain_tail[a]] = b + 1
+        chain_tail[a] = chain_tail[b]
+        stamp[a] += 1
+        stamp[b] = -1
+
+        # queue the edges around the collapsed vertex with their new cost
+        sa = stamp[a]
+        ring_a |= ring_b
+        ring_a.discard(a)
+        ring_a.discard(b)
+        for c in ring_a:
+            qc = [qab[k] + q[10 * c + k] for k in range(10)]
+            cost = _collapse_target(qc, x, y, z, *pos[3 * c:3 * c + 3])[0]
+            heapq.heappush(heap, (cost, a, c, sa, stamp[c]))
+
+        if len(heap) > compact_limit:
+            heap = [e for e in heap if stamp[e[1]] == e[3] and stamp[e[2]] == e[4]]
+            heapq.heapify(heap)
+            compact_limit = max(2 * len(heap), 1 << 20)
+
+    tris = np.frombuffer(tri, dtype=np.int64).reshape(-1, 3)
+    tris = tris[np.frombuffer(face_alive, dtype=np.uint8).astype(bool)]
+    return np.frombuffer(pos, dtype=np.float64).reshape(-1, 3), tris
+
+
+def decimate(verts, faces, target_faces, preserve_boundary=True, greedy_ratio=GREEDY_RATIO):
+    """
+    Decimate the triangle mesh (verts, faces) down to at most *target_faces*
+    triangles with quadric error metric edge collapses.
+
+    Large meshes are first reduced with vectorized collapse rounds down to
+    *greedy_ratio* times the target, the heap based greedy queue then does
+    the last collapses in strict cost order.
+
+    Collapses which would flip a face (or fold it steeply, or leave a needle)
+    or make the surface non-manifold are skipped (a closed component keeps at least the 4 faces of a
+    tetrahedron), so the result can keep more triangles than asked for when
+    the mesh cannot be simplified further.
+
+    Returns the new (verts, faces) arrays with unused vertices removed.
+    """
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    target_faces = max(int(target_faces), 0)
+
+    if len(faces) <= target_faces or not len(verts):
+        return verts.copy(), faces.copy()
+
+    # work in a unit box so the error thresholds do not depend on the scale
+    origin = verts.min(axis=0)
+    scale = float((verts.max(axis=0) - origin).max()) or 1.0
+    points = (verts - origin) / scale
+
+    quadrics = _vertex_quadrics(points, faces, preserve_boundary)
+
+    stop_faces = max(int(target_faces * greedy_ratio), target_faces + _GREEDY_MIN_FACES)
+    if len(faces) > stop_faces:
+        faces = _batch_collapse(points, quadrics, faces, target_faces, stop_faces)
+
+    points, faces = _greedy_collapse(points, quadrics, faces, target_faces)
+
+    # drop the vertices no face refers to anymore
+    used = np.zeros(len(points), dtype=bool)
+    used[faces.ravel()] = True
+    remap = np.cumsum(used) - 1
+
+    return points[used] * scale + origin, remap[faces]
@@ -0,0 +1,188 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Vectorized KD-tree for nearest point queries on large point sets.
+
+The tree is balanced and implicit (node i has the children 2i+1 and 2i+2),
+every leaf holds the same number of points. It is built one level at a time
+with a partition of all the nodes of the level at once, and queried by
+batches of points, walking the tree one level at a time for all the pending
+(query, node) pairs, so there is no per point Python code.
+"""
+
+import numpy as np
+
+# points per leaf
+LEAF_SIZE = 16
+
+# queries processed at once (bounds the temporary memory)
+_QUERY_CHUNK = 1 << 18
+
+
+class KDTree:
+    """
+    Balanced KD-tree over an (N, 3) array of points.
+    """
+
+    __slots__ = ("points", "depth", "leaf_size", "order", "leaf_points",
+                 "split_axis", "split_value", "box_min", "box_max")
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 3)
+        if not len(points):
+            raise ValueError("cannot build a KD-tree without points")
+
+        self.points = points
+        self.leaf_size = max(int(leaf_size), 1)
+
+        count = len(points)
+        depth = 0
+        while (self.leaf_size << depth) < count:
+            depth += 1
+        self.depth = depth
+
+        # pad with copies of the first point so that all the leaves are full,
+        # a padded entry still refers to a real point
+        order = np.zeros(self.leaf_size << depth, dtype=np.int64)
+        order[:count] = np.arange(count)
+
+        inner = (1 << depth) - 1
+        self.split_axis = np.zeros(inner, dtype=np.int8)
+        self.split_value = np.zeros(inner)
+
+        # coordinates per axis, so the extents are reduced over contiguous rows
+        axes = np.ascontiguousarray(points.T)
+
+        for level in range(depth):
+            rows = order.reshape(1 << level, -1)
+            coords = np.stack([axis_coords[rows] for axis_coords in axes])
+            axis = (coords.max(axis=2) - coords.min(axis=2)).argmax(axis=0)
+            values = coords[axis[:, None], np.arange(len(rows))[:, None], np.arange(rows.shape[1])]
+            del coords
+
+            half = rows.shape[1] // 2
+            part = np.argpartition(values, half, axis=1)
+            rows[:] = np.take_along_axis(rows, part, axis=1)
+
+            nodes = slice((1 << level) - 1, (2 << level) - 1)
+            self.split_axis[nodes] = axis
+            self.split_value[nodes] = np.take_along_axis(values, part[:, half:half + 1], axis=1)[:, 0]
+
+        self.order = order.reshape(1 << depth, self.leaf_size)
+        # the points stored leaf by leaf, so a leaf is read as one block
+        self.leaf_points = leaf_points = points[self.order]
+
+        # bounding boxes of all the nodes, leaves first then up the tree
+        box_min = np.empty(((2 << depth) - 1, 3))
+        box_max = np.empty(((2 << depth) - 1, 3))
+        box_min[inner:] = leaf_points.min(axis=1)
+        box_max[inner:] = leaf_points.max(axis=1)
+        for level in range(depth - 1, -1, -1):
+            nodes = np.arange((1 << level) - 1, (2 << level) - 1)
+            box_min[nodes] = np.minimum(box_min[2 * nodes + 1], box_min[2 * nodes + 2])
+            box_max[nodes] = np.maximum(box_max[2 * nodes + 1], box_max[2 * nodes + 2])
+        self.box_min = box_min
+        self.box_max = box_max
+
+    def __len__(self):
+        return len(self.points)
+
+    def _leaf_nearest(self, queries, leaves):
+        # nearest point (squared distance, index) of each query in its leaf
+        delta = self.leaf_points[leaves] - queries[:, None, :]
+        d2 = np.einsum('ijk,ijk->ij', delta, delta)
+        best = d2.argmin(axis=1)
+        rows = np.arange(len(queries))
+        return d2[rows, best], self.order[leaves, best]
+
+    def _query_chunk(self, queries):
+        inner = (1 << self.depth) - 1
+        rows = np.arange(len(queries))
+
+        # first guess: the nearest point in the leaf containing the query
+        path = np.zeros((self.depth + 1, len(queries)), dtype=np.int64)
+        for level in range(self.depth):
+            node = path[level]
+            right = queries[rows, self.split_axis[node]] >= self.split_value[node]
+            path[level + 1] = 2 * node + 1 + right
+        best_d2, best_index = self._leaf_nearest(queries, path[-1] - inner)
+
+        # the search only has to start from the deepest node whose cell
+        # (bounded by the split planes above it) contains the whole ball
+        # around the query, a query whose ball fits in its leaf is done
+        radius = np.sqrt(best_d2)
+        lo = queries - radius[:, None]
+        hi = queries + radius[:, None]
+        start = np.zeros(len(queries), dtype=np.int64)
+        inside = np.ones(len(queries), dtype=bool)
+        for level in range(self.depth):
+            node = path[level]
+            axis = self.split_axis[node]
+            value = self.split_value[node]
+            right = path[level + 1] == 2 * node + 2
+            # the ball must stay on the side of the split plane of the query
+            inside &= np.where(right, lo[rows, axis] >= value, hi[rows, axis] < value)
+            start += inside
+
+        # then visit every leaf whose box is closer than the best distance
+        pairs_q = np.zeros(0, dtype=np.int64)
+        pairs_node = np.zeros(0, dtype=np.int64)
+        for level in range(self.depth + 1):
+            if level:
+                pairs_q = np.repeat(pairs_q, 2)
+                pairs_node = 2 * np.repeat(pairs_node, 2) + np.tile((1, 2), len(pairs_node))
+                p = queries[pairs_q]
+                gap = np.maximum(self.box_min[pairs_node] - p, 0.0) + \
+                    np.maximum(p - self.box_max[pairs_node], 0.0)
+                near = np.einsum('ij,ij->i', gap, gap) < best_d2[pairs_q]
+                pairs_q, pairs_node = pairs_q[near], pairs_node[near]
+
+            if level < self.depth:
+                begin = np.flatnonzero(start == level)
+                pairs_q = np.concatenate((pairs_q, begin))
+                pairs_node = np.concatenate((pairs_node, path[level, begin]))
+
+        # the leaf of the first guess was already searched
+        again = pairs_node == path[-1, pairs_q]
+        pairs_q, pairs_node = pairs_q[~again], pairs_node[~again]
+
+        if len(pairs_q):
+            d2, index = self._leaf_nearest(queries[pairs_q], pairs_node - inner)
+            np.minimum.at(best_d2, pairs_q, d2)
+            won = d2 == best_d2[pairs_q]
+            best_index[pairs_q[won]] = index[won]
+
+        return best_d2, best_index
+
+    def query(self, queries):
+        """
+        Return the (distances, indices) of the nearest tree point of each
+        point in the (M, 3) array *queries*.
+        """
+        queries = np.ascontiguousarray(queries, dtype=np.float64).reshape(-1, 3)
+        d2 = np.empty(len(queries))
+        index = np.empty(len(queries), dtype=np.int64)
+
+        for start in range(0, len(queries), _QUERY_CHUNK):
+            chunk = slice(start, start + _QUERY_CHUNK)
+            d2[chunk], index[chunk] = self._query_chunk(queries[chunk])
+
+        return np.sqrt(d2), index
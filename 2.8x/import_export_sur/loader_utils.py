@@ -0,0 +1,223 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Parsing stage of the SUR import (no blender needed)
+
+SurLoader reads the files and prepares their geometry (vertex reordering,
+duplicate detection, comparison with a reference) so that only the mesh
+creation is left to blender. It runs either synchronously or on a worker
+thread reporting its progress, which can be cancelled.
+"""
+
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+if __package__:
+    from . import sur_utils
+    from . import mesh_utils
+    from . import compare_utils
+    from . import bvh_utils
+    from . import plan_utils
+else:
+    import sur_utils
+    import mesh_utils
+    import compare_utils
+    import bvh_utils
+    import plan_utils
+
+
+SurRecord = namedtuple("SurRecord", (
+    "path",
+    "verts",        # (N, 3) vertex coordinates
+    "faces",        # (M, 3) triangle vertex indices
+    "norms",        # facet normals, or None
+    "loop_normals", # (3 * M, 3) smooth face corner normals, or None
+    "key",          # geometry fingerprint (when sharing meshes), or None
+    "duplicate",    # same geometry as an earlier record of this import
+    "error",        # distance of each vertex to the reference, or None
+    "tiles",        # [(cell, vertex_indices, faces, face_indices), ...], or None
+    "offset",       # float64 origin subtracted from verts (recentering), or None
+    ))
+
+
+class Cancelled(Exception):
+    pass
+
+
+class SurLoader:
+    """
+    Read a list of SUR files for import.
+    """
+
+    def __init__(self, paths, matrix=None, use_facet_normal=False, use_shared_mesh=True,
+                 use_morton_order=False, compare_path="", feature_angle=None,
+                 tile_divisions=0, tile_axes=3, use_bvh=False, plans=None, dtype=None,
+                 use_recenter=False):
+        self.paths = list(paths)
+        # 4x4 transformation applied to the read geometry
+        self.matrix = matrix
+        self.use_facet_normal = use_facet_normal
+        self.use_shared_mesh = use_shared_mesh
+        self.use_morton_order = use_morton_order
+        self.compare_path = compare_path
+        # smooth normals split above this angle (radians), None for flat shading
+        self.feature_angle = feature_angle
+        # split the meshes into a grid of tiles (see mesh_utils.tile_faces)
+        self.tile_divisions = tile_divisions
+        self.tile_axes = tile_axes
+        # save the BVH of each file next to it (see bvh_utils)
+        self.use_bvh = use_bvh
+        # plan_utils.Plan of each path (FULL strategy for all when None)
+        self.plans = plans
+        # type of the parsed coordinates (see sur_utils.read_sur)
+        self.dtype = dtype
+        # subtract the center of the first mesh from all the meshes, the
+        # files being read in float64 until then
+        self.use_recenter = use_recenter
+        self.origin = None
+
+        # progress of the reading, in [0, 1], and the file being read
+        self.progress = 0.0
+        self.current = None
+
+        self._sizes = [os.path.getsize(path) if os.path.exists(path) else 0
+                       for path in self.paths]
+        self._cancel = threading.Event()
+        self._thread = None
+        self._records = None
+        self._error = None
+
+    def _check(self):
+        if self._cancel.is_set():
+            raise Cancelled()
+
+    def run(self):
+        """
+        Read all the files and return their SurRecord list.
+        """
+        reference = None
+        if self.compare_path:
+            reference = compare_utils.KDTree(sur_utils.read_sur(self.compare_path).verts)
+
+        total = sum(self._sizes) or 1
+        done = 0
+        records = []
+        seen = set()
+
+        for index, (path, size) in enumerate(zip(self.paths, self._sizes)):
+            self.current = path
+            self._check()
+            plan = self.plans[index] if self.plans is not None else None
+            strategy = plan.strategy if plan is not None else 'FULL'
+
+            def progress(fraction, done=done, size=size):
+                self.progress = (done + fraction * size) / total
+                self._check()
+
+            mesh = sur_utils.read_sur(path, progress, chunked=strategy != 'FULL',
+                                      dtype='float64' if self.use_recenter else self.dtype)
+            verts, faces = mesh.verts, mesh.faces
+            norms = mesh.norms if self.use_facet_normal else None
+
+            if self.use_bvh and mesh.face_count:
+                # in file coordinates, built only if missing or out of date
+                bvh_utils.load_or_build(path, verts, faces).close()
+
+            key = None
+            duplicate = False
+            if self.use_shared_mesh:
+                key = sur_utils.mesh_fingerprint(mesh)
+                if strategy == 'PROXY':
+                    key += ":proxy%d" % plan.proxy_faces
+                duplicate = key in seen
+                seen.add(key)
+
+            # the geometry of a duplicate is not used
+            error = None
+            loop_normals = None
+            tiles = None
+            if not duplicate:
+                if strategy == 'PROXY':
+                    verts, faces = mesh_utils.cluster_vertices(
+                            verts, faces, plan_utils.proxy_cells(plan.proxy_faces))
+                    norms = None
+                if self.use_morton_order:
+                    verts, faces = mesh_utils.morton_reorder(verts, faces)
+                if reference is not None:
+                    error = compare_utils.nearest_distances(verts, reference)
+                if self.matrix is not None:
+                    verts, faces, norms = mesh_utils.transform_mesh(verts, faces, self.matrix, norms)
+                if self.use_recenter and len(verts):
+                    if self.origin is None:
+                        self.origin = (verts.min(axis=0).astype(np.float64) +
+                                       verts.max(axis=0)) / 2.0
+                    # small again: back to the bulk precision
+                    verts = (verts - self.origin).astype(self.dtype or np.float32)
+                if self.feature_angle is not None:
+                    loop_normals = mesh_utils.split_normals(verts, faces, self.feature_angle)
+                if self.tile_divisions and strategy != 'PROXY':
+                    tiles = [(cell,) + mesh_utils.submesh(faces, face_indices) + (face_indices,)
+                             for cell, face_indices in mesh_utils.tile_faces(
+                                 verts, faces, self.tile_divisions, self.tile_axes)]
+
+            records.append(SurRecord(path, verts, faces, norms, loop_normals, key, duplicate,
+                                     error, tiles,
+                                     self.origin if self.use_recenter else None))
+            done += size
+            self.progress = done / total
+
+        return records
+
+    def start(self):
+        """
+        Run on a worker thread, see done and result().
+        """
+        def work():
+            try:
+                self._records = self.run()
+            except BaseException as error:
+                self._error = error
+
+        self._thread = threading.Thread(target=work, name="sur_import", daemon=True)
+        self._thread.start()
+
+    @property
+    def done(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+    def cancel(self):
+        """
+        Ask the worker thread to stop at the next progress report.
+        """
+        self._cancel.set()
+
+    def result(self):
+        """
+        Return the records read by the worker thread, raising its error if
+        it failed.
+        """
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._records
@@ -0,0 +1,393 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Array based mesh operations used by the SUR import/export pipeline.
+
+All functions work on NumPy arrays (verts: (N, 3) floats, faces: (M, 3) ints)
+and do not depend on bpy, so they can be used outside of blender.
+"""
+
+import numpy as np
+
+
+def merge_meshes(meshes):
+    """
+    Merge a sequence of (verts, faces) into a single (verts, faces), the face
+    indices of each mesh being offset by the vertex count of the previous ones.
+    """
+    meshes = list(meshes)
+    if not meshes:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+
+    offsets = np.cumsum([0] + [len(v) for v, f in meshes[:-1]])
+    verts = np.concatenate([np.asarray(v).reshape(-1, 3) for v, f in meshes])
+    faces = np.concatenate([np.asarray(f, dtype=np.int64).reshape(-1, 3) + offset
+                            for (v, f), offset in zip(meshes, offsets)])
+    return verts, faces
+
+
+def compact_vertices(verts, faces):
+    """
+    Drop the vertices which no face references.
+
+    Returns the remaining (verts, faces), the face indices being remapped
+    and the vertices keeping their order.
+    """
+    verts = np.asarray(verts).reshape(-1, 3)
+    faces = np.asarray(faces).reshape(-1, 3)
+
+    used = np.zeros(len(verts), dtype=bool)
+    used[faces.ravel()] = True
+    if used.all():
+        return verts, faces
+
+    remap = np.cumsum(used, dtype=np.int64) - 1
+    return verts[used], remap[faces].astype(faces.dtype)
+
+
+def weld_vertices(verts, faces):
+    """
+    Merge the vertices with exactly the same coordinates, keeping the first
+    of each, and remove the faces collapsed by the merge and the faces made
+    identical by it (same vertices, the first one keeping its winding).
+
+    Returns the welded (verts, faces).
+    """
+    verts = np.asarray(verts).reshape(-1, 3)
+    faces = np.asarray(faces).reshape(-1, 3)
+    if not len(verts):
+        return verts, faces
+
+    # compare the coordinates as raw bytes (+ 0.0 turns -0.0 into 0.0)
+    rows = np.ascontiguousarray(verts + verts.dtype.type(0.0))
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * 3))).ravel()
+    unique, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    if len(unique) == len(verts):
+        return verts, faces
+
+    # number the merged vertices in the order of their first occurrence
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    remap = rank[inverse.ravel()]
+
+    faces = remap[faces].astype(faces.dtype)
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])
+    faces = faces[keep]
+
+    # the first of the faces over the same vertices (both sorts are stable),
+    # the sorted corners packed in one key when they fit in 63 bits
+    rows = np.sort(faces, axis=1).astype(np.int64)
+    count = len(first)
+    if count < 1 << 21:
+        order = np.argsort((rows[:, 0] * count + rows[:, 1]) * count + rows[:, 2], kind='stable')
+    else:
+        order = np.lexsort((rows[:, 2], rows[:, 1], rows[:, 0]))
+    rows = rows[order]
+    distinct = np.ones(len(rows), dtype=bool)
+    distinct[1:] = (rows[1:] != rows[:-1]).any(axis=1)
+    return verts[np.sort(first)], faces[np.sort(order[distinct])]
+
+
+def cluster_vertices(verts, faces, cells):
+    """
+    Simplify a mesh by vertex clustering: the vertices are merged per cell of
+    a uniform grid with *cells* cells along its largest extent, at the mean
+    of their positions, and the collapsed and duplicated faces are removed.
+
+    A surface gives about 2 * cells ** 2 triangles. Returns (verts, faces).
+    """
+    verts = np.asarray(verts).reshape(-1, 3)
+    faces = np.asarray(faces).reshape(-1, 3)
+    if not len(faces):
+        return verts[:0], faces
+
+    cells = max(int(cells), 1)
+    lo = verts.min(axis=0)
+    size = float((verts.max(axis=0) - lo).max()) / cells
+    if size <= 0.0:
+        size = 1.0
+
+    grid = np.minimum(((verts - lo) / size).astype(np.int64), cells - 1)
+    keys = np.ravel_multi_index(tuple(grid.T), tuple(grid.max(axis=0) + 1))
+    del grid
+    used, labels = np.unique(keys, return_inverse=True)
+    labels = labels.ravel()
+    del keys
+
+    counts = np.bincount(labels, minlength=len(used))
+    points = np.stack([np.bincount(labels, weights=verts[:, axis], minlength=len(used))
+                       for axis in range(3)], axis=1) / counts[:, None]
+
+    faces = labels[faces]
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])
+    faces = faces[keep]
+
+    # the same triangle starting from its smallest index, keeping the winding
+    start = faces.argmin(axis=1)[:, None]
+    faces = np.take_along_axis(faces, (start + np.arange(3)) % 3, axis=1)
+    rows = np.ascontiguousarray(faces)
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * 3))).ravel()
+    first = np.unique(keys, return_index=True)[1]
+    faces = faces[np.sort(first)]
+
+    verts, faces = compact_vertices(points.astype(verts.dtype), faces)
+    return verts, faces.astype(np.int32)
+
+
+def tile_faces(verts, faces, divisions, axes=3):
+    """
+    Bin the faces into a uniform grid of tiles by their centroid.
+
+    The tiles are cubes (squares over X and Y, as columns, when *axes* is 2)
+    whose size is the largest extent of the centroids divided by
+    *divisions*. Returns the sorted [(cell, face_indices), ...] of the
+    non empty tiles, cell being the integer grid coordinates of the tile.
+    """
+    verts = np.asarray(verts).reshape(-1, 3)
+    faces = np.asarray(faces).reshape(-1, 3)
+    if not len(faces):
+        return []
+
+    # centroids one axis at a time, to avoid a (M, 3, 3) temporary
+    centroids = np.stack([(verts[faces[:, 0], axis] + verts[faces[:, 1], axis] +
+                           verts[faces[:, 2], axis]) / 3.0 for axis in range(axes)], axis=1)
+    lo = centroids.min(axis=0)
+    size = (centroids.max(axis=0) - lo).max() / max(int(divisions), 1)
+    if size <= 0.0:
+        size = 1.0
+
+    cells = np.minimum(((centroids - lo) / size).astype(np.int64), max(int(divisions), 1) - 1)
+    shape = tuple(cells.max(axis=0) + 1)
+    ids = np.ravel_multi_index(tuple(cells.T), shape)
+
+    order = np.argsort(ids, kind='stable')
+    ids = ids[order]
+    starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+    groups = np.split(order, starts[1:])
+
+    return [(tuple(int(c) for c in np.unravel_index(ids[start], shape)), group)
+            for start, group in zip(starts, groups)]
+
+
+def submesh(faces, face_indices):
+    """
+    Extract the faces *face_indices* with their own compact vertex numbering.
+
+    Returns (vertex_indices, faces): the original index of each vertex of
+    the submesh, in their original order, and the renumbered faces.
+    """
+    faces = np.asarray(faces).reshape(-1, 3)[face_indices]
+    vertex_indices, inverse = np.unique(faces, return_inverse=True)
+    return vertex_indices, inverse.reshape(-1, 3).astype(faces.dtype)
+
+
+def transform_points(points, matrix):
+    """
+    Return the (N, 3) *points* transformed by the 4x4 *matrix* (nested
+    sequences, a mathutils.Matrix or an array) in one batched multiply.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    points = np.asarray(points).reshape(-1, 3)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def transform_mesh(verts, faces, matrix, normals=None):
+    """
+    Transform a mesh by the 4x4 *matrix*.
+
+    A matrix with a negative determinant mirrors the mesh, the winding of
+    the faces is then reversed so that they keep facing outwards. The facet
+    *normals*, if any, are transformed by the inverse transpose.
+
+    Returns (verts, faces, normals).
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    linear = matrix[:3, :3]
+
+    verts = transform_points(verts, matrix)
+    faces = np.asarray(faces).reshape(-1, 3)
+    if np.linalg.det(linear) < 0.0:
+        faces = faces[:, ::-1]
+
+    if normals is not None and len(normals):
+        normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3) @ np.linalg.inv(linear)
+        lengths = np.linalg.norm(normals, axis=1)
+        normals /= np.where(lengths > 0.0, lengths, 1.0)[:, None]
+
+    return verts, faces, normals
+
+
+def face_normals(verts, faces):
+    """
+    Return the normal of each face scaled by twice its area.
+    """
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+    corners = verts[np.asarray(faces).reshape(-1, 3)]
+    return np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+
+
+def manifold_edges(faces):
+    """
+    Return the (h1, h2) pairs of half edges of the edges shared by exactly
+    two triangles.
+
+    Half edge h = 3 * f + k goes from vertex faces[f, k] to faces[f, k + 1],
+    the edges are grouped by sorting their vertex pairs.
+    """
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    start = faces.ravel()
+    end = faces[:, (1, 2, 0)].ravel()
+    lo = np.minimum(start, end)
+    hi = np.maximum(start, end)
+
+    order = np.lexsort((hi, lo))
+    lo, hi = lo[order], hi[order]
+    # first half edge of each group of equal edges
+    first = np.flatnonzero(np.concatenate(([True], (lo[1:] != lo[:-1]) | (hi[1:] != hi[:-1]))))
+    sizes = np.diff(np.append(first, len(order)))
+
+    pairs = first[sizes == 2]
+    return order[pairs], order[pairs + 1]
+
+
+def _components(count, i, j):
+    # label of the connected component of each of the count nodes linked by
+    # the (i, j) pairs: the smallest node of the component (min propagation
+    # along the links with pointer jumping)
+    labels = np.arange(count)
+    while True:
+        low = np.minimum(labels[i], labels[j])
+        update = labels.copy()
+        np.minimum.at(update, i, low)
+        np.minimum.at(update, j, low)
+        update = update[update]
+        if np.array_equal(update, labels):
+            return labels
+        labels = update
+
+
+def split_normals(verts, faces, feature_angle=np.pi):
+    """
+    Return the (3 * M, 3) float32 normal of each face corner.
+
+    Normals are area weighted averages of the normals of the faces around
+    a vertex, which are split at the edges whose dihedral angle is above
+    *feature_angle* (radians) and at the boundary and non manifold edges.
+    """
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    weighted = face_normals(verts, faces)
+    if not len(faces):
+        return np.zeros((0, 3), dtype=np.float32)
+
+    lengths = np.linalg.norm(weighted, axis=1)
+    unit = weighted / np.where(lengths > 0.0, lengths, 1.0)[:, None]
+
+    h1, h2 = manifold_edges(faces)
+    f1, f2 = h1 // 3, h2 // 3
+    smooth = np.einsum('ij,ij->i', unit[f1], unit[f2]) >= np.cos(min(feature_angle, np.pi))
+    h1, h2 = h1[smooth], h2[smooth]
+
+    # corners sharing a vertex across a smooth edge belong to the same fan
+    corners = faces.ravel()
+    following = h1 - h1 % 3 + (h1 + 1) % 3
+    other = h2 - h2 % 3 + (h2 + 1) % 3
+    a, b = corners[h1], corners[following]
+    i = np.concatenate((h1, following))
+    j = np.concatenate((np.where(corners[h2] == a, h2, other),
+                        np.where(corners[h2] == b, h2, other)))
+    labels = _components(len(corners), i, j)
+
+    corner_normals = np.repeat(weighted, 3, axis=0)
+    sums = np.stack([np.bincount(labels, weights=corner_normals[:, axis], minlength=len(corners))
+                     for axis in range(3)], axis=1)
+    normals = sums[labels]
+    lengths = np.linalg.norm(normals, axis=1)
+    normals /= np.where(lengths > 0.0, lengths, 1.0)[:, None]
+
+    return normals.astype(np.float32)
+
+
+def _part1by2(x):
+    # spread the lower 21 bits of x so that there are two zero bits
+    # between each of them (x, y, z bits are then interleaved by shifting)
+    x = x.astype(np.uint64) & np.uint64(0x1fffff)
+    x = (x | (x << np.uint64(32))) & np.uint64(0x001f00000000ffff)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x001f0000ff0000ff)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return x
+
+
+def morton_codes(verts, bits=21):
+    """
+    Return the 3D Morton (Z-order) code of each vertex.
+
+    The vertices are quantized over their bounding box using *bits* bits
+    per axis (at most 21, so that the interleaved code fits in 64 bits).
+    """
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+    if not len(verts):
+        return np.zeros(0, dtype=np.uint64)
+
+    bits = min(max(int(bits), 1), 21)
+    lo = verts.min(axis=0)
+    extent = verts.max(axis=0) - lo
+    extent[extent == 0.0] = 1.0
+
+    cells = (1 << bits) - 1
+    q = ((verts - lo) * (cells / extent)).astype(np.uint64)
+
+    return (_part1by2(q[:, 0]) |
+            (_part1by2(q[:, 1]) << np.uint64(1)) |
+            (_part1by2(q[:, 2]) << np.uint64(2)))
+
+
+def morton_order(verts, bits=21):
+    """
+    Return the permutation which sorts *verts* along a Z-order curve.
+    """
+    return np.argsort(morton_codes(verts, bits), kind='stable')
+
+
+def reorder_vertices(verts, faces, order):
+    """
+    Reorder the vertices so that new vertex i is old vertex order[i].
+
+    Returns the reordered (verts, faces) with the face indices remapped.
+    """
+    verts = np.asarray(verts).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+
+    remap = np.empty(len(order), dtype=np.int64)
+    remap[order] = np.arange(len(order), dtype=np.int64)
+
+    return verts[order], remap[faces]
+
+
+def morton_reorder(verts, faces, bits=21):
+    """
+    Sort the vertices along a Z-order curve over their quantized bounding box
+    and remap the face indices accordingly, to improve the cache locality of
+    per-vertex operations on the resulting mesh.
+    """
+    return reorder_vertices(verts, faces, morton_order(verts, bits))
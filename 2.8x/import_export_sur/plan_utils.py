@@ -0,0 +1,289 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Memory planning of the SUR import (no blender needed)
+
+The peak memory of importing a SUR file is estimated from its vertex and
+triangle counts (see sur_utils.probe_sur) for each import strategy:
+
+FULL     the whole text parsed at once, then converted
+CHUNKED  the text parsed into the mesh buffers one block at a time
+TILED    chunked, the mesh being split in one object per tile
+PROXY    chunked, then simplified by vertex clustering to a proxy mesh
+
+Each file of an import gets the first of these fitting in the memory budget
+together with the files before it (TILED replaces FULL and CHUNKED when
+tiles were asked for), so an import which cannot fit is refused before
+anything large is allocated.
+
+The estimates are the per element costs of the pipeline steps, measured on
+their NumPy buffers, plus the size of the blender mesh structs and of their
+undo copy.
+"""
+
+import os
+from collections import namedtuple
+
+if __package__:
+    from . import sur_utils
+else:
+    import sur_utils
+
+
+STRATEGIES = ('FULL', 'CHUNKED', 'TILED', 'PROXY')
+
+# largest proxy tried, smaller ones are tried when it does not fit
+PROXY_FACES = 1 << 20
+_MIN_PROXY_FACES = 1 << 12
+
+# (bytes per vertex, bytes per triangle) of the pipeline steps: kept until
+# the objects are created / used transiently
+_MESH = (12, 12)
+_DOUBLE_MESH = (24, 12)
+_FULL_PARSE = (48, 48)
+_SURZ_PARSE = (56, 72)
+_CLUSTER = (40, 24)
+_TRANSFORM = ((24, 0), (24, 0))
+_MORTON = ((12, 24), (20, 24))
+_SMOOTH_NORMALS = ((0, 36), (0, 500))
+_TILES = ((8, 18), (8, 30))
+_ERROR = ((8, 0), (0, 0))
+
+# blender mesh: vertices, edges (about 1.5 per triangle), loops and polygons,
+# plus the loop start / total arrays passed to foreach_set
+_BLENDER = (20, 62)
+_CUSTOM_NORMALS = (0, 48)
+# the mesh is copied once more by the undo step of the import
+_UNDO_COPIES = 2
+
+# text parsed at once by the chunked parser: the block, its numbers...
+_CHUNK_BYTES = 3 * sur_utils._PARSE_CHUNK
+
+
+Estimate = namedtuple("Estimate", (
+    "arrays",       # bytes of the prepared geometry, kept until the end
+    "load",         # peak bytes while the file is read and prepared
+    "blender",      # bytes of the blender meshes
+    ))
+
+Plan = namedtuple("Plan", (
+    "path",
+    "vertex_count",
+    "face_count",
+    "strategy",     # chosen strategy, None if none fits
+    "proxy_faces",  # triangle count aimed at by the PROXY strategy
+    "estimates",    # {strategy: Estimate}
+    ))
+
+
+def _cost(counts, vertex_count, face_count):
+    return counts[0] * vertex_count + counts[1] * face_count
+
+
+def proxy_cells(proxy_faces):
+    """
+    Return the grid size of mesh_utils.cluster_vertices giving about
+    *proxy_faces* triangles on a surface.
+    """
+    return max(int((proxy_faces / 2.0) ** 0.5), 1)
+
+
+def available_memory():
+    """
+    Return the physical memory available in bytes, or None if unknown.
+    """
+    try:
+        with open("/proc/meminfo") as info:
+            for line in info:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    if os.name == 'nt':
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [("length", ctypes.c_ulong),
+                        ("load", ctypes.c_ulong)] + \
+                       [(name, ctypes.c_ulonglong) for name in (
+                        "total", "available", "total_page", "available_page",
+                        "total_virtual", "available_virtual", "available_extended")]
+
+        status = MemoryStatus()
+        status.length = ctypes.sizeof(status)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.available
+        return None
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _prepare(vertex_count, face_count, use_morton_order, use_smooth_normals, use_tiles,
+             use_compare, mesh=_MESH):
+    # (kept, transient) bytes of the loader steps after the parse
+    steps = [_TRANSFORM]
+    if use_morton_order:
+        steps.append(_MORTON)
+    if use_smooth_normals:
+        steps.append(_SMOOTH_NORMALS)
+    if use_tiles:
+        steps.append(_TILES)
+    if use_compare:
+        steps.append(_ERROR)
+
+    kept = _cost(mesh, vertex_count, face_count)
+    transient = 0
+    for step_kept, step_transient in steps:
+        kept += _cost(step_kept, vertex_count, face_count)
+        transient = max(transient, _cost(step_transient, vertex_count, face_count))
+    return kept, transient
+
+
+def _blender(vertex_count, face_count, use_smooth_normals):
+    size = _cost(_BLENDER, vertex_count, face_count)
+    if use_smooth_normals:
+        size += _cost(_CUSTOM_NORMALS, vertex_count, face_count)
+    return _UNDO_COPIES * size
+
+
+def estimate(vertex_count, face_count, surz=False, use_morton_order=False,
+             use_smooth_normals=False, use_tiles=False, use_compare=False,
+             proxy_faces=PROXY_FACES, use_double=False):
+    """
+    Return the {strategy: Estimate} of importing a SUR file with
+    *vertex_count* vertices and *face_count* triangles (*surz* for the
+    compressed encoding, *use_double* for float64 coordinates) with the
+    given import options.
+    """
+    nv, nf = vertex_count, face_count
+    mesh_costs = _DOUBLE_MESH if use_double else _MESH
+    mesh = _cost(mesh_costs, nv, nf)
+    if surz:
+        # decoded whole, whatever the strategy
+        full = chunked = _cost(_SURZ_PARSE, nv, nf) + mesh
+    else:
+        full = _cost(_FULL_PARSE, nv, nf) + mesh
+        chunked = _CHUNK_BYTES + mesh
+
+    estimates = {}
+    for strategy, parse in (('FULL', full), ('CHUNKED', chunked), ('TILED', chunked)):
+        if (strategy == 'TILED') != bool(use_tiles):
+            continue
+        kept, transient = _prepare(nv, nf, use_morton_order, use_smooth_normals,
+                                   use_tiles, use_compare, mesh_costs)
+        estimates[strategy] = Estimate(kept, max(parse, kept + transient),
+                                       _blender(nv, nf, use_smooth_normals))
+
+    # the proxy is prepared while the parsed mesh is still referenced
+    pf = min(nf, proxy_faces)
+    pv = min(nv, pf // 2 + 1)
+    kept, transient = _prepare(pv, pf, use_morton_order, use_smooth_normals, False, use_compare,
+                               mesh_costs)
+    estimates['PROXY'] = Estimate(
+            kept,
+            max(chunked, mesh + _cost(_CLUSTER, nv, nf), mesh + kept + transient),
+            _blender(pv, pf, use_smooth_normals))
+
+    return estimates
+
+
+def plan_import(paths, budget=None, use_morton_order=False, use_smooth_normals=False,
+                use_tiles=False, use_compare=False, use_double=False):
+    """
+    Return the Plan of each file of an import within *budget* bytes (the
+    available memory when None, no limit if that is unknown).
+    """
+    if budget is None:
+        budget = available_memory()
+
+    plans = []
+    arrays = blender = 0    # kept by the files planned so far
+
+    def peak(estimate):
+        # while the file loads, and once all the objects are created
+        return max(arrays + estimate.load,
+                   arrays + estimate.arrays + blender + estimate.blender)
+
+    for path in paths:
+        nv, nf = sur_utils.probe_sur(path)
+        surz = sur_utils.is_surz(path)
+        options = dict(use_morton_order=use_morton_order, use_smooth_normals=use_smooth_normals,
+                       use_tiles=use_tiles, use_compare=use_compare, use_double=use_double)
+
+        candidates = [('TILED', PROXY_FACES)] if use_tiles else \
+            [('FULL', PROXY_FACES), ('CHUNKED', PROXY_FACES)]
+        proxy_faces = PROXY_FACES
+        while proxy_faces >= _MIN_PROXY_FACES:
+            if proxy_faces < nf:
+                candidates.append(('PROXY', proxy_faces))
+            proxy_faces >>= 2
+
+        chosen = None
+        for strategy, proxy_faces in candidates:
+            estimates = estimate(nv, nf, surz, proxy_faces=proxy_faces, **options)
+            if budget is None or peak(estimates[strategy]) <= budget:
+                chosen = strategy
+                break
+
+        plans.append(Plan(path, nv, nf, chosen, proxy_faces, estimates))
+        if chosen is not None:
+            arrays += estimates[chosen].arrays
+            blender += estimates[chosen].blender
+
+    return plans
+
+
+def _peak(estimate):
+    # peak bytes of a file imported alone
+    return max(estimate.load, estimate.arrays + estimate.blender)
+
+
+def _size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024.0:
+            return "%.0f %s" % (size, unit)
+        size /= 1024.0
+    return "%.1f TB" % size
+
+
+def report(plans, budget=None):
+    """
+    Return a text report of the *plans*, one line per file.
+    """
+    lines = []
+    if budget is not None:
+        lines.append("memory budget %s" % _size(budget))
+    for plan in plans:
+        estimates = ", ".join("%s %s" % (strategy.lower(), _size(_peak(plan.estimates[strategy])))
+                              for strategy in STRATEGIES if strategy in plan.estimates)
+        if plan.strategy is None:
+            choice = "does not fit"
+        elif plan.strategy == 'PROXY':
+            choice = "PROXY (%d triangles)" % plan.proxy_faces
+        else:
+            choice = plan.strategy
+        lines.append("%s (%d verts, %d faces): %s [%s]" % (
+                os.path.basename(plan.path), plan.vertex_count, plan.face_count, choice, estimates))
+    return "\n".join(lines)
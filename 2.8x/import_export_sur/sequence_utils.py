@@ -0,0 +1,274 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+SUR file sequences (one file per frame: frame_0001.sur, frame_0002.sur, ...)
+
+On import, the frames are parsed on a background thread into a bounded LRU
+cache, the frames following the last requested one being prefetched, so
+playback only has to upload the vertex coordinates.
+
+On export, the frames are written by a pool of threads while the caller
+extracts the next frames into a small set of reused coordinate buffers.
+"""
+
+import os
+import re
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+if __package__:
+    from . import sur_utils
+    from . import mesh_utils
+    from . import container_utils
+else:
+    import sur_utils
+    import mesh_utils
+    import container_utils
+
+# frames kept in memory per sequence
+CACHE_SIZE = 8
+
+# frames parsed ahead of the current one
+PREFETCH = 3
+
+# threads writing the exported frames
+WRITERS = max(1, min(4, os.cpu_count() or 1))
+
+_FRAME_RE = re.compile(r"^(.*?)(\d+)(\.sur)$", re.IGNORECASE)
+
+
+def frame_path(prefix, frame):
+    """
+    Return the path of the SUR file of *frame* in the sequence *prefix*.
+    """
+    return "%s_%04d.sur" % (prefix, frame)
+
+
+def find_sequence(filepath):
+    """
+    Return the sorted [(frame, path), ...] of the sequence *filepath* belongs
+    to: the files of its directory with the same name apart from the frame
+    number before the extension. A file without a frame number is returned
+    as a single frame 0.
+    """
+    directory, name = os.path.split(filepath)
+    match = _FRAME_RE.match(name)
+    if match is None:
+        return [(0, filepath)]
+
+    prefix, suffix = match.group(1), match.group(3).lower()
+    frames = []
+    for entry in os.listdir(directory or os.curdir):
+        m = _FRAME_RE.match(entry)
+        if m and m.group(1) == prefix and m.group(3).lower() == suffix:
+            frames.append((int(m.group(2)), os.path.join(directory, entry)))
+
+    return sorted(frames)
+
+
+def open_sequence(filepath, matrix=None):
+    """
+    Return the frame source of the sequence *filepath* belongs to: a
+    container_utils.ContainerReader for a .surs container, a FrameCache
+    over the numbered SUR files otherwise.
+    """
+    if filepath.lower().endswith(".surs"):
+        return container_utils.ContainerReader(filepath, matrix)
+    return FrameCache(find_sequence(filepath), matrix)
+
+
+def load_frame(filepath, matrix=None):
+    """
+    Parse a SUR file into a flat float32 coordinate array, ready for
+    vertices.foreach_set("co", ...), and an (M, 3) int32 face array.
+
+    *matrix* is an optional 4x4 transformation (nested sequences) applied to
+    the coordinates.
+    """
+    mesh = sur_utils.read_sur(filepath)
+    verts, faces = mesh.verts, mesh.faces
+
+    if matrix is not None:
+        verts, faces, norms = mesh_utils.transform_mesh(verts, faces, matrix)
+
+    return verts.astype(np.float32).ravel(), np.ascontiguousarray(faces)
+
+
+class FrameCache:
+    """
+    LRU cache of the parsed frames of a SUR sequence with background
+    prefetching of the upcoming frames.
+    """
+
+    def __init__(self, frames, matrix=None, size=CACHE_SIZE, prefetch=PREFETCH):
+        self.frames = OrderedDict(frames)
+        self.numbers = list(self.frames)
+        self.matrix = matrix
+        self.size = max(int(size), 1)
+        self.prefetch = max(int(prefetch), 0)
+
+        self._cache = OrderedDict()  # frame -> Future of load_frame
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sur_sequence")
+        self._last = None
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def clamp(self, frame):
+        """
+        Return the sequence frame shown at *frame*: the frame itself, or
+        the first / last frame outside of the sequence range.
+        """
+        if frame in self.frames:
+            return frame
+        if frame <= self.numbers[0]:
+            return self.numbers[0]
+        if frame >= self.numbers[-1]:
+            return self.numbers[-1]
+        # gap in the numbering: hold the previous frame
+        return max(n for n in self.numbers if n < frame)
+
+    def _request(self, frame):
+        # the Future of a frame, queued for loading if needed (lock held)
+        future = self._cache.get(frame)
+        if future is None:
+            future = self._executor.submit(load_frame, self.frames[frame], self.matrix)
+            self._cache[frame] = future
+        else:
+            self._cache.move_to_end(frame)
+        return future
+
+    def _evict(self, keep):
+        # drop the least recently used frames, never the ones in *keep*
+        for frame in list(self._cache):
+            if len(self._cache) <= self.size:
+                break
+            if frame not in keep:
+                self._cache.pop(frame).cancel()
+
+    def get(self, frame):
+        """
+        Return the (coords, faces) of the sequence frame shown at *frame*,
+        parsing it if it was not prefetched, and queue the following frames
+        (in the playback direction) for prefetching.
+        """
+        frame = self.clamp(frame)
+        index = self.numbers.index(frame)
+        step = -1 if self._last is not None and frame < self._last else 1
+        self._last = frame
+
+        upcoming = [self.numbers[i] for i in
+                    range(index + step, index + step * (self.prefetch + 1), step)
+                    if 0 <= i < len(self.numbers)]
+        upcoming = upcoming[:self.size - 1]
+
+        with self._lock:
+            future = self._request(frame)
+            for number in upcoming:
+                self._request(number)
+            self._cache.move_to_end(frame)
+            self._evict(set(upcoming) | {frame})
+
+        return future.result()
+
+    def close(self):
+        with self._lock:
+            for future in self._cache.values():
+                future.cancel()
+            self._cache.clear()
+        self._executor.shutdown(wait=False)
+
+
+class SequenceWriter:
+    """
+    Write SUR frames on a pool of threads.
+
+    The coordinates are passed in buffers obtained from acquire(): there are
+    only a few of them (one more than the writers, so the next frame can be
+    extracted while the others are written), acquire() blocks until a writer
+    is done with one.
+    """
+
+    def __init__(self, workers=WRITERS, buffers=None, write=None):
+        workers = max(int(workers), 1)
+        # write(filepath, verts, faces) of a frame
+        self.write = write or sur_utils.write_sur
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sur_writer")
+        self._free = queue.Queue()
+        for _ in range(buffers or workers + 1):
+            self._free.put(None)
+        self._pending = []
+
+    def acquire(self, size):
+        """
+        Return a float32 buffer of *size* values to fill with the coordinates
+        of the next frame.
+        """
+        buffer = self._free.get()
+        self._check()
+        # frames submitted with their offsets added back are float64 copies
+        if buffer is None or buffer.size != size or buffer.dtype != np.float32:
+            buffer = np.empty(size, dtype=np.float32)
+        return buffer.reshape(-1)
+
+    def submit(self, filepath, coords, faces):
+        """
+        Queue the writing of a frame, *coords* being a buffer from acquire().
+        """
+        def write():
+            try:
+                self.write(filepath, coords.reshape(-1, 3), faces)
+            finally:
+                self._free.put(coords)
+
+        self._pending.append(self._executor.submit(write))
+
+    def _check(self):
+        # raise the error of a failed frame as soon as possible
+        pending = []
+        for future in self._pending:
+            if future.done():
+                future.result()
+            else:
+                pending.append(future)
+        self._pending = pending
+
+    def close(self):
+        """
+        Wait for all the queued frames to be written.
+        """
+        try:
+            for future in self._pending:
+                future.result()
+        finally:
+            self._pending = []
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
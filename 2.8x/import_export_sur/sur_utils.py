@@ -24,21 +24,365 @@ Import and export SUR files
 Used as a blender script, it load all the sur files in the scene:
 
 blender --python sur_utils.py -- file1.sur file2.sur file3.sur ...
+
+Besides the text format, SUR meshes can be stored in a compressed binary
+encoding (see write_surz), which read_sur recognizes by its magic bytes.
 """
 
 import os
 import struct
 import contextlib
 import itertools
-from mathutils.geometry import normal
+import array
+import hashlib
+import lzma
+import zlib
 
 
 import struct
 import mmap
 import contextlib
 
+try:
+    import numpy as np
+except ImportError:
+    # SurMesh falls back to array.array buffers, the compressed encoding
+    # is not available
+    np = None
+
+
+# lines parsed between two progress reports
+_PROGRESS_LINES = 1 << 16
+
+# lines formatted at once by write_sur
+_WRITE_LINES = 1 << 16
+
+# bytes of text parsed at once by read_sur
+_PARSE_CHUNK = 1 << 24
+
+
+def _flat(values, typecode):
+    # contiguous flat buffer of float32 ('f'), float64 ('d') or int32 ('i')
+    # values
+    if np is not None:
+        dtype = {'f': np.float32, 'd': np.float64, 'i': np.int32}[typecode]
+        return np.ascontiguousarray(values, dtype=dtype).reshape(-1)
+
+    if isinstance(values, array.array) and values.typecode == typecode:
+        return values
+    values = list(values)
+    if values and not isinstance(values[0], (int, float)):
+        values = itertools.chain.from_iterable(values)
+    return array.array(typecode, values)
+
+
+def _coord_typecode(dtype):
+    # typecode ('f' or 'd') of the coordinates of type *dtype*, float32 when
+    # None
+    if dtype is None:
+        return 'f'
+    if np is not None:
+        dtype = np.dtype(dtype)
+        if dtype.kind == 'f' and dtype.itemsize in (4, 8):
+            return 'f' if dtype.itemsize == 4 else 'd'
+    elif dtype in ('f', 'd'):
+        return dtype
+    elif dtype in ('float32', 'float64'):
+        return 'f' if dtype == 'float32' else 'd'
+    raise ValueError("unsupported coordinate type %s" % (dtype,))
+
+
+class _Rows:
+    """
+    Sequence of the (x, y, z) / (a, b, c) rows of a flat buffer, the verts
+    and faces of a SurMesh without NumPy: rows[i] is a 3 item memoryview of
+    the buffer, rows[i:j] the _Rows of the rows i to j.
+    """
+
+    __slots__ = ("_view",)
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer)
+
+    def __len__(self):
+        return len(self._view) // 3
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("row slices must be contiguous")
+            return _Rows(self._view[3 * start:3 * max(start, stop)])
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        return self._view[3 * index:3 * index + 3]
+
+    def __iter__(self):
+        view = self._view
+        for start in range(0, 3 * len(self), 3):
+            yield view[start:start + 3]
+
+
+class SurMesh:
+    """
+    Triangle mesh held in contiguous typed buffers.
+
+    coords holds the vertex coordinates (x y z x y z ...), float32 unless
+    float64 is given as *dtype*, and indices the int32 triangle vertex
+    indices, as NumPy arrays or array.array when NumPy is not available.
+    Both support the buffer protocol, so they can be handed to foreach_set()
+    as they are. verts and faces are (N, 3) / (M, 3) row views of them:
+    NumPy arrays, or sequences of 3 item memoryviews without NumPy.
+
+    The mesh is a sequence of triangles: len() is the triangle count,
+    mesh[i] the vertex indices of triangle i and mesh[i:j] a SurMesh of the
+    triangles i to j sharing the vertex buffer.
+    """
+
+    __slots__ = ("coords", "indices", "norms")
+
+    def __init__(self, verts=(), faces=(), norms=None, dtype=None):
+        self.coords = _flat(verts, _coord_typecode(dtype))
+        self.indices = _flat(faces, 'i')
+        self.norms = norms if norms is not None else []
+
+    @property
+    def verts(self):
+        return self.coords.reshape(-1, 3) if np is not None else _Rows(self.coords)
+
+    @property
+    def faces(self):
+        return self.indices.reshape(-1, 3) if np is not None else _Rows(self.indices)
+
+    @property
+    def vertex_count(self):
+        return len(self.coords) // 3
+
+    @property
+    def face_count(self):
+        return len(self.indices) // 3
+
+    @property
+    def nbytes(self):
+        return len(self.coords) * self.coords.itemsize + len(self.indices) * 4
+
+    def __len__(self):
+        return self.face_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("SurMesh slices must be contiguous")
+            mesh = SurMesh.__new__(SurMesh)
+            mesh.coords = self.coords
+            mesh.indices = self.indices[3 * start:3 * max(start, stop)]
+            mesh.norms = self.norms[start:stop]
+            return mesh
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SurMesh triangle index out of range")
+        return tuple(int(i) for i in self.indices[3 * index:3 * index + 3])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __repr__(self):
+        return "SurMesh(%d verts, %d faces)" % (self.vertex_count, self.face_count)
+
+
+def _iter_numbers(data, progress=None):
+    # the whitespace separated numbers of the text in *data* (a mmap), parsed
+    # by blocks of lines as float64 arrays (exact for the indices), with the
+    # position of their first number in the text
+    size = len(data)
+    start = 0
+    offset = 0
+    while start < size:
+        end = size
+        if start + _PARSE_CHUNK < size:
+            end = data.rfind(b"\n", start, start + _PARSE_CHUNK) + 1 or size
+        values = np.fromstring(data[start:end], dtype=np.float64, sep=' ')
+        yield offset, values
+        offset += len(values)
+        start = end
+        if progress is not None:
+            progress(start / size)
+
+
+def _parse_numbers(data, progress=None):
+    # all the numbers of the text in *data* as a float64 array
+    blocks = [values for offset, values in _iter_numbers(data, progress)]
+    return np.concatenate(blocks) if blocks else np.zeros(0)
+
+
+def _parse_into(data, nv, nf, progress=None, dtype=None):
+    # parse the text in *data* straight into the buffers of a mesh of nv
+    # vertices and nf triangles, one block of lines at a time
+    mesh = SurMesh(np.empty(3 * nv, dtype=dtype or np.float32), np.empty(3 * nf, dtype=np.int32),
+                   dtype=dtype)
+    # the numbers are: nv, the coordinates, nf, the indices
+    targets = ((1, mesh.coords), (2 + 3 * nv, mesh.indices))
+
+    count = 0
+    for offset, values in _iter_numbers(data, progress):
+        count = offset + len(values)
+        for start, target in targets:
+            lo, hi = max(offset, start), min(count, start + len(target))
+            if lo < hi:
+                target[lo - start:hi - start] = values[lo - offset:hi - offset]
+
+    if count < 2 + 3 * nv + 3 * nf:
+        raise ValueError("not a complete SUR file")
+    return mesh
+
+
+def _read_sur_lines(data, progress=None, dtype=None):
+    # line by line parser, used without NumPy
+    verts, faces = array.array(_coord_typecode(dtype)), array.array('i')
+
+    size = len(data) or 1
+
+    # read the number of vertices
+    nv = int(data.readline().rstrip())
+    # read the vertex coordinates for all vertices
+    for i in range(nv):
+        line = data.readline().rstrip()
+        verts.extend(map(float, line.split()))
+        if progress is not None and not i % _PROGRESS_LINES:
+            progress(data.tell() / size)
+
+    # read the number of faces
+    nf = int(data.readline().rstrip())
+    # read the face's vertex indices for all faces
+    for i in range(nf):
+        line = data.readline().rstrip()
+        faces.extend(map(int, line.split()))
+        if progress is not None and not i % _PROGRESS_LINES:
+            progress(data.tell() / size)
+
+    return SurMesh(verts, faces, dtype=dtype)
+
+
+def _probe_text(data):
+    # (vertex count, triangle count, start, end) of the text SUR in *data* (a
+    # mmap), the vertex lines spanning data[start:end]
+    start = data.find(b"\n") + 1
+    nv = int(data[:start or len(data)])
+
+    # skip the vertex lines, counted a block at a time
+    position = start
+    remaining = nv
+    while remaining:
+        block = data[position:position + _PARSE_CHUNK]
+        if not block:
+            raise ValueError("not a complete SUR file")
+        lines = block.count(b"\n")
+        if lines >= remaining:
+            ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+            position += int(ends[remaining - 1]) + 1
+            break
+        remaining -= lines
+        position += len(block)
+
+    end = data.find(b"\n", position)
+    nf = int(data[position:end if end >= 0 else len(data)])
+    return nv, nf, start, position
+
+
+@contextlib.contextmanager
+def _mapped(filepath):
+    # read only memory map of a (non empty) file
+    if not os.path.getsize(filepath):
+        raise ValueError("%s is not a complete SUR file" % filepath)
+    with open(filepath, 'rb') as file:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield data
+        finally:
+            data.close()
+
+
+def probe_sur(filepath):
+    """
+    Return the (vertex count, triangle count) of a SUR file without parsing
+    it: from the header of a compressed file, after counting the lines of
+    the vertex block of a text file.
+    """
+    if is_surz(filepath):
+        with open(filepath, 'rb') as data:
+            header = data.read(_SURZ_HEADER.size)
+        if len(header) < _SURZ_HEADER.size:
+            raise ValueError("%s is not a compressed SUR file" % filepath)
+        return _SURZ_HEADER.unpack(header)[4:6]
+
+    with _mapped(filepath) as data:
+        try:
+            return _probe_text(data)[:2]
+        except ValueError:
+            raise ValueError("%s is not a complete SUR file" % filepath)
+
+
+def sample_sur_points(filepath, count):
+    """
+    Return about *count* vertices of a SUR file as an (N, 3) float64 array.
+
+    The lines of a text file are read at evenly spaced offsets of its vertex
+    block, without parsing the rest of the file. A compressed file is
+    decoded whole.
+    """
+    count = max(int(count), 1)
+    if is_surz(filepath):
+        verts = read_surz(filepath)[0]
+        return verts[::max(len(verts) // count, 1)]
+
+    with _mapped(filepath) as data:
+        try:
+            nv, nf, start, end = _probe_text(data)
+        except ValueError:
+            raise ValueError("%s is not a complete SUR file" % filepath)
+
+        if nv <= count:
+            text = data[start:end]
+        else:
+            # the first whole line after each offset
+            firsts = set()
+            for offset in np.linspace(start - 1, end - 1, count, endpoint=False).astype(np.int64):
+                first = data.find(b"\n", int(offset)) + 1
+                if first < end:
+                    firsts.add(first)
+            text = b" ".join(data[first:data.find(b"\n", first)] for first in sorted(firsts))
+
+    values = np.fromstring(text, dtype=np.float64, sep=' ')
+    return values[:len(values) // 3 * 3].reshape(-1, 3)
+
+
+def read_sur(filepath, progress=None, chunked=False, dtype=None):
+    """
+    Read a SUR file (text or compressed, see write_surz) into a SurMesh
+    whose coordinates are of type *dtype* (float32 or float64, float32 when
+    None: the coordinates are exact to about 7 significant digits, so far
+    from the origin float64 keeps their precision until they are recentered).
+
+    *progress* is an optional callback receiving the parsed fraction of the
+    file from time to time (it may raise to abort the parse).
+
+    A text file is parsed whole then converted, which transiently takes
+    about 2.3 times the size of the mesh. When *chunked* is set, the counts
+    are probed first (see probe_sur) and the text is parsed into the mesh
+    buffers one block at a time instead, for the same speed.
+    """
+    # compressed binary SUR (see write_surz)
+    if is_surz(filepath):
+        verts, faces = read_surz(filepath, progress)
+        return SurMesh(verts, faces, dtype=dtype)
 
-def read_sur(filepath):
     # the SUR file format is :
     # numVertices
     # x y z
@@ -49,35 +393,76 @@ def read_sur(filepath):
     # id1 id2 id3
     # ...
 
+    counts = probe_sur(filepath) if chunked and np is not None else None
+
     with open(filepath, 'rb') as file:
-        # check http://bugs.python.org/issue8046 to have mmap context
-        # manager fixed in python
         data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if np is None:
+                mesh = _read_sur_lines(data, progress, dtype)
+            elif counts is not None:
+                try:
+                    mesh = _parse_into(data, counts[0], counts[1], progress, dtype)
+                except ValueError:
+                    raise ValueError("%s is not a complete SUR file" % filepath)
+            else:
+                values = _parse_numbers(data, progress)
+
+                nv = int(values[0]) if len(values) else 0
+                nf = int(values[1 + 3 * nv]) if len(values) > 1 + 3 * nv else -1
+                if nf < 0 or len(values) < 2 + 3 * nv + 3 * nf:
+                    raise ValueError("%s is not a complete SUR file" % filepath)
 
-        verts, faces, norms = [], [], []
+                mesh = SurMesh(values[1:1 + 3 * nv], values[2 + 3 * nv:2 + 3 * nv + 3 * nf],
+                               dtype=dtype)
+        finally:
+            data.close()
 
-        # read the number of vertices
-        nv = int(data.readline().rstrip())
-        # read the vertex coordinates for all vertices
-        for i in range(nv):
-            line = data.readline().rstrip()
-            v = list(map(float, line.split()))
-            verts.append(v)
+    print("SUR file has %d verts and %d faces" % (mesh.vertex_count, mesh.face_count))
 
-        # read the number of faces
-        nf = int(data.readline().rstrip())
-        # read the face's vertex indices for all faces
-        for i in range(nf):
-            line = data.readline().rstrip()
-            t = list(map(int, line.split()))
-            faces.append(t)
+    return mesh
 
-        print("SUR file has %d verts and %d faces" % (nv, nf))
 
-        return verts, faces, norms
+def mesh_fingerprint(verts, faces=None):
+    """
+    Return a hex digest identifying the geometry of *verts* and *faces*
+    (or of the SurMesh *verts*).
 
+    Two meshes with the same digest have identical vertex coordinates and
+    face indices (in the same order), so they can share one mesh datablock.
+    """
+    if isinstance(verts, SurMesh):
+        coords, indices = verts.coords, verts.indices
+    else:
+        coords, indices = _flat(verts, 'f'), _flat(faces, 'i')
 
-def write_sur(filepath, verts, faces):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(struct.pack("<QQ", len(coords) // 3, len(indices) // 3))
+    h.update(coords.tobytes())
+    h.update(indices.tobytes())
+    return h.hexdigest()
+
+
+def _values(values):
+    # flat sequence of the numbers in *values*, keeping their type
+    if isinstance(values, SurMesh):
+        raise TypeError("expected vertices or faces, not a SurMesh")
+    if np is not None:
+        return np.asarray(values).reshape(-1)
+    values = list(values)
+    if values and not isinstance(values[0], (int, float)):
+        values = list(itertools.chain.from_iterable(values))
+    return values
+
+
+def write_sur(filepath, verts, faces=None, dtype=None):
+    """
+    Write a mesh, given as *verts* and *faces* or as the SurMesh *verts*,
+    to a text SUR file.
+
+    The coordinates are rounded to *dtype* (float32 or float64) first when
+    it is given, and written with 6 decimals.
+    """
     # the SUR file format is :
     # numVertices
     # x y z
@@ -88,20 +473,228 @@ def write_sur(filepath, verts, faces):
     # id1 id2 id3
     # ...
 
+    if isinstance(verts, SurMesh):
+        verts, faces = verts.coords, verts.indices
+    coords, indices = _values(verts), _values(faces)
+    if dtype is not None:
+        coords = _flat(coords, _coord_typecode(dtype))
+
+    # the lines are formatted by blocks, with a single % operation each
     with open(filepath, 'w') as data:
-        # write the number of vertices
-        data.write("%d\n" % len(verts))
-        # write the vertex coordinates
-        for vert in verts:
-            # print("vert =", vert.co )
-            data.write("%f %f %f\n" % (vert.co[0], vert.co[1], vert.co[2]))
+        for values, line in ((coords, "%f %f %f\n"), (indices, "%d %d %d\n")):
+            # write the number of vertices / faces
+            data.write("%d\n" % (len(values) // 3))
+            # write the vertex coordinates / face vertex indices
+            for start in range(0, len(values), 3 * _WRITE_LINES):
+                block = values[start:start + 3 * _WRITE_LINES]
+                block = block.tolist() if hasattr(block, "tolist") else block
+                data.write((line * (len(block) // 3)) % tuple(block))
+
+
+# compressed binary SUR layout (little endian):
+#
+# header    magic "SURZ", version, codec, quantization bits, vertex count,
+#           triangle count, size of the encoded indices, bounding box
+# payload   compressed with the codec:
+#           positions   per axis, the quantized coordinates relative to the
+#                       bounding box, as zigzag differences with the previous
+#                       vertex, bytes grouped by significance
+#           indices     zigzag differences of the flattened triangle indices,
+#                       as little endian base 128 varints
+SURZ_MAGIC = b"SURZ"
+SURZ_VERSION = 1
+
+_SURZ_HEADER = struct.Struct("<4sBBBxQQQ6d")
+
+SURZ_CODECS = ('ZLIB', 'LZMA')
+
+# payload bytes handed to the codec at once
+_STREAM_CHUNK = 1 << 20
+
+
+def _zigzag(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _unzigzag(values):
+    values = values.astype(np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def _varint_encode(values):
+    # LEB128 of an array of uint64, 7 bits per byte, high bit set on all
+    # the bytes of a value but the last
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        sizes += values >= np.uint64(1 << shift)
+
+    ends = np.cumsum(sizes)
+    owner = np.repeat(np.arange(len(values)), sizes)
+    position = np.arange(ends[-1] if len(ends) else 0) - np.repeat(ends - sizes, sizes)
+
+    data = (values[owner] >> (np.uint64(7) * position.astype(np.uint64))) & np.uint64(0x7f)
+    data |= (position < sizes[owner] - 1).astype(np.uint64) << np.uint64(7)
+    return data.astype(np.uint8)
+
+
+def _varint_decode(data, count):
+    data = np.asarray(data, dtype=np.uint8)
+    last = np.flatnonzero(data < 0x80)
+    if len(last) != count:
+        raise ValueError("corrupted SUR index data")
+    if not count:
+        return np.zeros(0, dtype=np.uint64)
+
+    starts = np.concatenate(([0], last[:-1] + 1))
+    position = np.arange(len(data)) - np.repeat(starts, last - starts + 1)
+    bits = (data & 0x7f).astype(np.uint64) << (np.uint64(7) * position.astype(np.uint64))
+    # the bits of the bytes of a value do not overlap, the sum is their union
+    return np.add.reduceat(bits, starts)
+
+
+def _shuffle(values):
+    # group the bytes by significance (all the low bytes first), the high
+    # bytes of small differences being mostly zero
+    return np.ascontiguousarray(values.view(np.uint8).reshape(-1, values.itemsize).T)
+
+
+def _unshuffle(data, dtype, count):
+    return np.ascontiguousarray(data.reshape(np.dtype(dtype).itemsize, count).T).view(dtype).ravel()
+
+
+def _position_dtype(bits):
+    return np.dtype('<u2') if bits <= 16 else np.dtype('<u4')
+
+
+def is_surz(filepath):
+    """
+    Tell whether *filepath* holds a compressed binary SUR mesh.
+    """
+    with open(filepath, 'rb') as data:
+        return data.read(len(SURZ_MAGIC)) == SURZ_MAGIC
+
+
+def encode_surz(verts, faces, bits=16):
+    """
+    Return the (header fields, payload chunks) of the compressed binary
+    encoding of a mesh, before the codec. See write_surz.
+    """
+    verts = np.asarray(verts, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    bits = min(max(int(bits), 2), 32)
+
+    lo = verts.min(axis=0) if len(verts) else np.zeros(3)
+    hi = verts.max(axis=0) if len(verts) else np.zeros(3)
+    extent = hi - lo
+    extent[extent == 0.0] = 1.0
+
+    cells = (1 << bits) - 1
+    grid = np.rint((verts - lo) * (cells / extent)).astype(np.int64)
+    # differences along the vertex order, wrapped to the signed bit range
+    # so that their zigzag code fits in *bits* bits
+    wrap = 1 << bits
+    delta = np.diff(grid, axis=0, prepend=0) % wrap
+    delta[delta >= wrap >> 1] -= wrap
+    dtype = _position_dtype(bits)
+    positions = [_shuffle(_zigzag(axis).astype(dtype)) for axis in delta.T]
+
+    indices = _varint_encode(_zigzag(np.diff(faces.ravel(), prepend=0)))
+
+    header = (bits, len(verts), len(faces), len(indices), tuple(lo) + tuple(hi))
+    return header, positions + [indices]
+
+
+def write_surz(filepath, verts, faces=None, bits=16, codec='ZLIB', level=6):
+    """
+    Write a mesh, given as *verts* and *faces* or as the SurMesh *verts*, in
+    the compressed binary SUR encoding (requires NumPy).
+
+    The positions are quantized with *bits* bits per axis over the bounding
+    box of the mesh, so the error is at most half of extent / (2 ** bits - 1)
+    per axis. *codec* is 'ZLIB' or 'LZMA' (smaller, slower).
+    """
+    if isinstance(verts, SurMesh):
+        verts, faces = verts.verts, verts.faces
+    (bits, nv, nf, index_size, box), payload = encode_surz(verts, faces, bits)
+
+    if codec == 'LZMA':
+        compressor = lzma.LZMACompressor(preset=level)
+    else:
+        compressor = zlib.compressobj(level)
+
+    with open(filepath, 'wb') as data:
+        data.write(_SURZ_HEADER.pack(SURZ_MAGIC, SURZ_VERSION, SURZ_CODECS.index(codec),
+                                     bits, nv, nf, index_size, *box))
+        for block in payload:
+            block = memoryview(block.ravel())
+            for start in range(0, len(block), _STREAM_CHUNK):
+                data.write(compressor.compress(block[start:start + _STREAM_CHUNK]))
+        data.write(compressor.flush())
+
+
+def read_surz(filepath, progress=None):
+    """
+    Read a compressed binary SUR file into (N, 3) float64 vertex and (M, 3)
+    int64 face arrays.
+
+    The file is decompressed chunk by chunk straight into the payload buffer,
+    *progress* (see read_sur) being called after each chunk.
+    """
+    size = os.path.getsize(filepath) or 1
+
+    with open(filepath, 'rb') as data:
+        header = data.read(_SURZ_HEADER.size)
+        if len(header) < _SURZ_HEADER.size or header[:4] != SURZ_MAGIC:
+            raise ValueError("%s is not a compressed SUR file" % filepath)
+
+        magic, version, codec, bits, nv, nf, index_size, *box = _SURZ_HEADER.unpack(header)
+        if version > SURZ_VERSION:
+            raise ValueError("unsupported compressed SUR version %d" % version)
+
+        dtype = _position_dtype(bits)
+        position_size = 3 * nv * dtype.itemsize
+        payload = np.empty(position_size + index_size, dtype=np.uint8)
+
+        if SURZ_CODECS[codec] == 'LZMA':
+            decompressor = lzma.LZMADecompressor()
+        else:
+            decompressor = zlib.decompressobj()
+
+        filled = 0
+        while True:
+            chunk = data.read(_STREAM_CHUNK)
+            if not chunk:
+                break
+            block = decompressor.decompress(chunk)
+            payload[filled:filled + len(block)] = np.frombuffer(block, dtype=np.uint8)
+            filled += len(block)
+            if progress is not None:
+                progress(data.tell() / size)
+        if codec == SURZ_CODECS.index('ZLIB'):
+            block = decompressor.flush()
+            payload[filled:filled + len(block)] = np.frombuffer(block, dtype=np.uint8)
+            filled += len(block)
+
+    if filled != len(payload):
+        raise ValueError("truncated compressed SUR file %s" % filepath)
+
+    lo, hi = np.array(box[:3]), np.array(box[3:])
+    extent = hi - lo
+    extent[extent == 0.0] = 1.0
+    mask = np.uint64((1 << bits) - 1)
+
+    axes = np.split(payload[:position_size], 3)
+    grid = np.empty((nv, 3), dtype=np.int64)
+    for axis, block in enumerate(axes):
+        delta = _unzigzag(_unshuffle(block, dtype, nv).astype(np.uint64))
+        grid[:, axis] = (np.cumsum(delta).astype(np.uint64) & mask).astype(np.int64)
+
+    verts = lo + grid * (extent / ((1 << bits) - 1))
+    faces = np.cumsum(_unzigzag(_varint_decode(payload[position_size:], 3 * nf)))
 
-        # write the number of faces
-        data.write("%d\n" % len(faces))
-        # write the face vertex indices
-        for face in faces:
-            print(type(face))
-            data.write("%d %d %d\n" % (face.vertices[0], face.vertices[1], face.vertices[2]))
+    return verts, faces.reshape(-1, 3)
 
 
 if __name__ == '__main__':
@@ -113,6 +706,6 @@ if __name__ == '__main__':
 
     for filepath in filepaths:
         objName = bpy.path.display_name(filepath)
-        verts, faces, norms = read_sur(filepath)
+        mesh = read_sur(filepath)
 
-        blender_utils.create_and_link_mesh(objName, faces, verts)
+        blender_utils.create_and_link_mesh(objName, mesh)
@@ -0,0 +1,293 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Thumbnails of SUR files (no blender needed)
+
+A thumbnail is a small depth shaded orthographic view of a subset of the
+mesh, rasterized with NumPy: the triangles of small and compressed files
+(simplified by vertex clustering), otherwise points sampled from the vertex
+block of the text without parsing the rest (see sur_utils.sample_sur_points).
+
+ThumbnailCache renders them in worker processes, running this module as a
+script (the add-on package itself cannot be imported without blender), and
+keeps the last ones in an LRU keyed by path and modification time:
+
+python thumbnail_utils.py [--size 128] file.sur > rgba
+"""
+
+import os
+import sys
+import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+if __package__:
+    from . import sur_utils
+    from . import mesh_utils
+else:
+    import sur_utils
+    import mesh_utils
+
+# width and height of the thumbnails in pixels
+SIZE = 128
+
+# points / triangles rendered
+SAMPLES = 1 << 15
+
+# text files read whole (for their triangles) up to this size
+FULL_READ_SIZE = 1 << 23
+
+# thumbnails kept in memory
+CACHE_SIZE = 256
+
+# processes rendering thumbnails at once
+WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+# pixels tested at once by the triangle rasterizer
+_RASTER_CHUNK = 1 << 22
+
+# view direction: turned around Z then tilted towards the viewer (radians)
+_AZIMUTH = np.radians(-35.0)
+_ELEVATION = np.radians(30.0)
+
+# light direction in view coordinates (from the upper left, towards the scene)
+_LIGHT = np.array((0.45, -0.55, 0.7)) / np.linalg.norm((0.45, -0.55, 0.7))
+
+
+def load_sample(filepath, count=SAMPLES):
+    """
+    Return the (points, triangles) to render for a SUR file: the (N, 3)
+    sampled points, or None and the (M, 3, 3) corners of about *count*
+    triangles.
+    """
+    if sur_utils.is_surz(filepath) or os.path.getsize(filepath) <= FULL_READ_SIZE:
+        mesh = sur_utils.read_sur(filepath)
+        verts, faces = mesh.verts, mesh.faces
+        if len(faces) > count:
+            verts, faces = mesh_utils.cluster_vertices(verts, faces, (count / 2.0) ** 0.5)
+        return None, verts[faces].astype(np.float64)
+    return sur_utils.sample_sur_points(filepath, count), None
+
+
+def _view(points):
+    # (x, y) image plane and depth (larger is farther) coordinates
+    cz, sz = np.cos(_AZIMUTH), np.sin(_AZIMUTH)
+    ce, se = np.cos(_ELEVATION), np.sin(_ELEVATION)
+    x = points[..., 0] * cz - points[..., 1] * sz
+    y = points[..., 0] * sz + points[..., 1] * cz
+    return np.stack((x, y * se + points[..., 2] * ce, y * ce - points[..., 2] * se), axis=-1)
+
+
+def _nearest(pixels, depth):
+    # indices of the nearest sample of each covered pixel
+    order = np.lexsort((depth, pixels))
+    first = np.r_[True, pixels[order][1:] != pixels[order][:-1]]
+    return order[first]
+
+
+def _rasterize(corners, size):
+    # (pixel, depth, triangle) of the visible samples of the triangles
+    # given by their (M, 3, 3) view coordinates, in pixel units
+    lo = np.clip(np.floor(corners[:, :, :2].min(axis=1)), 0, size - 1).astype(np.int64)
+    hi = np.clip(np.ceil(corners[:, :, :2].max(axis=1)), 0, size - 1).astype(np.int64)
+    width = hi[:, 0] - lo[:, 0] + 1
+    areas = width * (hi[:, 1] - lo[:, 1] + 1)
+
+    a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+    signed = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+
+    # chunks of triangles covering about _RASTER_CHUNK candidate pixels
+    valid = np.flatnonzero(signed != 0.0)
+    ends = np.cumsum(areas[valid])
+    splits = np.searchsorted(ends, np.arange(_RASTER_CHUNK, ends[-1], _RASTER_CHUNK)) \
+        if len(valid) else []
+
+    pixels, depths, triangles = [], [], []
+    for chunk in np.split(valid, splits):
+        if not len(chunk):
+            continue
+        tri = np.repeat(chunk, areas[chunk])
+        starts = np.repeat(np.cumsum(areas[chunk]) - areas[chunk], areas[chunk])
+        offsets = np.arange(len(tri)) - starts
+        px = lo[tri, 0] + offsets % width[tri]
+        py = lo[tri, 1] + offsets // width[tri]
+
+        # barycentric coordinates of the pixel centers
+        x, y = px + 0.5, py + 0.5
+        ta, tb, tc = a[tri], b[tri], c[tri]
+        w0 = (tb[:, 0] - x) * (tc[:, 1] - y) - (tb[:, 1] - y) * (tc[:, 0] - x)
+        w1 = (tc[:, 0] - x) * (ta[:, 1] - y) - (tc[:, 1] - y) * (ta[:, 0] - x)
+        w0, w1 = w0 / signed[tri], w1 / signed[tri]
+        w2 = 1.0 - w0 - w1
+        inside = (w0 >= 0.0) & (w1 >= 0.0) & (w2 >= 0.0)
+
+        pixels.append((py * size + px)[inside])
+        depths.append((w0 * ta[:, 2] + w1 * tb[:, 2] + w2 * tc[:, 2])[inside])
+        triangles.append(tri[inside])
+
+    if not pixels:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    pixels, depths, triangles = map(np.concatenate, (pixels, depths, triangles))
+    visible = _nearest(pixels, depths)
+    return pixels[visible], depths[visible], triangles[visible]
+
+
+def render(points=None, triangles=None, size=SIZE):
+    """
+    Return the (size, size, 4) uint8 RGBA depth shaded orthographic view of
+    *points* (N, 3) or *triangles* (M, 3, 3), rows going upwards as in
+    blender images. Uncovered pixels are transparent.
+    """
+    image = np.zeros((size * size, 4), dtype=np.uint8)
+    samples = triangles.reshape(-1, 3) if triangles is not None else points
+    if samples is None or not len(samples):
+        return image.reshape(size, size, 4)
+
+    view = _view(np.asarray(samples, dtype=np.float64))
+    lo, hi = view.min(axis=0), view.max(axis=0)
+    extent = max(hi[0] - lo[0], hi[1] - lo[1]) or 1.0
+    # fit in the image with a one pixel margin, centered, in pixel units
+    view = (view - (lo + hi) / 2.0) * ((size - 2) / extent)
+    view[:, :2] += size / 2.0
+    near, far = view[:, 2].min(), view[:, 2].max()
+
+    if triangles is not None:
+        corners = view.reshape(-1, 3, 3)
+        pixels, depths, visible = _rasterize(corners, size)
+        # two sided diffuse lighting of the visible triangles
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])[visible]
+        lengths = np.linalg.norm(normals, axis=1)
+        light = 0.35 + 0.65 * np.abs(normals @ _LIGHT) / np.where(lengths > 0.0, lengths, 1.0)
+    else:
+        px = view[:, 0].astype(np.int64)
+        py = view[:, 1].astype(np.int64)
+        depths = view[:, 2]
+        if len(view) < size * size:
+            # sparse points: splat them on 2 x 2 pixels
+            px = np.concatenate((px, px + 1, px, px + 1))
+            py = np.concatenate((py, py, py + 1, py + 1))
+            depths = np.tile(depths, 4)
+        pixels = np.clip(py, 0, size - 1) * size + np.clip(px, 0, size - 1)
+        visible = _nearest(pixels, depths)
+        pixels, depths = pixels[visible], depths[visible]
+        light = 1.0
+
+    # near is bright, far is dark
+    shade = light * (1.0 - 0.6 * (depths - near) / ((far - near) or 1.0))
+    image[pixels, :3] = (np.clip(shade, 0.0, 1.0)[:, None] * (210, 220, 235)).astype(np.uint8)
+    image[pixels, 3] = 255
+    return image.reshape(size, size, 4)
+
+
+def thumbnail(filepath, size=SIZE):
+    """
+    Return the RGBA thumbnail (see render) of a SUR file.
+    """
+    points, triangles = load_sample(filepath)
+    return render(points, triangles, size)
+
+
+class ThumbnailCache:
+    """
+    LRU cache of SUR thumbnails rendered by a pool of worker processes.
+    """
+
+    def __init__(self, size=SIZE, capacity=CACHE_SIZE, workers=WORKERS, python=None):
+        self.size = size
+        self.capacity = max(int(capacity), 1)
+        # interpreter running the workers
+        self.python = python or sys.executable
+
+        self._images = OrderedDict()    # (path, mtime) -> image, None if it failed
+        self._pending = {}              # (path, mtime) -> Future of the image
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(int(workers), 1),
+                                            thread_name_prefix="sur_thumbnail")
+
+    def _render(self, filepath):
+        # run this module as a script in a new process
+        result = subprocess.run(
+                [self.python, os.path.abspath(__file__), "--size", str(self.size), filepath],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+        return np.frombuffer(result.stdout, dtype=np.uint8).reshape(self.size, self.size, 4)
+
+    def _collect(self):
+        # move the finished renders to the cache (lock held)
+        for key, future in list(self._pending.items()):
+            if future.done():
+                del self._pending[key]
+                try:
+                    self._images[key] = future.result()
+                except (OSError, ValueError, subprocess.SubprocessError):
+                    self._images[key] = None
+        while len(self._images) > self.capacity:
+            self._images.popitem(last=False)
+
+    @property
+    def pending(self):
+        with self._lock:
+            self._collect()
+            return len(self._pending)
+
+    def get(self, filepath):
+        """
+        Return the thumbnail of *filepath*, or None if it is not rendered
+        yet (it is then queued) or could not be rendered.
+        """
+        try:
+            key = (os.path.abspath(filepath), os.stat(filepath).st_mtime_ns)
+        except OSError:
+            return None
+
+        with self._lock:
+            self._collect()
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+            if key not in self._pending:
+                self._pending[key] = self._executor.submit(self._render, filepath)
+        return None
+
+    def close(self):
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+            self._images.clear()
+        self._executor.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write the RGBA thumbnail of a SUR file "
+                                                 "to the standard output")
+    parser.add_argument("--size", type=int, default=SIZE)
+    parser.add_argument("filepath")
+    args = parser.parse_args()
+
+    # the parse report of read_sur must not end up in the image
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    image = thumbnail(args.filepath, args.size)
+    stdout.buffer.write(image.tobytes())
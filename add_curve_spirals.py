@@ -19,15 +19,16 @@ bl_info = {
 
 import bpy
 import time
+import numpy as np
+from collections import OrderedDict
+from types import SimpleNamespace
 from bpy.props import (
     EnumProperty,
     BoolProperty,
     FloatProperty,
     IntProperty,
 )
-from math import (
-    sin, cos, pi, exp
-)
+from math import pi
 from bpy_extras.object_utils import object_data_add
 from bpy.types import (
     Operator,
@@ -35,44 +36,218 @@ from bpy.types import (
 )
 from bl_operators.presets import AddPresetBase
 
+# the spirals are computed from the index of their samples (fractional
+# indices giving the points in between) in one vectorized pass, as the
+# (x, y, z) coordinate arrays (or scalars) of the points. The trigonometry
+# is done in dtype, float32 by default as the curve points are.
+
+
+def turn_cos_sin(k, period, dtype=np.float32):
+    '''
+        cos and sin of the angles 2*pi*k/period, the angles being reduced to
+        one turn in float64 first so that dtype keeps their precision
+    '''
+    turns = np.floor(k / period)
+    angle = ((k - turns * period) * (2 * pi / period)).astype(dtype)
+    return np.cos(angle), np.sin(angle)
+
+
+def flat_verts(points):
+    '''
+        flat (x, y, z, w) float32 buffer of the (x, y, z) coordinates, as
+        expected by spline.points.foreach_set('co', ...)
+    '''
+    count = max(np.size(values) for values in points)
+    verts = np.empty((count, 4), dtype=np.float32)
+    for axis, values in enumerate(points):
+        verts[:, axis] = values
+    verts[:, 3] = 1.0
+    return verts.ravel()
+
+
+# chordal tolerance sampling: the curve is measured on subdivisions of its
+# fixed steps, refined where it turns more than TOLERANCE_MAX_TURN radians,
+# and sampled for a fraction of the tolerance (the sagitta estimate is a
+# little optimistic where the curvature changes)
+TOLERANCE_SUBDIVISIONS = 8
+TOLERANCE_MAX_TURN = 0.1
+TOLERANCE_PASSES = 12
+TOLERANCE_MARGIN = 0.8
+
+
+def turning_angles(points):
+    '''
+        segment lengths and turning angle at each inner point of the
+        (N, 3) polyline
+    '''
+    segments = np.diff(points, axis=0)
+    lengths = np.sqrt(np.einsum('ij,ij->i', segments, segments))
+    directions = segments / np.where(lengths > 0.0, lengths, 1.0)[:, None]
+    cosines = np.einsum('ij,ij->i', directions[:-1], directions[1:])
+    angles = np.arccos(np.clip(cosines, -1.0, 1.0))
+    # no direction, no turn
+    angles[(lengths[:-1] == 0.0) | (lengths[1:] == 0.0)] = 0.0
+    return lengths, angles
+
+
+def tolerance_samples(props, curve, count):
+    '''
+        sample indices in [0, count - 1] placing the points of the curve so
+        that its chords deviate at most by props.tolerance from it
+
+        the sagitta of a chord of length ds on a curvature k is about
+        k * ds^2 / 8, so the points are spread with the density
+        sqrt(k / (8 * tolerance)) per unit length
+    '''
+    def evaluate(k):
+        return np.column_stack(np.broadcast_arrays(*curve(props, k, np.float64)))
+
+    k = np.linspace(0.0, count - 1, (count - 1) * TOLERANCE_SUBDIVISIONS + 1)
+    points = evaluate(k)
+    for refine in range(TOLERANCE_PASSES + 1):
+        lengths, angles = turning_angles(points)
+        # split the segments next to a sharp turn
+        sharp = np.zeros(len(lengths), dtype=bool)
+        sharp[:-1] |= angles > TOLERANCE_MAX_TURN
+        sharp[1:] |= angles > TOLERANCE_MAX_TURN
+        if refine == TOLERANCE_PASSES or not sharp.any():
+            break
+        middles = (k[:-1][sharp] + k[1:][sharp]) / 2
+        order = np.argsort(np.concatenate((k, middles)), kind='stable')
+        k = np.concatenate((k, middles))[order]
+        points = np.concatenate((points, evaluate(middles)))[order]
+
+    # curvature * length of each segment: mean turning angle at its ends,
+    # the end segments taking the angle of their inner end at both ends
+    turns = np.zeros(len(lengths))
+    turns[:-1] += angles / 2
+    turns[1:] += angles / 2
+    if len(angles):
+        turns[0] += angles[0] / 2
+        turns[-1] += angles[-1] / 2
+    # (a little density everywhere keeps the straight parts in order)
+    tolerance = props.tolerance * TOLERANCE_MARGIN
+    density = np.sqrt(turns * lengths / (8.0 * tolerance)) + 1e-9
+    cumulative = np.concatenate(([0.0], np.cumsum(density)))
+
+    n = int(np.ceil(cumulative[-1])) + 1
+    return np.interp(np.linspace(0.0, cumulative[-1], n), cumulative, k)
+
+
+def sample_indices(props, curve, count):
+    '''
+        sample indices of the curve: its count fixed steps, or placed by the
+        chordal tolerance
+    '''
+    if props.sampling == 'TOLERANCE' and count > 1:
+        return tolerance_samples(props, curve, count)
+    return np.arange(count)
+
+
 # make CORNU spiral..
 
+# relative accuracy of the Fresnel integrals
+FRESNEL_EPS = 1e-15
+FRESNEL_MAXIT = 1000
+# the power series is used below this argument, the continued fraction above
+FRESNEL_XMIN = 1.5
+# terms of the power series reaching FRESNEL_EPS at FRESNEL_XMIN
+FRESNEL_TERMS = 40
 
-def make_cornu_spiral(props, context):
+
+def fresnel(x):
+    '''
+        Fresnel integrals (Numerical Recipes frescl) of the array x
+
+        C(x) = Integral(0,x) { cos(pi*u*u/2) du }
+        S(x) = Integral(0,x) { sin(pi*u*u/2) du }
+
+        evaluated with their power series for small |x| and with the
+        continued fraction of the complementary error function otherwise,
+        so the cost does not grow with x.
+
+        returns the arrays (C(x), S(x))
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    ax = np.abs(x)
+    c = np.empty_like(ax)
+    s = np.empty_like(ax)
+
+    # power series, the C and S terms interleaved: x * t^n / n! / (2n + 1)
+    small = ax <= FRESNEL_XMIN
+    xs = ax[small]
+    t = pi / 2 * xs * xs
+    term = xs.copy()
+    sumc = np.zeros_like(xs)
+    sums = np.zeros_like(xs)
+    for n in range(FRESNEL_TERMS):
+        sign = 1.0 if n % 4 < 2 else -1.0
+        if n % 2:
+            sums += sign * term / (2 * n + 1)
+        else:
+            sumc += sign * term / (2 * n + 1)
+        term *= t / (n + 1)
+    c[small] = sumc
+    s[small] = sums
+
+    # modified Lentz evaluation of the continued fraction, the converged
+    # arguments leaving the iteration
+    xl = ax[~small]
+    if len(xl):
+        pix2 = pi * xl * xl
+        b0 = 1.0 - 1j * pix2
+        cc = np.full(len(xl), 1e300, dtype=np.complex128)
+        d = 1.0 / b0
+        h = d.copy()
+        result = np.empty_like(h)
+        active = np.arange(len(xl))
+        n = -1
+        for k in range(2, FRESNEL_MAXIT):
+            n += 2
+            a = -n * (n + 1)
+            b = b0[active] + 4.0 * (k - 1)
+            d = 1.0 / (a * d + b)
+            cc = b + a / cc
+            delta = cc * d
+            h = h * delta
+            done = np.abs(delta.real - 1.0) + np.abs(delta.imag) < FRESNEL_EPS
+            if done.any():
+                result[active[done]] = h[done]
+                keep = ~done
+                active, d, cc, h = active[keep], d[keep], cc[keep], h[keep]
+                if not len(active):
+                    break
+        result[active] = h
+        h = result * (xl - 1j * xl)
+        cs = (0.5 + 0.5j) * (1.0 - np.exp(0.5j * pix2) * h)
+        c[~small] = cs.real
+        s[~small] = cs.imag
+
+    return np.copysign(c, x), np.copysign(s, x)
+
+
+def cornu_curve(props, k, dtype=np.float32):
     '''
         L     : length
         N     : resolution
         S     : scale
 
-        x(t) = s * Integral(0,t) { cos(u*u/2) du }
-        y(t) = s * Integral(0,t) { sin(u*u/2) du }
+        x(t) = s * Integral(0,t) { cos(pi*u*u/2) du }
+        y(t) = s * Integral(0,t) { sin(pi*u*u/2) du }
 
+        with t = L * k / N, the integrals being evaluated directly for each
+        point (see fresnel), the integral resolution (epsilon) is not needed.
     '''
-    verts = []
-
     L = props.length
     N = props.resolution
     S = props.scale
-    M = props.epsilon
-    for n in range(0, N):
-        l = L * n / N
-        # l = L * (N/2-n)/N
-        x = 0
-        y = 0
-        du = l / M
-        for m in range(0, M):
-            u = l * m / M
-            x = x + cos(pi * u * u / 2) * du
-            y = y + sin(pi * u * u / 2) * du
-
-        px = x * S
-        py = y * S
-        verts.extend([px, py, 0, 1])
-    return verts
+
+    x, y = fresnel(L * np.asarray(k, dtype=np.float64) / N)
+    return x * S, y * S, 0.0
 
 
 # make EXO spiral.. expo out and expo in between two circles
-def make_exo_spiral(props, context):
+def exo_curve(props, k, dtype=np.float32):
     '''
         N     : number of turns
         res   : curve resolution
@@ -105,195 +280,697 @@ def make_exo_spiral(props, context):
     slope = props.slope
     scale = props.scale
 
-    verts = []
-
-    for n in range(0, res):
-        t = n / res
-        a = 1.0 / (1.0 + exp(-slope * (t - 0.5)))
-        r = iR + (eR - iR) * a
-        theta = 2 * pi * N * t * sign
-        # r = r * (1 + (0.0 + 0.11*pow(sin(pi*t), 11)) * cos(11 * theta))
-        px = r * cos(theta) * scale
-        py = r * sin(theta) * scale
-        verts.extend([px, py, 0, 1])
-    return verts
+    k = np.asarray(k, dtype=np.float64)
+    # theta = 2 * pi * N * t * sign, one turn per props.steps
+    cos_theta, sin_theta = turn_cos_sin(k, props.steps, dtype)
+    t = k.astype(dtype) / res
+    a = 1.0 / (1.0 + np.exp(-slope * (t - 0.5)))
+    r = (iR + (eR - iR) * a) * scale
+    # r = r * (1 + (0.0 + 0.11*pow(sin(pi*t), 11)) * cos(11 * theta))
+    return r * cos_theta, r * sin_theta * sign, 0.0
 
 
 # make normal spiral
 # ----------------------------------------------------------------------------
 
-def make_spiral(props, context):
+def spiral_curve(props, k, dtype=np.float32):
     # archemedian and logarithmic can be plotted in cylindrical coordinates
 
-    # INPUT: turns->degree->max_phi, steps, direction
-    # Initialise Polar Coordinate Enviroment
-    props.degree = 360 * props.turns     # If you want to make the slider for degree
+    # INPUT: turns, steps[per turn], direction
     # props.steps[per turn] -> steps[for the whole spiral]
     steps = props.steps * props.turns
-    props.z_scale = props.dif_z * props.turns
-
-    max_phi = pi * props.degree / 180  # max angle in radian
-    step_phi = max_phi / steps  # angle in radians between two vertices
-
-    if props.spiral_direction == 'CLOCKWISE':
-        step_phi *= -1  # flip direction
-        max_phi *= -1
 
-    step_z = props.z_scale / (steps - 1)  # z increase in one step
+    step_phi = 2 * pi / props.steps  # angle in radians between two vertices
+    sign = (1, -1)[props.spiral_direction == 'CLOCKWISE']  # flip direction
 
-    verts = []
-    verts.extend([props.radius, 0, 0, 1])
+    step_z = props.dif_z * props.turns / (steps - 1)  # z increase in one step
 
-    cur_phi = 0
-    cur_z = 0
+    k = np.asarray(k, dtype=np.float64)
+    cos_phi, sin_phi = turn_cos_sin(k, props.steps, dtype)
+    k = k.astype(dtype)
 
-    # Archemedean: dif_radius, radius
-    cur_rad = props.radius
-    step_rad = props.dif_radius / (steps * 360 / props.degree)
-    # radius increase per angle for archemedean spiral|
-    # (steps * 360/props.degree)...Steps needed for 360 deg
-    # Logarithmic: radius, B_force, ang_div, dif_z
-
-    while abs(cur_phi) <= abs(max_phi):
-        cur_phi += step_phi
-        cur_z += step_z
-
-        if props.spiral_type == 'ARCH':
-            cur_rad += step_rad
-        if props.spiral_type == 'LOG':
-            # r = a*e^{|theta| * b}
-            cur_rad = props.radius * pow(props.B_force, abs(cur_phi))
-
-        px = cur_rad * cos(cur_phi)
-        py = cur_rad * sin(cur_phi)
-        verts.extend([px, py, cur_z, 1])
+    if props.spiral_type == 'LOG':
+        # r = a*e^{|theta| * b}
+        rad = props.radius * np.power(dtype(props.B_force), k * step_phi)
+    else:
+        # Archemedean: radius increase per step, dif_radius per turn
+        rad = props.radius + k * (props.dif_radius / props.steps)
 
-    return verts
+    return rad * cos_phi, rad * sin_phi * sign, k * step_z
 
 
 # make Spheric spiral
 # ----------------------------------------------------------------------------
 
-def make_spiral_spheric(props, context):
+def spheric_curve(props, k, dtype=np.float32):
     # INPUT: turns, steps[per turn], radius
     # use spherical Coordinates
-    step_phi = (2 * pi) / props.steps  # Step of angle in radians for one turn
     # props.steps[per turn] -> steps[for the whole spiral]
     steps = props.steps * props.turns
 
-    max_phi = 2 * pi * props.turns  # max angle in radian
-    step_phi = max_phi / steps      # angle in radians between two vertices
-    if props.spiral_direction == 'CLOCKWISE':  # flip direction
-        step_phi *= -1
-        max_phi *= -1
-    step_theta = pi / (steps - 1)  # theta increase in one step (pi == 180 deg)
-
-    verts = []
-    verts.extend([0, 0, -props.radius, 1])  # First vertex at south pole
-
-    cur_phi = 0
-    cur_theta = -pi / 2  # Beginning at south pole
+    sign = (1, -1)[props.spiral_direction == 'CLOCKWISE']  # flip direction
 
-    while abs(cur_phi) <= abs(max_phi):
-        # Coordinate Transformation sphere->rect
-        px = props.radius * cos(cur_theta) * cos(cur_phi)
-        py = props.radius * cos(cur_theta) * sin(cur_phi)
-        pz = props.radius * sin(cur_theta)
+    k = np.asarray(k, dtype=np.float64)
+    cos_phi, sin_phi = turn_cos_sin(k, props.steps, dtype)
+    # theta = -pi / 2 + k * pi / (steps - 1), beginning at south pole
+    cos_theta, sin_theta = turn_cos_sin(k + (steps - 1) * 1.5, (steps - 1) * 2, dtype)
 
-        verts.extend([px, py, pz, 1])
-        cur_theta += step_theta
-        cur_phi += step_phi
-
-    return verts
+    # Coordinate Transformation sphere->rect
+    ring = props.radius * cos_theta
+    return ring * cos_phi, ring * sin_phi * sign, props.radius * sin_theta
 
 
 # make torus spiral
 # ----------------------------------------------------------------------------
 
-def make_spiral_torus(props, context):
+def torus_curve(props, k, dtype=np.float32):
     # INPUT: turns, steps, inner_radius, curves_number,
     # mul_height, dif_inner_radius, cycles
-    max_phi = 2 * pi * props.turns * props.cycles  # max angle in radian
-    step_phi = 2 * pi / props.steps  # Step of angle in radians between two vertices
+    steps = props.steps * props.turns
+    sign = (1, -1)[props.spiral_direction == 'CLOCKWISE']  # flip direction
+
+    k = np.asarray(k, dtype=np.float64)
+    # Inner Ring Radius Angle, one turn per props.steps
+    cos_phi, sin_phi = turn_cos_sin(k, props.steps, dtype)
+    # Ring Radius Angle (times the curves number), one turn per steps
+    cos_theta, sin_theta = turn_cos_sin(k * props.curves_number, steps, dtype)
+    k = k.astype(dtype)
+    rad = props.radius + k * (props.dif_radius / steps)
+    inner_rad = props.inner_radius + k * (props.dif_inner_radius / props.steps)
+
+    if props.touch and props.spiral_direction != 'CLOCKWISE':
+        # no empty spaces: the height step follows the inner radius of each
+        # cycle, z is the sum of the steps before k
+        cycle = np.floor(k / props.steps)
+        rest = k - cycle * props.steps
+        z = (props.inner_radius * k + props.dif_inner_radius *
+             (props.steps * cycle * (cycle + 1) / 2 + (cycle + 1) * rest)) * 2 / steps
+    elif props.touch:
+        # clockwise: the height step of the first cycle
+        z = k * ((props.dif_inner_radius + props.inner_radius) * 2 / steps)
+    else:
+        z = k * (props.dif_z / steps)
+
+    # Torus Coordinates -> Rect
+    ring = rad + inner_rad * cos_phi
+    return ring * cos_theta, ring * sin_theta, inner_rad * sin_phi * sign + z
+
+
+# kernel of each spiral type and its number of fixed samples
+CURVES = {
+    # from the first vertex to the end of the last turn
+    'ARCH': (spiral_curve, lambda props: props.steps * props.turns + 1),
+    'LOG': (spiral_curve, lambda props: props.steps * props.turns + 1),
+    # from the south pole to the north pole
+    'SPHERE': (spheric_curve, lambda props: props.steps * props.turns),
+    # up to the end of the last cycle
+    'TORUS': (torus_curve,
+              lambda props: int(props.turns * props.cycles * props.steps + 1e-9) + 1),
+    'EXO': (exo_curve, lambda props: props.steps * props.turns),
+    'CORNU': (cornu_curve, lambda props: props.resolution),
+}
 
-    if props.spiral_direction == 'CLOCKWISE':  # flip direction
-        step_phi *= -1
-        max_phi *= -1
 
-    step_theta = (2 * pi / props.turns) / props.steps
-    step_rad = props.dif_radius / (props.steps * props.turns)
-    step_inner_rad = props.dif_inner_radius / props.steps
-    step_z = props.dif_z / (props.steps * props.turns)
+def spiral_samples(props):
+    '''
+        kernel and sample indices of the spiral of props
+    '''
+    curve, count = CURVES[props.spiral_type]
+    return curve, sample_indices(props, curve, count(props))
 
-    verts = []
 
-    cur_phi = 0  # Inner Ring Radius Angle
-    cur_theta = 0  # Ring Radius Angle
-    cur_rad = props.radius
-    cur_inner_rad = props.inner_radius
-    cur_z = 0
-    n_cycle = 0
+def make_spiral(props, context=None):
+    '''
+        flat (x, y, z, w) float32 buffer of the points of the spiral of props
+    '''
+    curve, k = spiral_samples(props)
+    return flat_verts(curve(props, k))
+
+
+# Bezier fitting (Schneider, Graphics Gems): the fitted points subdivide the
+# samples, their tangents are central differences of the kernel, a segment
+# is reparameterized a few times before being split, and the fit starts
+# from spans turning by at most FIT_MAX_TURN radians and of at most FIT_SPAN
+# points, so that the curve is not split one end at a time
+#
+# the tangents are not derived analytically so that each spiral type keeps
+# a single kernel (the torus height is piecewise, the Cornu spiral goes
+# through the Fresnel integrals): in float64, a central difference over
+# FIT_DERIVATIVE_STEP indices is within 1e-9 of the derivative relative to
+# its length (1.6e-6 at the fast end of a Cornu spiral of length 100),
+# far below what the fit error can see
+FIT_SUBDIVISIONS = 4
+FIT_ITERATIONS = 4
+FIT_DERIVATIVE_STEP = 1e-4
+FIT_MAX_TURN = pi / 2
+FIT_SPAN = 1024
+
+
+def bezier_point(control, u):
+    '''
+        points of the cubic Bezier segment of the (4, 3) control points at
+        the parameters u
+    '''
+    u = u[:, None]
+    v = 1.0 - u
+    return (v * v * v * control[0] + 3.0 * v * v * u * control[1] +
+            3.0 * v * u * u * control[2] + u * u * u * control[3])
 
-    while abs(cur_phi) <= abs(max_phi):
-        # Torus Coordinates -> Rect
-        px = (cur_rad + cur_inner_rad * cos(cur_phi)) * \
-            cos(props.curves_number * cur_theta)
-        py = (cur_rad + cur_inner_rad * cos(cur_phi)) * \
-            sin(props.curves_number * cur_theta)
-        pz = cur_inner_rad * sin(cur_phi) + cur_z
 
-        verts.extend([px, py, pz, 1])
+def bezier_segment(points, u, tangent0, tangent1):
+    '''
+        (4, 3) control points of the least squares cubic Bezier segment from
+        the first to the last of the points at the parameters u, leaving and
+        reaching them along the unit tangents
+    '''
+    p0, p3 = points[0], points[-1]
+    u = u[:, None]
+    v = 1.0 - u
+    a0 = 3.0 * v * v * u * tangent0
+    a1 = -3.0 * v * u * u * tangent1
+    rest = points - v * v * (v + 3.0 * u) * p0 - u * u * (u + 3.0 * v) * p3
+
+    c00 = (a0 * a0).sum()
+    c01 = (a0 * a1).sum()
+    c11 = (a1 * a1).sum()
+    x0 = (a0 * rest).sum()
+    x1 = (a1 * rest).sum()
+
+    # handles of a third of the chord when the solution degenerates
+    chord = np.linalg.norm(p3 - p0)
+    alpha0 = alpha1 = chord / 3.0
+    det = c00 * c11 - c01 * c01
+    if det != 0.0:
+        fit0 = (x0 * c11 - c01 * x1) / det
+        fit1 = (c00 * x1 - c01 * x0) / det
+        if fit0 > 1e-6 * chord and fit1 > 1e-6 * chord:
+            alpha0, alpha1 = fit0, fit1
+
+    return np.array((p0, p0 + alpha0 * tangent0, p3 - alpha1 * tangent1, p3))
+
+
+def reparameterize(control, points, u):
+    '''
+        parameters u of the points improved by a Newton step towards their
+        nearest points on the Bezier segment
+    '''
+    d1 = 3.0 * (control[1:] - control[:-1])
+    d2 = 2.0 * (d1[1:] - d1[:-1])
+    offset = bezier_point(control, u) - points
+    t = u[:, None]
+    v = 1.0 - t
+    q1 = v * v * d1[0] + 2.0 * v * t * d1[1] + t * t * d1[2]
+    q2 = v * d2[0] + t * d2[1]
+    numerator = (offset * q1).sum(axis=1)
+    denominator = (q1 * q1).sum(axis=1) + (offset * q2).sum(axis=1)
+    step = numerator / np.where(denominator != 0.0, denominator, 1.0)
+    return np.clip(u - step, 0.0, 1.0)
+
+
+def fit_bezier(points, tangents, tolerance):
+    '''
+        (M, 4, 3) control points of cubic Bezier segments passing within
+        tolerance of the (N, 3) points, tangents being the tangents of the
+        curve at the points
+    '''
+    lengths = np.linalg.norm(tangents, axis=1)
+    tangents = np.where((lengths > 0.0)[:, None], tangents, np.gradient(points, axis=0))
+    lengths = np.linalg.norm(tangents, axis=1)
+    tangents = tangents / np.where(lengths > 0.0, lengths, 1.0)[:, None]
+
+    turning = np.arccos(np.clip(np.einsum('ij,ij->i', tangents[:-1], tangents[1:]), -1.0, 1.0))
+    turning = np.concatenate(([0.0], np.cumsum(turning)))
+    starts = np.searchsorted(turning, np.arange(FIT_MAX_TURN, turning[-1], FIT_MAX_TURN))
+    starts = np.union1d(starts, np.arange(0, len(points), FIT_SPAN))
+    starts = np.union1d(starts[(starts > 0) & (starts < len(points) - 1)], (0, len(points) - 1))
+    starts = starts.tolist()
+
+    segments = []
+    stack = list(zip(starts[-2::-1], starts[:0:-1]))
+    while stack:
+        first, last = stack.pop()
+        span = points[first:last + 1]
+        chords = np.sqrt(np.einsum('ij,ij->i', *(span[1:] - span[:-1],) * 2))
+        total = chords.sum()
+        if total == 0.0:
+            segments.append(np.repeat(span[:1], 4, axis=0))
+            continue
+        u = np.concatenate(([0.0], np.cumsum(chords))) / total
+
+        for iteration in range(FIT_ITERATIONS + 1):
+            control = bezier_segment(span, u, tangents[first], tangents[last])
+            offset = bezier_point(control, u) - span
+            errors = np.einsum('ij,ij->i', offset, offset)
+            worst = int(np.argmax(errors))
+            if errors[worst] <= tolerance * tolerance or last - first < 2:
+                segments.append(control)
+                break
+            # far off: split at the worst point, else try better parameters
+            if iteration == FIT_ITERATIONS or errors[worst] > 16.0 * tolerance * tolerance:
+                split = first + min(max(worst, 1), last - first - 1)
+                stack.append((split, last))
+                stack.append((first, split))
+                break
+            u = reparameterize(control, span, u)
+
+    return np.array(segments).reshape(-1, 4, 3)
+
+
+def make_spiral_bezier(props, context=None):
+    '''
+        flat float32 (co, handle_left, handle_right) buffers of the Bezier
+        points fitted to the spiral of props within props.fit_error
+    '''
+    curve, k = spiral_samples(props)
+
+    def evaluate(k):
+        return np.column_stack(np.broadcast_arrays(*curve(props, k, np.float64)))
+
+    if len(k) < 2:
+        co = evaluate(k).astype(np.float32).ravel()
+        return co, co, co
+
+    samples = np.arange((len(k) - 1) * FIT_SUBDIVISIONS + 1) / FIT_SUBDIVISIONS
+    k = np.interp(samples, np.arange(len(k)), k)
+    tangents = evaluate(k + FIT_DERIVATIVE_STEP) - evaluate(k - FIT_DERIVATIVE_STEP)
+    controls = fit_bezier(evaluate(k), tangents, props.fit_error)
+
+    # the handles of the ends mirror their inner handle
+    co = np.concatenate((controls[:, 0], controls[-1:, 3]))
+    left = np.concatenate(([2.0 * controls[0, 0] - controls[0, 1]], controls[:, 2]))
+    right = np.concatenate((controls[:, 1], [2.0 * controls[-1, 3] - controls[-1, 2]]))
+    return tuple(points.astype(np.float32).ravel() for points in (co, left, right))
+
+
+# properties the points of each spiral type depend on
+SPIRAL_PROPERTIES = {
+    'ARCH': ('spiral_direction', 'turns', 'steps', 'radius', 'dif_z', 'dif_radius'),
+    'LOG': ('spiral_direction', 'turns', 'steps', 'radius', 'dif_z', 'B_force'),
+    'SPHERE': ('spiral_direction', 'turns', 'steps', 'radius'),
+    'TORUS': ('spiral_direction', 'turns', 'steps', 'radius', 'dif_z', 'dif_radius',
+              'inner_radius', 'dif_inner_radius', 'cycles', 'curves_number', 'touch'),
+    'EXO': ('spiral_direction', 'turns', 'steps', 'iRadius', 'eRadius', 'slope', 'scale'),
+    'CORNU': ('length', 'resolution', 'scale'),
+}
 
-        if props.touch and cur_phi >= n_cycle * 2 * pi:
-            step_z = ((n_cycle + 1) * props.dif_inner_radius +
-                      props.inner_radius) * 2 / (props.steps * props.turns)
-            n_cycle += 1
+# bytes of point buffers kept, so that the redo panel does not compute the
+# spiral again when the other properties are changed or a value comes back
+CACHE_BYTES = 64 << 20
 
-        cur_theta += step_theta
-        cur_phi += step_phi
-        cur_rad += step_rad
-        cur_inner_rad += step_inner_rad
-        cur_z += step_z
+_cache = OrderedDict()  # (output, spiral_key) -> read only buffers
 
-    return verts
 
+def spiral_key(props):
+    '''
+        normalized (spiral_type, sampling, tolerance, values...) of the
+        properties the points of the spiral depend on
+    '''
+    names = SPIRAL_PROPERTIES[props.spiral_type]
+    tolerance = float(props.tolerance) if props.sampling == 'TOLERANCE' else 0.0
+    return (props.spiral_type, props.sampling, tolerance) + tuple(
+        value if isinstance(value, str) else
+        int(value) if isinstance(value, (bool, int)) else float(value)
+        for value in (getattr(props, name) for name in names))
+
+
+def _cached(make, props, **values):
+    # read only result of make(props) computed from the normalized
+    # properties, with the extra values it depends on
+    key = (make.__name__, tuple(sorted(values.items())), spiral_key(props))
+    buffers = _cache.get(key)
+    if buffers is not None:
+        _cache.move_to_end(key)
+        return buffers
+
+    spiral = key[2]
+    values.update(zip(SPIRAL_PROPERTIES[props.spiral_type], spiral[3:]))
+    values.update(spiral_type=spiral[0], sampling=spiral[1], tolerance=spiral[2])
+    buffers = make(SimpleNamespace(**values))
+    for buffer in (buffers if isinstance(buffers, tuple) else (buffers,)):
+        buffer.flags.writeable = False
+
+    def nbytes(buffers):
+        return sum(buffer.nbytes for buffer in buffers) if isinstance(buffers, tuple) \
+            else buffers.nbytes
+
+    if nbytes(buffers) <= CACHE_BYTES:
+        _cache[key] = buffers
+        size = sum(nbytes(cached) for cached in _cache.values())
+        while size > CACHE_BYTES:
+            size -= nbytes(_cache.popitem(last=False)[1])
+    return buffers
+
+
+def spiral_verts(props):
+    '''
+        flat (x, y, z, w) float32 point buffer of the spiral of props, read
+        only as it is shared with the following calls with the same points
+    '''
+    return _cached(make_spiral, props)
 
-def draw_curve(props, context):
-    if props.spiral_type == 'ARCH':
-        verts = make_spiral(props, context)
-    if props.spiral_type == 'LOG':
-        verts = make_spiral(props, context)
-    if props.spiral_type == 'SPHERE':
-        verts = make_spiral_spheric(props, context)
-    if props.spiral_type == 'TORUS':
-        verts = make_spiral_torus(props, context)
-    if props.spiral_type == 'EXO':
-        verts = make_exo_spiral(props, context)
-    if props.spiral_type == 'CORNU':
-        verts = make_cornu_spiral(props, context)
 
-    curve_data = bpy.data.curves.new(name='Spiral', type='CURVE')
-    curve_data.dimensions = '3D'
+def spiral_bezier(props):
+    '''
+        read only (co, handle_left, handle_right) buffers of the Bezier
+        points fitted to the spiral of props (see make_spiral_bezier)
+    '''
+    return _cached(make_spiral_bezier, props, fit_error=float(props.fit_error))
 
-    spline = curve_data.splines.new(type=props.curve_type)
+
+def add_spline(curve_data, curve_type, buffers):
+    '''
+        add a spline of curve_type with the points of buffers: a flat
+        (x, y, z, w) buffer, or the (co, handle_left, handle_right) buffers
+        of the Bezier points
+    '''
+    spline = curve_data.splines.new(type=curve_type)
     """
     if props.curve_type == 0:
         spline = curve_data.splines.new(type='POLY')
     elif props.curve_type == 1:
         spline = curve_data.splines.new(type='NURBS')
     """
-    spline.points.add(len(verts) * 0.25 - 1)
-    # Add only one quarter of points as elements in verts,
-    # because verts looks like: "x,y,z,?,x,y,z,?,x,..."
-    spline.points.foreach_set('co', verts)
+    if curve_type == 'BEZIER':
+        co, handle_left, handle_right = buffers
+        spline.bezier_points.add(len(co) // 3 - 1)
+        # the fitted handles are aligned at the joints
+        for point in spline.bezier_points:
+            point.handle_left_type = point.handle_right_type = 'ALIGNED'
+        spline.bezier_points.foreach_set('co', co)
+        spline.bezier_points.foreach_set('handle_left', handle_left)
+        spline.bezier_points.foreach_set('handle_right', handle_right)
+    else:
+        spline.points.add(len(buffers) // 4 - 1)
+        # the flat float32 buffer "x,y,z,w,x,y,z,w,x,..."
+        spline.points.foreach_set('co', buffers)
+    return spline
+
+
+def draw_curve(props, context):
+    curve_data = bpy.data.curves.new(name='Spiral', type='CURVE')
+    curve_data.dimensions = '3D'
+
+    if props.curve_type == 'BEZIER':
+        add_spline(curve_data, props.curve_type, spiral_bezier(props))
+    else:
+        add_spline(curve_data, props.curve_type, spiral_verts(props))
     new_obj = object_data_add(context, curve_data)
 
 
-class CURVE_OT_spirals(Operator):
-    bl_idname = "curve.spirals"
-    bl_label = "Curve Spirals"
-    bl_description = "Create different types of spirals"
-    bl_options = {'REGISTER', 'UNDO'}
+# make spiral field: many spirals as the splines of a few curves
+# ----------------------------------------------------------------------------
+
+# Bezier points of a field: the knots are spread by the density of the
+# cubic error, measured at FIELD_FIT_SUBDIVISIONS points per sample, for a
+# fraction of the fit error; the segments still off by more than the fit
+# error at FIELD_FIT_CHECKS are split, at most FIELD_FIT_PASSES times, in up
+# to FIELD_FIT_MAX_SPLIT segments (after scaling the knot count once if this
+# is the case of more than 100 - FIELD_FIT_PERCENTILE % of them). The knots
+# are shared by batches of at most FIELD_CHUNK spirals needing about as many
+# knots.
+FIELD_FIT_MARGIN = 0.8
+FIELD_FIT_SUBDIVISIONS = 1
+FIELD_FIT_PERCENTILE = 90
+FIELD_FIT_CHECKS = (0.25, 0.5, 0.75)
+FIELD_FIT_PASSES = 4
+FIELD_FIT_MAX_SPLIT = 8
+FIELD_CHUNK = 64
+
+# size properties varied by random_field
+FIELD_PROPERTIES = ('turns', 'radius', 'dif_z', 'dif_radius', 'inner_radius',
+                    'iRadius', 'eRadius', 'scale', 'length')
+
+
+def spiral_values(props):
+    '''
+        {name: value} of all the properties spirals depend on
+    '''
+    names = set(('spiral_type', 'curve_type', 'sampling', 'tolerance', 'fit_error'))
+    names.update(*SPIRAL_PROPERTIES.values())
+    return {name: getattr(props, name) for name in names}
+
+
+def random_field(props, count, seed=0, variation=0.0, area=10.0, rotate=True):
+    '''
+        per spiral parameters of a field of count spirals of props scattered
+        over an area x area square around the origin, their size properties
+        scaled by random factors in [1 - variation, 1 + variation]
+
+        returns (locations (count, 2), angles (count), {name: values}), the
+        arguments of make_spiral_field
+    '''
+    values = spiral_values(props)
+    random = np.random.RandomState(seed)
+
+    locations = random.uniform(-area / 2, area / 2, (count, 2))
+    angles = random.uniform(0.0, 2 * pi, count) if rotate else np.zeros(count)
+    arrays = {}
+    for name in FIELD_PROPERTIES:
+        arrays[name] = values[name] * random.uniform(1.0 - variation, 1.0 + variation, count)
+    arrays['turns'] = np.maximum(np.rint(arrays['turns']), 1).astype(int)
+    return locations, angles, arrays
+
+
+def batch_points(curve, props, k, count, dtype=np.float32):
+    '''
+        (count, len(k), 3) points of count spirals evaluated in one call of
+        their kernel, props holding (count, 1) columns for the properties
+        taking one value per spiral
+    '''
+    shape = (count, len(k))
+    return np.stack([np.broadcast_to(values, shape) for values in curve(props, k, dtype)],
+                    axis=-1)
+
+
+def knot_points(k):
+    '''
+        points over the range of the sample indices k where the Bezier knot
+        density is measured
+    '''
+    first, last = float(k[0]), float(k[-1])
+    return np.linspace(first, last, int(round(last - first)) * FIELD_FIT_SUBDIVISIONS + 1)
+
+
+def knot_density(curve, props, k, count):
+    '''
+        (count, len(knot_points(k))) Bezier knot density of count spirals
+        (see batch_points): |d| * c^(3/4) per unit of k, d being the
+        derivative and c the curvature
+    '''
+    g = knot_points(k)
+    step = FIT_DERIVATIVE_STEP
+    before, middle, after = (batch_points(curve, props, g + offset, count, np.float64)
+                             for offset in (-step, 0.0, step))
+    d1 = (after - before) / (2.0 * step)
+    d2 = (after - 2.0 * middle + before) / (step * step)
+    speed = np.sqrt(np.einsum('ijk,ijk->ij', d1, d1))
+    bend = np.cross(d1, d2)
+    bend = np.sqrt(np.einsum('ijk,ijk->ij', bend, bend))
+    return bend ** 0.75 / np.maximum(speed, 1e-300) ** 1.25
+
+
+def batch_bezier(curve, props, k, count, tolerance, density=None):
+    '''
+        (co, handle_left, handle_right) (count, M, 3) Bezier points of count
+        spirals over the range of the sample indices k (see batch_points)
+
+        the points are the cubic Hermite interpolation of the kernel on
+        shared knots, their handles a third of the knot spacing along the
+        derivative. A segment turning by an angle a on a radius r is off by
+        about r * a^4 / 384, so the knots are spread with the knot density
+        divided by (384 * tolerance)^(1/4): the density given at the
+        knot_points of k, or the largest one of the spirals
+    '''
+    step = FIT_DERIVATIVE_STEP
+
+    def evaluate(t):
+        return batch_points(curve, props, t, count, np.float64)
+
+    def derivative(t):
+        return (evaluate(t + step) - evaluate(t - step)) / (2.0 * step)
+
+    def errors(t, points, tangents, segments):
+        # largest deviation from the spirals inside the segments
+        a, b = segments, segments + 1
+        h = (t[b] - t[a])[:, None]
+        error = np.zeros(len(segments))
+        for u in FIELD_FIT_CHECKS:
+            v = 1.0 - u
+            bezier = (v * v * (v + 3.0 * u) * points[:, a] + u * u * (u + 3.0 * v) * points[:, b] +
+                      u * v * h * (v * tangents[:, a] - u * tangents[:, b]))
+            offset = bezier - evaluate(t[a] + u * h[:, 0])
+            error = np.maximum(error, np.sqrt(np.einsum('ijk,ijk->ij', offset, offset).max(axis=0)))
+        return error
+
+    g = knot_points(k)
+    if density is None:
+        density = knot_density(curve, props, k, count).max(axis=0)
+    density = density + 1e-9
+    cumulative = np.concatenate(([0.0], np.cumsum((density[1:] + density[:-1]) / 2 * np.diff(g))))
+    knots = cumulative[-1] / (384.0 * tolerance * FIELD_FIT_MARGIN) ** 0.25
+
+    # the estimate misses the torsion: when most segments are off, place the
+    # knots once more with their count scaled by the error they have
+    for recount in range(2):
+        t = np.interp(np.linspace(0.0, cumulative[-1], max(int(np.ceil(knots)), 1) + 1),
+                      cumulative, g)
+        points, tangents = evaluate(t), derivative(t)
+        error = errors(t, points, tangents, np.arange(len(t) - 1))
+        scale = np.percentile(error, FIELD_FIT_PERCENTILE) / (tolerance * FIELD_FIT_MARGIN)
+        if scale <= 1.0 or recount:
+            break
+        knots *= scale ** 0.25
+
+    # split the segments off by more than tolerance
+    for _ in range(FIELD_FIT_PASSES):
+        bad = error > tolerance
+        if not bad.any():
+            break
+        segments = np.flatnonzero(bad)
+        splits = np.ceil((error[bad] / (tolerance * FIELD_FIT_MARGIN)) ** 0.25)
+        splits = np.clip(splits, 2, FIELD_FIT_MAX_SPLIT).astype(int)
+        owner = np.repeat(np.arange(len(segments)), splits - 1)
+        part = np.arange(len(owner)) - np.repeat(np.cumsum(splits - 1) - (splits - 1), splits - 1) + 1
+        a = segments[owner]
+        new = t[a] + (t[a + 1] - t[a]) * (part / splits[owner])
+
+        order = np.argsort(np.concatenate((t, new)), kind='stable')
+        t = np.concatenate((t, new))[order]
+        points = np.concatenate((points, evaluate(new)), axis=1)[:, order]
+        tangents = np.concatenate((tangents, derivative(new)), axis=1)[:, order]
+        added = order >= len(order) - len(new)
+        changed = added[:-1] | added[1:]
+        kept = error[~bad]
+        error = np.empty(len(t) - 1)
+        error[~changed] = kept
+        error[changed] = errors(t, points, tangents, np.flatnonzero(changed))
+
+    h = np.diff(t)[:, None]
+    left = points - tangents * (np.concatenate((h[:1], h)) / 3.0)
+    right = points + tangents * (np.concatenate((h, h[-1:])) / 3.0)
+    return points, left, right
+
+
+def place_points(points, locations, angles):
+    '''
+        (N, M, 3) points of N spirals turned in place by the angles around Z
+        and moved to the (N, 2) locations
+    '''
+    cos_angle = np.cos(angles)[:, None]
+    sin_angle = np.sin(angles)[:, None]
+    x = points[..., 0] * cos_angle - points[..., 1] * sin_angle
+    y = points[..., 0] * sin_angle + points[..., 1] * cos_angle
+    points[..., 0] = x + locations[:, 0, None]
+    points[..., 1] = y + locations[:, 1, None]
+    return points
+
+
+def make_spiral_field(props, locations, angles, **arrays):
+    '''
+        point buffers of spirals of props placed at the (N, 2) locations and
+        turned by the angles around Z, the properties given as keyword
+        arrays taking one value per spiral
+
+        the spirals with the same sample indices are evaluated together, as
+        (spirals, samples) arrays; only the spirals sampled by tolerance
+        have their own indices and are evaluated one by one. Bezier points
+        are interpolated for the whole group (see batch_bezier) instead of
+        being fitted to each spiral.
+
+        returns the flat (x, y, z, w) buffer of each spiral, or its
+        (co, handle_left, handle_right) buffers for Bezier curves
+    '''
+    values = spiral_values(props)
+    arrays = {name: np.asarray(array) for name, array in arrays.items()}
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    angles = np.asarray(angles, dtype=np.float64).reshape(-1)
+    curve, samples = CURVES[values['spiral_type']]
+    bezier = values['curve_type'] == 'BEZIER'
+
+    def instance(index):
+        return SimpleNamespace(**dict(values, **{name: array[index].item()
+                                                 for name, array in arrays.items()}))
+
+    # spirals sharing their sample indices, the range of k for Bezier points
+    counts = np.array([samples(instance(index)) for index in range(len(locations))], dtype=int)
+    if bezier or values['sampling'] != 'TOLERANCE':
+        groups = [(np.flatnonzero(counts == count), np.arange(count))
+                  for count in np.unique(counts)]
+    else:
+        groups = [(np.array([index]), sample_indices(instance(index), curve, count))
+                  for index, count in enumerate(counts)]
+
+    def columns(indices):
+        batch = SimpleNamespace(**values)
+        for name, array in arrays.items():
+            setattr(batch, name, array[indices, None])
+        return batch
+
+    def chunks(indices):
+        return np.array_split(indices, -(-len(indices) // FIELD_CHUNK))
+
+    # Bezier knots are shared by a batch: batch the spirals needing about as
+    # many knots, their density measured one chunk at a time
+    batches = [(indices, k, None) for indices, k in groups]
+    if bezier:
+        batches = []
+        for indices, k in groups:
+            if len(k) < 2:
+                batches.append((indices, k, None))
+                continue
+            density = np.concatenate([knot_density(curve, columns(chunk), k, len(chunk))
+                                      for chunk in chunks(indices)])
+            order = np.argsort(density.sum(axis=1), kind='stable')
+            batches.extend((indices[chunk], k, density[chunk].max(axis=0))
+                           for chunk in chunks(order))
+
+    spirals = [None] * len(locations)
+    for indices, k, density in batches:
+        batch = columns(indices)
+
+        if bezier and len(k) > 1:
+            buffers = [place_points(points, locations[indices], angles[indices])
+                       .astype(np.float32).reshape(len(indices), -1)
+                       for points in batch_bezier(curve, batch, k, len(indices),
+                                                  values['fit_error'], density)]
+            for row, index in enumerate(indices):
+                spirals[index] = tuple(buffer[row] for buffer in buffers)
+            continue
+
+        points = place_points(batch_points(curve, batch, k, len(indices)).astype(np.float64),
+                              locations[indices], angles[indices])
+        if bezier:
+            co = points.astype(np.float32).reshape(len(indices), -1)
+            for row, index in enumerate(indices):
+                spirals[index] = (co[row],) * 3
+            continue
+        verts = np.ones(points.shape[:2] + (4,), dtype=np.float32)
+        verts[..., :3] = points
+        verts = verts.reshape(len(indices), -1)
+        for row, index in enumerate(indices):
+            spirals[index] = verts[row]
+
+    return spirals
+
+
+def add_spiral_field(context, props, spirals, objects=1, name="Spiral Field"):
+    '''
+        add the spirals of make_spiral_field as the splines of objects
+        curves of props.curve_type, returns the new curves
+    '''
+    curves = []
+    for chunk in np.array_split(np.arange(len(spirals)), max(min(objects, len(spirals)), 1)):
+        curve_data = bpy.data.curves.new(name=name, type='CURVE')
+        curve_data.dimensions = '3D'
+        for index in chunk:
+            add_spline(curve_data, props.curve_type, spirals[index])
+        object_data_add(context, curve_data)
+        curves.append(curve_data)
+    return curves
+
+
+class SpiralProperties:
+    # properties of a spiral, shared by the spiral operators
 
     def type_update_callback(self, context):
         if self.spiral_type == 'EXO':
@@ -317,11 +994,18 @@ class CURVE_OT_spirals(Operator):
     )
     curve_type = EnumProperty(
         items=[('POLY', "Poly", "PolyLine"),
-               ("NURBS", "NURBS", "NURBS")],
+               ("NURBS", "NURBS", "NURBS"),
+               ("BEZIER", "Bezier", "Bezier curve fitted to the spiral")],
         default='POLY',
         name="Curve Type",
         description="Type of spline to use"
     )
+    fit_error = FloatProperty(
+        default=0.001,
+        min=0.000001, max=10.00,
+        precision=4,
+        description="Maximum distance between the Bezier curve and the spiral"
+    )
     spiral_direction = EnumProperty(
         items=[('COUNTER_CLOCKWISE', "Counter Clockwise",
                 "Wind in a counter clockwise direction"),
@@ -331,6 +1015,21 @@ class CURVE_OT_spirals(Operator):
         name="Spiral Direction",
         description="Direction of winding"
     )
+    sampling = EnumProperty(
+        items=[('STEPS', "Steps", "Fixed number of vertices per turn"),
+               ('TOLERANCE', "Tolerance",
+                "Place the vertices so that the curve deviates at most by "
+                "the tolerance from the spiral")],
+        default='STEPS',
+        name="Sampling",
+        description="Placement of the vertices along the spiral"
+    )
+    tolerance = FloatProperty(
+        default=0.001,
+        min=0.000001, max=10.00,
+        precision=4,
+        description="Maximum distance between the curve and the spiral"
+    )
     turns = IntProperty(
         default=1,
         min=1, max=1000,
@@ -415,35 +1114,29 @@ class CURVE_OT_spirals(Operator):
         description="Curve Length")
     resolution = IntProperty(
         default=1000, min=1, max=10000, description="Curve Resolution")
+    # not used anymore, the integrals are evaluated directly (kept for
+    # the scripts and presets setting it)
     epsilon = IntProperty(
         default=100, min=1, max=10000,
-        description="Integral Resolution")
+        description="Integral Resolution (unused)")
     scale = FloatProperty(
         default=1.0, min=0.10,
         max=100.00, description="Scale")
 
-    def draw(self, context):
-        layout = self.layout
-        col = layout.column_flow(align=True)
-
-        col.label("Presets:")
-
-        row = col.row(align=True)
-        row.menu("OBJECT_MT_spiral_curve_presets",
-                 text=bpy.types.OBJECT_MT_spiral_curve_presets.bl_label)
-        row.operator("curve_extras.spiral_presets", text="", icon='ZOOMIN')
-        op = row.operator("curve_extras.spiral_presets",
-                          text="", icon='ZOOMOUT')
-        op.remove_active = True
-
+    def draw_spiral(self, layout):
         layout.prop(self, "spiral_type")
         layout.prop(self, "curve_type")
+        if self.curve_type == 'BEZIER':
+            layout.prop(self, "fit_error", text="Fit Error")
         layout.prop(self, "spiral_direction")
 
         col = layout.column(align=True)
         col.label(text="Spiral Parameters:")
         col.prop(self, "turns", text="Turns")
         col.prop(self, "steps", text="Steps")
+        col.prop(self, "sampling", text="")
+        if self.sampling == 'TOLERANCE':
+            col.prop(self, "tolerance", text="Tolerance")
 
         box = layout.box()
         if self.spiral_type == 'ARCH':
@@ -496,9 +1189,31 @@ class CURVE_OT_spirals(Operator):
         if self.spiral_type == 'CORNU':
             box.prop(self, 'length', text="L")
             box.prop(self, 'resolution', text="N")
-            box.prop(self, 'epsilon', text="M ")
             box.prop(self, 'scale', text="Scale ")
 
+
+class CURVE_OT_spirals(SpiralProperties, Operator):
+    bl_idname = "curve.spirals"
+    bl_label = "Curve Spirals"
+    bl_description = "Create different types of spirals"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def draw(self, context):
+        layout = self.layout
+        col = layout.column_flow(align=True)
+
+        col.label("Presets:")
+
+        row = col.row(align=True)
+        row.menu("OBJECT_MT_spiral_curve_presets",
+                 text=bpy.types.OBJECT_MT_spiral_curve_presets.bl_label)
+        row.operator("curve_extras.spiral_presets", text="", icon='ZOOMIN')
+        op = row.operator("curve_extras.spiral_presets",
+                          text="", icon='ZOOMOUT')
+        op.remove_active = True
+
+        self.draw_spiral(layout)
+
     @classmethod
     def poll(cls, context):
         return context.scene is not None
@@ -513,6 +1228,74 @@ class CURVE_OT_spirals(Operator):
         return {'FINISHED'}
 
 
+class CURVE_OT_spiral_field(SpiralProperties, Operator):
+    bl_idname = "curve.spiral_field"
+    bl_label = "Spiral Field"
+    bl_description = "Scatter many random spirals as the splines of a few curves"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    count = IntProperty(
+        default=100,
+        min=1, max=100000,
+        description="Number of spirals"
+    )
+    seed = IntProperty(
+        default=0,
+        min=0,
+        description="Seed of the random placement and variation"
+    )
+    variation = FloatProperty(
+        default=0.25,
+        min=0.00, max=1.00,
+        description="Random variation of the size properties of each spiral, "
+                    "as a fraction of their value"
+    )
+    area = FloatProperty(
+        default=10.0,
+        min=0.00, max=10000.00,
+        description="Size of the square the spirals are scattered over"
+    )
+    random_rotation = BoolProperty(
+        default=True,
+        description="Turn each spiral by a random angle around Z"
+    )
+    objects = IntProperty(
+        default=1,
+        min=1, max=1000,
+        description="Number of curve objects the spirals are split into"
+    )
+
+    def draw(self, context):
+        layout = self.layout
+
+        col = layout.column(align=True)
+        col.label(text="Field Parameters:")
+        col.prop(self, "count", text="Count")
+        col.prop(self, "seed", text="Seed")
+        col.prop(self, "variation", text="Variation")
+        col.prop(self, "area", text="Area")
+        col.prop(self, "objects", text="Objects")
+        col.prop(self, "random_rotation", text="Random Rotation")
+
+        self.draw_spiral(layout)
+
+    @classmethod
+    def poll(cls, context):
+        return context.scene is not None
+
+    def execute(self, context):
+        time_start = time.time()
+        locations, angles, arrays = random_field(self, self.count, self.seed, self.variation,
+                                                 self.area, self.random_rotation)
+        spirals = make_spiral_field(self, locations, angles, **arrays)
+        add_spiral_field(context, self, spirals, self.objects)
+
+        self.report({'INFO'},
+                    "Drawing Spiral Field Finished: %.4f sec" % (time.time() - time_start))
+
+        return {'FINISHED'}
+
+
 class CURVE_EXTRAS_OT_spirals_presets(AddPresetBase, Operator):
     bl_idname = "curve_extras.spiral_presets"
     bl_label = "Spirals"
@@ -526,9 +1309,12 @@ class CURVE_EXTRAS_OT_spirals_presets(AddPresetBase, Operator):
     preset_values = [
         "op.spiral_type",
         "op.curve_type",
+        "op.fit_error",
         "op.spiral_direction",
         "op.turns",
         "op.steps",
+        "op.sampling",
+        "op.tolerance",
         "op.radius",
         "op.dif_z",
         "op.dif_radius",
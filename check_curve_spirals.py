@@ -0,0 +1,210 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+"""
+Accuracy checks of the spirals of add_curve_spirals.py.
+
+The Cornu spiral used to be integrated from 0 for each point with an epsilon step
+Riemann sum. The Fresnel integral evaluation replacing it is compared with
+that step sum run at a high resolution (STEPS), whose own error is below
+STEPS_ERROR * length / STEPS, and with the step sum at the default epsilon.
+
+The samples placed by the chordal tolerance are checked against the curve
+in between: no chord may deviate by more than the tolerance.
+
+Run with the add-on next to this script, with plain python (the Blender
+modules the add-on imports are then stubbed) or as a blender script:
+
+python check_curve_spirals.py
+blender --background --python check_curve_spirals.py
+"""
+
+import os
+import sys
+import importlib.util
+from types import ModuleType, SimpleNamespace
+
+import numpy as np
+
+# resolution of the reference step sum, and the bound of its error for a
+# unit length: a left Riemann sum of a function bounded by 1 is within a step
+STEPS = 10 ** 7
+STEPS_ERROR = 1.0
+
+# (length, resolution) checked, and the spiral points compared for each
+CASES = ((1, 100), (3, 1000), (100, 1000))
+POINTS = 11
+
+# values scored in a chunk by the step sum
+_CHUNK = 1 << 20
+
+# spiral properties of the tolerance checks: the add-on defaults, with the
+# (spiral type, overrides) and the tolerances checked
+SPIRAL_DEFAULTS = dict(
+    spiral_type='ARCH', curve_type='POLY', spiral_direction='COUNTER_CLOCKWISE',
+    sampling='TOLERANCE', tolerance=0.001, fit_error=0.001, turns=1, steps=24,
+    radius=1.0, dif_z=0.0, dif_radius=0.0, B_force=1.0, inner_radius=0.2,
+    dif_inner_radius=0.0, cycles=1.0, curves_number=1, touch=False, iRadius=0.1,
+    eRadius=1.0, slope=11.11, length=100, resolution=1000, epsilon=100, scale=1.0)
+TOLERANCE_CASES = (
+    ('ARCH', dict(turns=5, steps=64, dif_radius=0.5)),
+    ('LOG', dict(turns=6, steps=64, B_force=1.15)),
+    ('SPHERE', dict(turns=10, steps=64)),
+    ('TORUS', dict(turns=4, steps=64, cycles=2.0)),
+    ('EXO', dict(turns=11, steps=101)),
+    ('CORNU', dict(length=5)),
+)
+TOLERANCES = (1e-2, 1e-3, 1e-4)
+# curve points compared with each chord
+CHORD_POINTS = 64
+
+
+def stub_blender():
+    """
+    Install stand-ins for the Blender modules add_curve_spirals imports, so
+    that its kernels can be run outside of Blender.
+    """
+    def module(name, **attributes):
+        stub = sys.modules[name] = ModuleType(name)
+        stub.__dict__.update(attributes)
+        return stub
+
+    def prop(**options):
+        return None
+
+    class Operator:
+        pass
+
+    class Menu:
+        draw_preset = None
+
+    class AddPresetBase:
+        pass
+
+    types = module("bpy.types", Operator=Operator, Menu=Menu)
+    props = module("bpy.props", EnumProperty=prop, BoolProperty=prop,
+                   FloatProperty=prop, IntProperty=prop)
+    module("bpy", types=types, props=props)
+    module("bpy_extras")
+    module("bpy_extras.object_utils", object_data_add=None)
+    module("bl_operators")
+    module("bl_operators.presets", AddPresetBase=AddPresetBase)
+
+
+def load_spirals():
+    """
+    Return the add_curve_spirals module next to this script, with the
+    Blender modules stubbed when they are not available.
+    """
+    if importlib.util.find_spec("bpy") is None:
+        stub_blender()
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "add_curve_spirals.py")
+    spec = importlib.util.spec_from_file_location("add_curve_spirals", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def step_sum(length, resolution, scale, epsilon, k):
+    """
+    Return the (x, y) of the points *k* of the Cornu spiral integrated as
+    the add-on did before the Fresnel integrals: an *epsilon* step sum from
+    0 for each point.
+    """
+    x = np.zeros(len(k))
+    y = np.zeros(len(k))
+    for i, n in enumerate(k):
+        l = length * n / resolution
+        du = l / epsilon
+        for start in range(0, epsilon, _CHUNK):
+            u = l * np.arange(start, min(start + _CHUNK, epsilon)) / epsilon
+            x[i] += np.cos(np.pi * u * u / 2).sum() * du
+            y[i] += np.sin(np.pi * u * u / 2).sum() * du
+    return x * scale, y * scale
+
+
+def check_cornu(spirals, length, resolution, scale=1.0, epsilon=100):
+    """
+    Compare the Cornu spiral of the add-on with the step sum at STEPS steps
+    and at *epsilon* steps. Returns the largest distances to the reference
+    as (fresnel, epsilon step sum), asserting that the first one is within
+    the error of the reference.
+    """
+    props = SimpleNamespace(length=length, resolution=resolution, scale=scale)
+    k = np.unique(np.linspace(0, resolution - 1, POINTS).astype(int))
+
+    x, y, z = spirals.cornu_curve(props, k)
+    rx, ry = step_sum(length, resolution, scale, STEPS, k)
+    ex, ey = step_sum(length, resolution, scale, epsilon, k)
+
+    error = np.hypot(x - rx, y - ry).max()
+    previous = np.hypot(ex - rx, ey - ry).max()
+    tolerance = STEPS_ERROR * scale * length / STEPS
+    assert error <= tolerance, (length, resolution, error, tolerance)
+    assert error <= previous, (length, resolution, error, previous)
+    return error, previous
+
+
+def chord_deviation(spirals, props):
+    """
+    Return the sample count of the spiral *props* sampled by tolerance, and
+    the largest distance of the curve to its chords.
+    """
+    curve, count = spirals.CURVES[props.spiral_type]
+    k = spirals.tolerance_samples(props, curve, count(props))
+
+    def evaluate(k):
+        return np.column_stack(np.broadcast_arrays(*curve(props, k, np.float64)))
+
+    u = np.linspace(0.0, 1.0, CHORD_POINTS + 1)[1:-1]
+    samples = evaluate(k)[:, None]
+    start = samples[:-1]
+    chord = samples[1:] - start
+    points = evaluate((k[:-1, None] + np.diff(k)[:, None] * u).ravel()).reshape(len(k) - 1, len(u), 3)
+    t = np.einsum('ijk,ijk->ij', points - start, chord) / \
+        np.maximum(np.einsum('ijk,ijk->ij', chord, chord), np.finfo(float).tiny)
+    offsets = points - (start + np.clip(t, 0.0, 1.0)[..., None] * chord)
+    return len(k), np.sqrt(np.einsum('ijk,ijk->ij', offsets, offsets)).max()
+
+
+def check_tolerance(spirals, spiral_type, tolerance, **values):
+    """
+    Assert that the spiral sampled by *tolerance* stays within it of its
+    chords, returning (sample count, deviation / tolerance).
+    """
+    props = SimpleNamespace(**dict(SPIRAL_DEFAULTS, spiral_type=spiral_type,
+                                   tolerance=tolerance, **values))
+    samples, deviation = chord_deviation(spirals, props)
+    assert deviation <= tolerance, (spiral_type, tolerance, deviation)
+    return samples, deviation / tolerance
+
+
+if __name__ == '__main__':
+    spirals = load_spirals()
+    for spiral_type, values in TOLERANCE_CASES:
+        for tolerance in TOLERANCES:
+            samples, ratio = check_tolerance(spirals, spiral_type, tolerance, **values)
+            print("%s tolerance %.0e: %d samples, chords within %.2f of the tolerance" %
+                  (spiral_type, tolerance, samples, ratio))
+    for length, resolution in CASES:
+        error, previous = check_cornu(spirals, length, resolution)
+        print("L %d N %d: fresnel within %.2e, epsilon step sum within %.2e "
+              "(reference within %.0e)" %
+              (length, resolution, error, previous, STEPS_ERROR * length / STEPS))